@@ -0,0 +1,70 @@
+# Allocation benchmark for the I2CBuilder read path.
+#
+# Run with `python -m benchmarks.alloc`. Every scenario is warmed up and then
+# measured with tracemalloc against an empty loop, so the numbers are the
+# bytes retained after (and held at peak during) the steady-state reads.
+import itertools
+import tracemalloc
+
+from ips2200 import I2CBuilder, Constants
+
+ITERATIONS = 10000
+
+
+class StaticBus():
+    # A bus that answers every read with the same (non-small-int) value and
+    # allocates nothing itself.
+    def write_readinto(self, out_buffer, in_buffer):
+        in_buffer[0] = 0x64
+        in_buffer[1] = 0x7f
+
+    def write(self, addr, parts):
+        pass
+
+
+def _noop():
+    pass
+
+
+def _trace(fn, iterations):
+    for _ in itertools.repeat(None, 100):
+        fn()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    for _ in itertools.repeat(None, iterations):
+        fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (current - start, peak - start)
+
+
+def measure(fn, iterations=ITERATIONS):
+    # Return (retained bytes, transient peak bytes) for calling fn
+    # iterations times, net of the measuring loop itself.
+    base_retained, base_peak = _trace(_noop, iterations)
+    retained, peak = _trace(fn, iterations)
+    return (retained - base_retained, max(0, peak - base_peak))
+
+
+def scenarios():
+    bus = StaticBus()
+    builder = I2CBuilder(0x18, bus)
+    builder.poll(Constants.RegAddrSystemConfig1)
+    config = Constants.RegAddrSystemConfig1
+    status = Constants.RegAddrInterruptState1
+    return [
+        ('poll cached config', lambda: builder.poll(config)),
+        ('poll volatile status', lambda: builder.poll(status)),
+    ]
+
+
+def main():
+    for name, fn in scenarios():
+        retained, peak = measure(fn)
+        print(name.ljust(24), 'retained:', str(retained).rjust(6), 'B',
+              ' transient:', str(peak).rjust(6), 'B')
+
+
+if __name__ == '__main__':
+    main()
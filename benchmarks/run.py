@@ -0,0 +1,208 @@
+# Driver benchmark suite.
+#
+# Run with `make bench` or `python -m benchmarks.run [--output FILE]
+# [--compare FILE]`. Every workload drives I2CBuilder against the simulated
+# bus and reports the bus transactions, bytes on the wire and modelled bus
+# time of one run, plus the Python CPU time per run averaged over several
+# repetitions. Results are written as JSON so runs from different commits
+# can be compared with --compare.
+import argparse
+import json
+import platform
+import sys
+import time
+
+from ips2200 import I2CBuilder, Constants, NVM_PROGRAM_TIME, REGISTERS
+from ips2200.fleet import Fleet
+from ips2200.simulator import (IPS2200Simulator, SimulatedI2C, TimingModel,
+                               BUS_100KHZ)
+
+REPEAT = 50
+POLL_COUNT = 100
+DEVICE_ADDRESSES = (0x18, 0x19, 0x1a, 0x1b)
+
+
+# Every configuration field except the I2C address, which would move the
+# simulated devices to new bus addresses
+PROFILE = {
+    'output_mode': Constants.OutputModeQuadABN,
+    'spi_data_order': Constants.SpiDataOrderMsb,
+    'spi_mode': Constants.SpiModePhaseRisingFalling,
+    'system_protocol': Constants.SystemProtocolI2CInterruptAddress,
+    'quad_mode_xor': Constants.QuadModeDoublePulse,
+    'output_interrupt_enable': Constants.On,
+    'cyber_security': Constants.CyberSecurityRW,
+    'quad_mode': Constants.On,
+    'tx_charge_pump_enable': Constants.On,
+    'tx_amplitude_control': Constants.On,
+    'protocol_integrity_check': Constants.On,
+    'supply_voltage': Constants.Off,
+}
+
+
+def _set_profile(builder):
+    for name, value in PROFILE.items():
+        builder.set_field(name, value)
+    return builder
+
+
+def _provision(bus):
+    # Store PROFILE in the NVM of every simulated device without using the bus
+    for device in bus.devices:
+        for name, value in PROFILE.items():
+            field = REGISTERS.field(name)
+            device.poke(field.addr, field.insert(device.peek(field.addr),
+                                                 value))
+
+
+def single_field(bus):
+    builder = I2CBuilder(0x18, bus)
+    builder.set_output_mode(Constants.OutputModeQuadABN).execute()
+
+
+def full_profile(bus):
+    _set_profile(I2CBuilder(0x18, bus)).execute()
+
+
+def full_profile_nvm(bus):
+    _set_profile(I2CBuilder(0x18, bus).use_nvm()).execute()
+
+
+def reprovision_nvm(bus):
+    # Re-apply the profile to a device whose NVM already holds it
+    _provision(bus)
+    I2CBuilder(0x18, bus).use_nvm().apply_profile(PROFILE)
+
+
+def register_dump(bus):
+    builder = I2CBuilder(0x18, bus)
+    builder.use_nvm().read_block(0x00, 0x14)
+    builder.use_srb().read_block(0x00, 0x1b)
+    builder.execute()
+
+
+def polling(bus):
+    builder = I2CBuilder(0x18, bus)
+    builder.read_register(Constants.RegAddrInterruptState1)
+    builder.read_register(Constants.RegAddrInterruptState2)
+    builder.read_register(Constants.RegAddrTXCounterState)
+    plan = builder.prepare()
+    for _ in range(POLL_COUNT):
+        builder.run(plan)
+
+
+def multi_device(bus):
+    fleet = Fleet([(bus, addr) for addr in DEVICE_ADDRESSES])
+    report = fleet.run(lambda builder: _set_profile(builder).execute())
+    if (not report.ok):
+        raise report.errors()[0].error
+
+
+def multi_device_nvm(bus):
+    # Program every device's NVM, interleaving devices while one is busy
+    fleet = Fleet([(bus, addr) for addr in DEVICE_ADDRESSES],
+                  nvm_program_time=NVM_PROGRAM_TIME)
+    builder = _set_profile(I2CBuilder(DEVICE_ADDRESSES[0]).use_nvm())
+    builder.write_register(Constants.RegAddrTXCurrentCalib, 0xbe)
+    report = fleet.run(builder.prepare())
+    if (not report.ok):
+        raise report.errors()[0].error
+
+
+WORKLOADS = [
+    ('single_field', single_field, 1),
+    ('full_profile', full_profile, 1),
+    ('full_profile_nvm', full_profile_nvm, 1),
+    ('reprovision_nvm', reprovision_nvm, 1),
+    ('register_dump', register_dump, 1),
+    ('polling', polling, 1),
+    ('multi_device', multi_device, len(DEVICE_ADDRESSES)),
+    ('multi_device_nvm', multi_device_nvm, len(DEVICE_ADDRESSES)),
+]
+
+
+def _bus(devices, frequency):
+    return SimulatedI2C([IPS2200Simulator(addr)
+                         for addr in DEVICE_ADDRESSES[:devices]],
+                        timing=TimingModel(frequency))
+
+
+def measure(workload, devices=1, frequency=BUS_100KHZ, repeat=REPEAT):
+    # Return the bus counters of one run and the CPU time per run
+    bus = _bus(devices, frequency)
+    workload(bus)
+    result = {
+        'transactions': bus.transactions,
+        'reads': bus.reads,
+        'writes': bus.writes,
+        'bytes': bus.bytes_read + bus.bytes_written,
+        'bus_time_s': bus.bus_time,
+        'nvm_wait_s': bus.wait_time,
+    }
+
+    buses = [_bus(devices, frequency) for _ in range(repeat)]
+    start = time.process_time()
+    for bus in buses:
+        workload(bus)
+    result['cpu_time_s'] = (time.process_time() - start) / repeat
+    return result
+
+
+def run(frequency=BUS_100KHZ, repeat=REPEAT):
+    return {
+        'python': platform.python_version(),
+        'frequency_hz': frequency,
+        'repeat': repeat,
+        'workloads': {name: measure(workload, devices, frequency, repeat)
+                      for name, workload, devices in WORKLOADS},
+    }
+
+
+def _format_row(name, values):
+    return (name.ljust(18) +
+            str(values['transactions']).rjust(8) +
+            str(values['bytes']).rjust(8) +
+            format(values['bus_time_s'] * 1000, '.3f').rjust(12) +
+            format(values['cpu_time_s'] * 1000, '.3f').rjust(12) +
+            format(values['nvm_wait_s'] * 1000, '.3f').rjust(14))
+
+
+def report(results, baseline=None, out=sys.stdout):
+    out.write('workload'.ljust(18) + 'txns'.rjust(8) + 'bytes'.rjust(8) +
+              'bus ms'.rjust(12) + 'cpu ms'.rjust(12) +
+              'nvm wait ms'.rjust(14) + '\n')
+    for name, values in results['workloads'].items():
+        out.write(_format_row(name, values) + '\n')
+        previous = (baseline or {}).get('workloads', {}).get(name)
+        if (previous is None):
+            continue
+        deltas = []
+        for key in ('transactions', 'bytes', 'bus_time_s', 'cpu_time_s'):
+            if (previous[key]):
+                deltas.append(key + ' ' +
+                              format(values[key] / previous[key], '.2f') + 'x')
+        out.write('  vs baseline: ' + ', '.join(deltas) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='IPS2200 driver benchmarks')
+    parser.add_argument('--output', help='write results as JSON to a file')
+    parser.add_argument('--compare', help='JSON results to compare against')
+    parser.add_argument('--frequency', type=int, default=BUS_100KHZ)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    args = parser.parse_args(argv)
+
+    results = run(args.frequency, args.repeat)
+    baseline = None
+    if (args.compare):
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if (args.output):
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,28 @@
+import time
+from array import array
 
 DEFAULT_DEVICE_ADDRESS = 0x18
 
+# Time a device stays busy after an NVM write, in seconds. This is a
+# conservative EEPROM-class default; configure it for the part being used.
+NVM_PROGRAM_TIME = 0.010
+
+# Replay rounds of I2CBuilder.execute_verified() after the first pass, and
+# the delay before the first replay. The delay doubles on every further round.
+VERIFY_RETRIES = 3
+VERIFY_BACKOFF = 0.005
+
+# Cache policies for I2CBuilder register writes.
+#
+# Invalidate: drop the shadowed value so the next read goes to the bus.
+# Write-through: write to the bus and keep the written value shadowed.
+# Write-back: only shadow the value and mark it dirty; dirty registers are
+# written to the bus once at the end of execute() or on flush().
+CACHE_INVALIDATE = 'invalidate'
+CACHE_WRITE_THROUGH = 'write-through'
+CACHE_WRITE_BACK = 'write-back'
+_CACHE_POLICIES = (CACHE_INVALIDATE, CACHE_WRITE_THROUGH, CACHE_WRITE_BACK)
+
 
 class Constants():
     # Register Base Addresses
@@ -15,9 +37,19 @@ class Constants():
     RegAddrTXFreqLowerLimit = 0x09
     RegAddrTXFreqUpperLimit = 0x0a
     RegAddrInterrupt1Enable = 0x0b
-    RegAddrInterrupt2Enable = 0x0b
+    RegAddrInterrupt2Enable = 0x0c
     RegAddrIRQNWatchdog1 = 0x0d
     RegAddrIRQNWatchdog2 = 0x0e
+    RegAddrR1FineGain = 0x12
+    RegAddrR2FineGain = 0x13
+
+    # Special Function Registers (SFR) only exist in the SRB/SFR space
+    RegAddrInterruptClear1 = 0x34
+    RegAddrInterruptClear2 = 0x35
+    RegAddrInterruptState1 = 0x36
+    RegAddrInterruptState2 = 0x37
+    RegAddrTXCounterState = 0x38
+    RegAddrNVMEccFailState = 0x3a
 
     # Parameters and tuples for IPS2200 configuration settings.
     #
@@ -74,6 +106,38 @@ class Constants():
     _ProtocolIntegrityCheck = (RegAddrSystemConfig2, 2, 2)
     _SupplyVoltage = (RegAddrSystemConfig2, 0, 0)
 
+    # One 4 bit gain per receiver coil, R1 in the low bits (0x056 after
+    # reset: R2 0x5, R1 0x6). Bits 8-10 are not used.
+    _R1Gain = (RegAddrR1R2Gain, 0, 3)
+    _R2Gain = (RegAddrR1R2Gain, 4, 7)
+
+    # Registers holding a single 11 bit value (offsets, calibration codes,
+    # limits, fine gains and counters) are one field that covers all data
+    # bits. So are System Configuration 3 and the IRQN watchdogs, whose bit
+    # layout is not transcribed here, and the interrupt clear masks, which
+    # are only ever written whole. The interrupt enable and state registers
+    # hold one flag per interrupt source, bit for bit alike, and are split
+    # into one field per bit (see _flags).
+    _SystemConfig3 = (RegAddrSystemConfig3, 0, 10)
+    _R2CoilOffset = (RegAddrR2CoilOffset, 0, 10)
+    _R1CoilOffset = (RegAddrR1CoilOffset, 0, 10)
+    _TXCurrentCalib = (RegAddrTXCurrentCalib, 0, 10)
+    _TXFreqCalib = (RegAddrTXFreqCalib, 0, 10)
+    _TXFreqLowerLimit = (RegAddrTXFreqLowerLimit, 0, 10)
+    _TXFreqUpperLimit = (RegAddrTXFreqUpperLimit, 0, 10)
+    _Interrupt1Enable = (RegAddrInterrupt1Enable, 0, 10)
+    _Interrupt2Enable = (RegAddrInterrupt2Enable, 0, 10)
+    _IRQNWatchdog1 = (RegAddrIRQNWatchdog1, 0, 10)
+    _IRQNWatchdog2 = (RegAddrIRQNWatchdog2, 0, 10)
+    _R1FineGain = (RegAddrR1FineGain, 0, 10)
+    _R2FineGain = (RegAddrR2FineGain, 0, 10)
+    _InterruptClear1 = (RegAddrInterruptClear1, 0, 10)
+    _InterruptClear2 = (RegAddrInterruptClear2, 0, 10)
+    _InterruptState1 = (RegAddrInterruptState1, 0, 10)
+    _InterruptState2 = (RegAddrInterruptState2, 0, 10)
+    _TXCounterState = (RegAddrTXCounterState, 0, 10)
+    _NVMEccFailState = (RegAddrNVMEccFailState, 0, 10)
+
 
 def print_value(label, value):
     print('-------------------')
@@ -156,74 +220,1051 @@ def set_bit(data, value, index):
     return data
 
 
+class ShadowRegisters():
+    # A fixed-size shadow of the device register file.
+    #
+    # Values are stored in a preallocated array indexed directly by the 8 bit
+    # wire address (so NVM and SRB/SFR copies of a register live in separate
+    # slots), with valid and dirty state tracked in two 256 bit bitmaps. None
+    # of the accessors allocate, which keeps polling loops free of garbage.
+    # Values are kept in a list rather than an array('H') so that reading
+    # one back returns the stored int instead of boxing a new one.
+    #
+    # Every set() and invalidate() advances the generation of the address.
+    # A read takes the generation before its bus transfer and hands it to
+    # store(), which drops the value if the register was written or
+    # invalidated meanwhile, so a read racing a write never shadows the old
+    # value. Shadows shared between threads take a lock that makes the
+    # check and the store one step.
+    SIZE = 0x100
+
+    def __init__(self, lock=None):
+        self._values = [0] * self.SIZE
+        self._stamps = array('d', bytes(8 * self.SIZE))
+        self._valid = bytearray(self.SIZE >> 3)
+        self._dirty = bytearray(self.SIZE >> 3)
+        self._generations = [0] * self.SIZE
+        self._lock = lock
+
+    def is_valid(self, addr):
+        return self._valid[addr >> 3] & (1 << (addr & 0b111)) != 0
+
+    def is_dirty(self, addr):
+        return self._dirty[addr >> 3] & (1 << (addr & 0b111)) != 0
+
+    def get(self, addr):
+        # Return the shadowed value or None if the address is not valid
+        if (self._valid[addr >> 3] & (1 << (addr & 0b111)) == 0):
+            return None
+        return self._values[addr]
+
+    def generation(self, addr):
+        return self._generations[addr]
+
+    def store(self, addr, value, generation):
+        # Store a value read from the device, unless the address changed
+        # since generation was taken. Returns True when it was stored.
+        if (self._lock is None):
+            return self._store(addr, value, generation)
+        with self._lock:
+            return self._store(addr, value, generation)
+
+    def _store(self, addr, value, generation):
+        if (self._generations[addr] != generation):
+            return False
+        self._set(addr, value, False)
+        return True
+
+    def set(self, addr, value, dirty=False):
+        # Store a value and mark it valid (and optionally dirty)
+        if (self._lock is None):
+            self._set(addr, value, dirty)
+            return
+        with self._lock:
+            self._set(addr, value, dirty)
+
+    def _set(self, addr, value, dirty):
+        self._generations[addr] += 1
+        self._values[addr] = value
+        bit = 1 << (addr & 0b111)
+        self._valid[addr >> 3] |= bit
+        if (dirty):
+            self._dirty[addr >> 3] |= bit
+        else:
+            self._dirty[addr >> 3] &= ~bit
+
+    def stamp(self, addr, when):
+        # Record when the value at addr was read, for time limited entries
+        self._stamps[addr] = when
+
+    def stamped(self, addr):
+        return self._stamps[addr]
+
+    def mark_clean(self, addr):
+        self._dirty[addr >> 3] &= ~(1 << (addr & 0b111))
+
+    def invalidate(self, addr=None):
+        # Forget one address, or every address when none is provided
+        if (self._lock is None):
+            self._invalidate(addr)
+            return
+        with self._lock:
+            self._invalidate(addr)
+
+    def _invalidate(self, addr):
+        if (addr is None):
+            for i in range(len(self._valid)):
+                self._valid[i] = 0
+                self._dirty[i] = 0
+            for i in range(self.SIZE):
+                self._generations[i] += 1
+            return
+        self._generations[addr] += 1
+        bit = ~(1 << (addr & 0b111))
+        self._valid[addr >> 3] &= bit
+        self._dirty[addr >> 3] &= bit
+
+    def registers(self, use_nvm=False):
+        # Return {documented address: value} for the valid entries of one
+        # space (NVM, or SRB/SFR), e.g. for decode_config()
+        space = 0b11000000 if use_nvm else 0b11100000
+        values = {}
+        for addr, value in self.snapshot().items():
+            if (addr & 0b11100000 != space):
+                continue
+            # SFRs keep their documented 0x34+ address, configuration
+            # registers are reported at their 0x00 - 0x13 base address
+            addr = addr & 0x3f
+            values[addr if addr >= 0x34 else addr & 0x1f] = value
+        return values
+
+    def valid_addresses(self):
+        return [addr for addr in range(self.SIZE) if self.is_valid(addr)]
+
+    def dirty_addresses(self):
+        return [addr for addr in range(self.SIZE) if self.is_dirty(addr)]
+
+    def snapshot(self):
+        # Return a {wire address: value} dict of every valid entry
+        return {addr: self._values[addr] for addr in self.valid_addresses()}
+
+    def diff(self, other):
+        # Compare against another ShadowRegisters or a snapshot dict and
+        # return {wire address: (other value, own value)} for every address
+        # whose value differs. Addresses missing on one side are reported
+        # with None for that side.
+        if (isinstance(other, ShadowRegisters)):
+            other = other.snapshot()
+        changes = {}
+        for addr in range(self.SIZE):
+            mine = self.get(addr)
+            theirs = other.get(addr)
+            if (mine != theirs):
+                changes[addr] = (theirs, mine)
+        return changes
+
+
+# Every register holds 11 data bits
+REGISTER_MASK = 0x7ff
+
+
+class Field():
+    # A named bit field within a register.
+    #
+    # The mask and shift are computed once, so encoding or decoding a value
+    # is a single mask and shift. config is one of the (addr, start, end)
+    # tuples from Constants, with start and end inclusive.
+    def __init__(self, name, config):
+        self.name = name
+        self.addr = config[0]
+        self.start = config[1]
+        self.end = config[2]
+        self.width = self.end - self.start + 1
+        self.shift = self.start
+        self.max = (1 << self.width) - 1
+        self.mask = self.max << self.shift
+
+    def __repr__(self):
+        return ('Field(' + self.name + ', 0x' + format(self.addr, 'x') +
+                ', bits ' + str(self.start) + '-' + str(self.end) + ')')
+
+    def validate(self, value):
+        if (not 0 <= value <= self.max):
+            raise ValueError('Value 0x' + format(value, 'x') + ' is out of ' +
+                             'range for ' + self.name + ' (0x0 - 0x' +
+                             format(self.max, 'x') + ')')
+        return value
+
+    def encode(self, value):
+        # Return the validated value shifted into position
+        return self.validate(value) << self.shift
+
+    def decode(self, register_value):
+        # Return this field's value from a whole register value
+        return (register_value & self.mask) >> self.shift
+
+    def insert(self, register_value, value):
+        # Return register_value with this field replaced by value
+        return (register_value & ~self.mask) | self.encode(value)
+
+
+# Register access flags used by RegisterMap
+REG_CACHEABLE = 0b0001
+REG_VOLATILE = 0b0010
+REG_READ_ONLY = 0b0100
+REG_WRITE_ONLY = 0b1000
+REG_EXPIRES = 0b10000
+
+
+class Register():
+    # Metadata for a single documented register.
+    #
+    # Configuration registers (0x00 - 0x13) exist in both the NVM and SRB
+    # spaces, special function registers (0x34 - 0x3a) only in SRB/SFR.
+    # Volatile registers change underneath the driver and are never cached,
+    # a ttl (in seconds) lets a cacheable register expire, and None caches it
+    # until it is written or invalidated.
+    def __init__(self, name, addr, cacheable=True, volatile=False,
+                 read_only=False, write_only=False, ttl=None, fields=()):
+        self.name = name
+        self.addr = addr
+        self.fields = tuple(fields)
+        self.volatile = volatile
+        self.cacheable = cacheable and not volatile and not write_only
+        self.read_only = read_only
+        self.write_only = write_only
+        self.ttl = ttl
+
+    @property
+    def flags(self):
+        flags = 0
+        if (self.cacheable):
+            flags |= REG_CACHEABLE
+        if (self.volatile):
+            flags |= REG_VOLATILE
+        if (self.read_only):
+            flags |= REG_READ_ONLY
+        if (self.write_only):
+            flags |= REG_WRITE_ONLY
+        if (self.cacheable and self.ttl):
+            flags |= REG_EXPIRES
+        return flags
+
+    def wire_addresses(self):
+        # Every wire address this register is reachable at
+        if (self.addr < 0x20):
+            return (to_address(self.addr, True), to_address(self.addr, False))
+        return (to_address(self.addr, False),)
+
+
+class RegisterMap():
+    # Per wire address register metadata.
+    #
+    # Flags and TTLs are flattened into arrays indexed by wire address so the
+    # builder can look them up on every transaction without hashing.
+    # Addresses that have not been described are treated as plain cacheable
+    # registers. Fields are indexed by name across the whole map.
+    def __init__(self, registers=()):
+        self._flags = bytearray([REG_CACHEABLE] * 0x100)
+        self._ttl = array('d', bytes(8 * 0x100))
+        self._registers = {}
+        self._fields = {}
+        for register in registers:
+            self.add(register)
+
+    def add(self, register):
+        for field in register.fields:
+            if (field.name in self._fields):
+                raise ValueError('Duplicate field name ' + field.name)
+            if (field.addr != register.addr):
+                raise ValueError('Field ' + field.name + ' does not belong ' +
+                                 'to register ' + register.name)
+            self._fields[field.name] = field
+        self._registers[register.addr] = register
+        for wire in register.wire_addresses():
+            self._flags[wire] = register.flags
+            self._ttl[wire] = register.ttl or 0.0
+        return self
+
+    def field(self, name):
+        # Return the Field with the provided name
+        field = self._fields.get(name)
+        if (field is None):
+            raise KeyError('Unknown field ' + repr(name))
+        return field
+
+    def fields(self):
+        # Every field, ordered by register address and then bit position
+        return sorted(self._fields.values(),
+                      key=lambda field: (field.addr, -field.start))
+
+    def get(self, addr):
+        # Return the Register for a documented address, or None
+        return self._registers.get(addr)
+
+    def lookup(self, wire):
+        # Return the Register for a wire address, or None
+        addr = from_address(wire)
+        register = self._registers.get(addr)
+        if (register is None and addr >= 0x20):
+            # SRB copy of a configuration register
+            register = self._registers.get(addr - 0x20)
+        return register
+
+    def registers(self):
+        return [self._registers[addr] for addr in sorted(self._registers)]
+
+    def flags(self, wire):
+        return self._flags[wire]
+
+    def ttl(self, wire):
+        return self._ttl[wire]
+
+
+def _whole(name, config, **options):
+    # A register exposed as a single field of the same name
+    return Register(name, config[0], fields=[Field(name, config)], **options)
+
+
+def _flags(name, config, **options):
+    # A register of one flag per interrupt source, exposed as one field per
+    # bit named name_0 up to name_10
+    addr, start, end = config
+    return Register(name, addr, fields=[
+        Field(name + '_' + str(bit), (addr, bit, bit))
+        for bit in range(start, end + 1)], **options)
+
+
+REGISTERS = RegisterMap([
+    Register('system_config_1', Constants.RegAddrSystemConfig1, fields=[
+        Field('spi_data_order', Constants._SpiDataOrder),
+        Field('spi_mode', Constants._SpiMode),
+        Field('i2c_address', Constants._I2CAddress),
+        Field('output_mode', Constants._OutputMode),
+        Field('system_protocol', Constants._SystemProtocol),
+    ]),
+    Register('system_config_2', Constants.RegAddrSystemConfig2, fields=[
+        Field('quad_mode_xor', Constants._QuadModeXor),
+        Field('output_interrupt_enable', Constants._OutputInterruptEnable),
+        Field('cyber_security', Constants._CyberSecurity),
+        Field('quad_mode', Constants._QuadMode),
+        Field('tx_charge_pump_enable', Constants._TXChargePumpEnable),
+        Field('tx_amplitude_control', Constants._TXAmplitudeCtrl),
+        Field('protocol_integrity_check', Constants._ProtocolIntegrityCheck),
+        Field('supply_voltage', Constants._SupplyVoltage),
+    ]),
+    Register('r1_r2_gain', Constants.RegAddrR1R2Gain, fields=[
+        Field('r2_gain', Constants._R2Gain),
+        Field('r1_gain', Constants._R1Gain),
+    ]),
+    _whole('system_config_3', Constants._SystemConfig3),
+    _whole('r2_coil_offset', Constants._R2CoilOffset),
+    _whole('r1_coil_offset', Constants._R1CoilOffset),
+    _whole('tx_current_calib', Constants._TXCurrentCalib),
+    _whole('tx_freq_calib', Constants._TXFreqCalib),
+    _whole('tx_freq_lower_limit', Constants._TXFreqLowerLimit),
+    _whole('tx_freq_upper_limit', Constants._TXFreqUpperLimit),
+    _flags('interrupt_1_enable', Constants._Interrupt1Enable),
+    _flags('interrupt_2_enable', Constants._Interrupt2Enable),
+    _whole('irqn_watchdog_1', Constants._IRQNWatchdog1),
+    _whole('irqn_watchdog_2', Constants._IRQNWatchdog2),
+    _whole('r1_fine_gain', Constants._R1FineGain),
+    _whole('r2_fine_gain', Constants._R2FineGain),
+    _whole('interrupt_clear_1', Constants._InterruptClear1, write_only=True),
+    _whole('interrupt_clear_2', Constants._InterruptClear2, write_only=True),
+    _flags('interrupt_state_1', Constants._InterruptState1, volatile=True,
+           read_only=True),
+    _flags('interrupt_state_2', Constants._InterruptState2, volatile=True,
+           read_only=True),
+    _whole('tx_counter_state', Constants._TXCounterState, volatile=True,
+           read_only=True),
+    _whole('nvm_ecc_fail_state', Constants._NVMEccFailState, volatile=True,
+           read_only=True),
+])
+
+
+# Directions reported in bus transaction events and Plan.transactions()
+READ = 'read'
+WRITE = 'write'
+
+
+class BusEvent():
+    # A single bus transaction (or cache hit) reported to observers.
+    #
+    # addr is the wire address, size the number of data bytes transferred
+    # (zero for cache hits), duration the wall time in seconds and error the
+    # exception raised by the bus, if any. device_address is None for writes
+    # seen by a shared bus, since the write path carries no device address.
+    # count is the number of registers the transaction covers, from addr
+    # up: every register is 2 bytes on the wire, so a block read of n
+    # registers reports count n, and everything else count 1.
+    __slots__ = ('device_address', 'addr', 'direction', 'size', 'cache_hit',
+                 'duration', 'error', 'count')
+
+    def __init__(self, device_address, addr, direction, size, cache_hit=False,
+                 duration=0.0, error=None):
+        self.device_address = device_address
+        self.addr = addr
+        self.direction = direction
+        self.size = size
+        self.cache_hit = cache_hit
+        self.duration = duration
+        self.error = error
+        self.count = (size >> 1) or 1
+
+    def __repr__(self):
+        device = 'None' if self.device_address is None else \
+            '0x' + format(self.device_address, 'x')
+        return ('BusEvent(' + device + ', 0x' +
+                format(self.addr, 'x') + ', ' + self.direction + ', ' +
+                str(self.size) + (', hit' if self.cache_hit else '') +
+                (', ' + repr(self.error) if self.error is not None else '') +
+                ')')
+
+
+# Operation kinds queued by I2CBuilder and the steps that execute() compiles
+# them into. Queued operations carry the wire address, so the NVM/SRB space
+# that was selected when the operation was queued is the one that is used.
+_OP_READ = 0
+_OP_WRITE = 1
+_OP_FIELD = 2
+_OP_UPDATE = 3
+_OP_READ_BLOCK = 4
+_OP_READ_FIELD = 5
+_OP_READ_CONFIG = 6
+_OP_APPLY = 7
+
+
+def _apply_mask(value, mask, bits):
+    # Replace the masked bits of a register value
+    return (value & ~mask) | bits
+
+
+def _collect(results, step, result):
+    # Add a step result to the execute results
+    if (result is None):
+        return
+    if (step[0] == _OP_READ_BLOCK):
+        results.extend(result)
+    else:
+        results.append(result)
+
+
+def _shape_results(results):
+    # execute() returns None, a single value or a list of values
+    result_count = len(results)
+    if (result_count == 0):
+        return None
+    elif (result_count == 1):
+        return results[0]
+    else:
+        return results
+
+
+def _step_wires(step):
+    # Every wire address a step or queued operation touches
+    kind = step[0]
+    if (kind == _OP_READ_BLOCK):
+        return range(step[1], step[1] + step[2])
+    elif (kind == _OP_READ_CONFIG):
+        return [start + i for start, count, _ in step[1]
+                for i in range(count)]
+    return (step[1],)
+
+
+def _flush_fields(steps, pending):
+    # Turn each group of pending field updates into a single
+    # read-modify-write step, or a plain write when the fields cover the
+    # whole register.
+    for wire, (mask, bits) in pending.items():
+        if (mask == REGISTER_MASK):
+            steps.append((_OP_WRITE, wire, bits))
+        else:
+            steps.append((_OP_UPDATE, wire, mask, bits))
+    pending.clear()
+
+
+def _read_span(step):
+    # Return (start, count) for read steps, None for anything else
+    if (step[0] == _OP_READ):
+        return (step[1], 1)
+    elif (step[0] == _OP_READ_BLOCK):
+        return (step[1], step[2])
+    return None
+
+
+def _merge_reads(steps):
+    # Merge runs of reads at consecutive wire addresses into block reads.
+    # Runs never cross a 32 register space boundary (NVM vs SRB/SFR).
+    merged = []
+    for step in steps:
+        span = _read_span(step)
+        last = _read_span(merged[-1]) if merged else None
+        if (span is not None and last is not None and
+                span[0] == last[0] + last[1] and
+                span[0] >> 5 == (span[0] + span[1] - 1) >> 5 == last[0] >> 5):
+            merged[-1] = (_OP_READ_BLOCK, last[0], last[1] + span[1])
+            continue
+        merged.append(step)
+    return merged
+
+
+def _compile_operations(operations):
+    # Compile queued operations into the steps that will be sent to the bus.
+    #
+    # Field updates are grouped by wire address (which includes the NVM/SRB
+    # space bit) and applied to one shadow value, so every touched register
+    # costs one read and one write no matter how many of its fields were set.
+    # Explicit reads and writes act as barriers: pending field updates are
+    # flushed before them so the bus sees the same ordering as the queue.
+    # Reads of consecutive registers are merged into block reads.
+    steps = []
+    pending = {}
+    for op in operations:
+        if (op[0] == _OP_FIELD):
+            # Later fields win where they overlap earlier ones
+            mask, bits = pending.get(op[1], (0, 0))
+            pending[op[1]] = (mask | op[2], _apply_mask(bits, op[2], op[3]))
+            continue
+
+        _flush_fields(steps, pending)
+        steps.append(op)
+
+    _flush_fields(steps, pending)
+    return _merge_reads(steps)
+
+
+class Plan():
+    # An immutable, compiled sequence of bus steps.
+    #
+    # Plans are produced by I2CBuilder.prepare() and can be run any number
+    # of times, by any builder (i.e. against any bus and device address),
+    # without rebuilding the queued operations. Each builder keeps its own
+    # shadow registers, so run the plan through one builder per device.
+    def __init__(self, operations):
+        self._steps = tuple(_compile_operations(operations))
+
+    def __len__(self):
+        return len(self._steps)
+
+    @property
+    def steps(self):
+        return self._steps
+
+    def transactions(self, auto_increment=True):
+        # Return the bus transactions this plan issues against an empty
+        # cache as ('read' | 'write', wire address, byte count) tuples.
+        transactions = []
+        for step in self._steps:
+            kind = step[0]
+            if (kind == _OP_READ):
+                transactions.append((READ, step[1], 2))
+            elif (kind == _OP_READ_BLOCK and auto_increment):
+                transactions.append((READ, step[1], 2 * step[2]))
+            elif (kind == _OP_READ_BLOCK):
+                for addr in range(step[1], step[1] + step[2]):
+                    transactions.append((READ, addr, 2))
+            elif (kind == _OP_WRITE):
+                transactions.append((WRITE, step[1], 2))
+            elif (kind == _OP_UPDATE):
+                transactions.append((READ, step[1], 2))
+                transactions.append((WRITE, step[1], 2))
+            elif (kind == _OP_APPLY):
+                # The write is skipped when the register already matches
+                transactions.append((WRITE, step[1], 2))
+            elif (kind == _OP_READ_FIELD):
+                transactions.append((READ, step[1], 2))
+            elif (kind == _OP_READ_CONFIG and auto_increment):
+                for start, count, _ in step[1]:
+                    transactions.append((READ, start, 2 * count))
+            elif (kind == _OP_READ_CONFIG):
+                for start, count, _ in step[1]:
+                    for addr in range(start, start + count):
+                        transactions.append((READ, addr, 2))
+        return transactions
+
+    def run(self, builder, bus=None):
+        return builder.run(self, bus)
+
+
+class ProfileReport():
+    # Outcome of I2CBuilder.apply_profile().
+    #
+    # registers lists (documented address, old value, new value) for every
+    # register that was written and fields maps the name of every field that
+    # changed to (old value, new value). checked is the number of registers
+    # the profile touched.
+    def __init__(self, registers, fields, checked):
+        self.registers = registers
+        self.fields = fields
+        self.checked = checked
+
+    def __len__(self):
+        return len(self.registers)
+
+    @property
+    def changed(self):
+        return len(self.registers) > 0
+
+    def __repr__(self):
+        return ('ProfileReport(' + str(len(self.registers)) + ' of ' +
+                str(self.checked) + ' registers written, fields ' +
+                repr(sorted(self.fields)) + ')')
+
+
+class VerifyFailure():
+    # A register that could not be written and confirmed. expected is None
+    # when the operation never got as far as computing the value to write,
+    # actual is None when the register could not be read back.
+    def __init__(self, addr, expected=None, actual=None, error=None):
+        self.addr = addr
+        self.expected = expected
+        self.actual = actual
+        self.error = error
+
+    def __repr__(self):
+        def fmt(value):
+            return 'None' if value is None else '0x' + format(value, 'x')
+
+        return ('VerifyFailure(0x' + format(self.addr, '02x') +
+                ', expected ' + fmt(self.expected) + ', read ' +
+                fmt(self.actual) + ', ' + repr(self.error) + ')')
+
+
+class VerifyReport():
+    # Outcome of I2CBuilder.execute_verified(). results is what execute()
+    # would have returned, with None in place of reads that kept failing.
+    # failures has one VerifyFailure per register that is still wrong, by
+    # documented address (NVM 0x00 - 0x1f, SRB/SFR 0x20 - 0x3f).
+    def __init__(self, results, failures, replays):
+        self.results = results
+        self.failures = failures
+        self.replays = replays
+
+    @property
+    def ok(self):
+        return len(self.failures) == 0
+
+    def __repr__(self):
+        return ('VerifyReport(' + repr(self.results) + ', ' +
+                str(len(self.failures)) + ' failures after ' +
+                str(self.replays) + ' replays)')
+
+
 class I2CBuilder():
-    def __init__(self, device_address, bus=None):
+    def __init__(self, device_address, bus=None, cache_policy=CACHE_INVALIDATE,
+                 registers=REGISTERS, auto_increment=None, shadow=None,
+                 nvm_program_time=None):
         self._device_address = device_address
         self._use_nvm = False
         self._bus = bus
-        self._cache = {}
+        self._registers = registers
+        # None defers to the bus' own auto_increment attribute
+        self._auto_increment = auto_increment
+        # Transfer buffers are allocated once and reused by every read
+        self._out_buffer = bytearray((device_address, 0x00))
+        self._in_buffer = bytearray(2)
+        self._block_buffers = {}
+        self._cache_policy = None
+        self.set_cache_policy(cache_policy)
+        # Builders for the same device may share one shadow (see SharedBus)
+        self.shadow = shadow if shadow is not None else ShadowRegisters()
         self.operations = []
+        self._observers = []
+        # When set, the builder tracks the NVM program cycle started by every
+        # NVM write and holds the next transaction until it has finished
+        self._nvm_program_time = nvm_program_time
+        self._busy_until = 0.0
+
+    @property
+    def device_address(self):
+        return self._device_address
+
+    @property
+    def registers(self):
+        # The RegisterMap the builder encodes fields with
+        return self._registers
+
+    @property
+    def cache_policy(self):
+        return self._cache_policy
+
+    @property
+    def uses_nvm(self):
+        # True when operations address the NVM, False for the SRB/SFR space
+        return self._use_nvm
+
+    @property
+    def nvm_program_time(self):
+        # Seconds an NVM write keeps the device busy, or None when NVM program
+        # cycles are not tracked
+        return self._nvm_program_time
+
+    @property
+    def busy_until(self):
+        # Bus clock time until which the device is programming NVM, or 0.0
+        return self._busy_until
+
+    def _wait_ready(self, bus):
+        # Sleep out the rest of the NVM program cycle. Buses with their own
+        # notion of time (such as the simulator) provide monotonic() and
+        # sleep(), everything else uses the system clock.
+        remaining = self._busy_until - getattr(bus, 'monotonic',
+                                               time.monotonic)()
+        if (remaining > 0):
+            getattr(bus, 'sleep', time.sleep)(remaining)
+        self._busy_until = 0.0
+
+    def _nvm_written(self, bus, addr):
+        # Start tracking the program cycle of an NVM write
+        if (self._nvm_program_time is not None and addr & 0b100000 == 0):
+            self._busy_until = (getattr(bus, 'monotonic', time.monotonic)() +
+                                self._nvm_program_time)
+
+    def add_observer(self, observer):
+        # Call observer(event) with a BusEvent for every bus transaction and
+        # cache hit. Without observers the read path does no extra work.
+        self._observers.append(observer)
+        return self
 
-    def _update_cache(self, addr, value):
-        key = to_cache_key(addr)
-        self._cache.update({key: value})
+    def remove_observer(self, observer):
+        self._observers.remove(observer)
+        return self
 
-    def _delete_cache(self, addr):
-        key = to_cache_key(addr)
-        self._cache.pop(key, None)
+    def _notify(self, addr, direction, size, cache_hit=False, duration=0.0,
+                error=None):
+        event = BusEvent(self._device_address, addr, direction, size,
+                         cache_hit, duration, error)
+        for observer in self._observers:
+            observer(event)
+
+    def _observe(self, direction, addr, size, call, first, second):
+        # Run one bus call and report it to the observers
+        start = time.perf_counter()
+        try:
+            call(first, second)
+        except Exception as err:
+            self._notify(addr, direction, size, False,
+                         time.perf_counter() - start, err)
+            raise
+        self._notify(addr, direction, size, False, time.perf_counter() - start)
+
+    def _cached(self, addr):
+        # Return the shadowed value for a wire address, or None when the
+        # register must be read from the bus. Cacheable registers are served
+        # from the shadow until they expire, volatile ones never are.
+        flags = self._registers.flags(addr)
+        if (not flags & REG_CACHEABLE):
+            return None
+        cached = self.shadow.get(addr)
+        if (cached is not None and flags & REG_EXPIRES and
+                time.monotonic() - self.shadow.stamped(addr) >=
+                self._registers.ttl(addr)):
+            return None
+        return cached
 
-    def _get_cached(self, addr):
-        key = to_cache_key(addr)
-        if (key not in self._cache):
-          return None
-        return self._cache.get(key)
+    def _store(self, addr, value, generation):
+        # Shadow a value that was just read from the bus, unless the
+        # register was written since the read began (see ShadowRegisters)
+        flags = self._registers.flags(addr)
+        if (flags & REG_CACHEABLE and
+                self.shadow.store(addr, value, generation) and
+                flags & REG_EXPIRES):
+            self.shadow.stamp(addr, time.monotonic())
 
     def _bus_read(self, bus, addr):
-        addr = to_address(addr, self._use_nvm)
-        cached = self._get_cached(addr)
-        if (cached != None):
-          return cached
-
-        results = [0x00, 0x00]
-        bus.write_readinto([self._device_address, addr], results)
-        response = from_memory(join_bytes(results[1], results[0]))
-        self._update_cache(addr, response)
-        return response
+        # Read the register at the provided wire address
+        cached = self._cached(addr)
+        if (cached is not None):
+            if (self._observers):
+                self._notify(addr, READ, 0, True)
+            return cached
+
+        if (self._busy_until):
+            self._wait_ready(bus)
+        generation = self.shadow.generation(addr)
+        self._out_buffer[1] = addr
+        if (self._observers):
+            self._observe(READ, addr, 2, bus.write_readinto, self._out_buffer,
+                          self._in_buffer)
+        else:
+            bus.write_readinto(self._out_buffer, self._in_buffer)
+        return self._decode(addr, generation)
+
+    def _decode(self, addr, generation):
+        # Decode and shadow the value in the input buffer. This is the same as
+        # from_memory(join_bytes(in[1], in[0])) without the temporaries.
+        in_buffer = self._in_buffer
+        value = ((in_buffer[1] << 8) | in_buffer[0]) >> 5
+        self._store(addr, value, generation)
+        return value
+
+    def _block_buffer(self, size):
+        # Return a reusable input buffer for block reads of the given size
+        buffer = self._block_buffers.get(size)
+        if (buffer is None):
+            buffer = bytearray(size)
+            self._block_buffers[size] = buffer
+        return buffer
+
+    def _supports_auto_increment(self, bus):
+        if (self._auto_increment is None):
+            return getattr(bus, 'auto_increment', False)
+        return self._auto_increment
+
+    def _block_values(self, start, count):
+        # Return the cached values of a block (None where a register must be
+        # read) and the indexes that are missing
+        values = [self._cached(addr) for addr in range(start, start + count)]
+        missing = [i for i, value in enumerate(values) if value is None]
+        return values, missing
+
+    def _block_generations(self, start, missing):
+        # Shadow generations of the missing registers of a block
+        return [self.shadow.generation(start + i) for i in missing]
+
+    def _decode_block(self, buffer, start, values, missing, generations):
+        # Decode and shadow the missing registers of a block from the buffer,
+        # which holds the transfer from the first to the last missing one.
+        # Registers in between that were served from the shadow keep that
+        # value: re-storing them would drop a pending write-back.
+        first = missing[0]
+        for i, generation in zip(missing, generations):
+            offset = 2 * (i - first)
+            value = ((buffer[offset + 1] << 8) | buffer[offset]) >> 5
+            self._store(start + i, value, generation)
+            values[i] = value
+        return values
+
+    def _bus_read_block(self, bus, start, count):
+        # Read count consecutive registers starting at a wire address. Only
+        # the uncached part of the range is transferred, in one transaction
+        # when the bus auto-increments and one per register when it does not.
+        values, missing = self._block_values(start, count)
+        if (len(missing) == 0 or not self._supports_auto_increment(bus)):
+            # Cache hits are reported by _bus_read
+            for i in range(count):
+                values[i] = self._bus_read(bus, start + i)
+            return values
+
+        if (self._busy_until):
+            self._wait_ready(bus)
+        generations = self._block_generations(start, missing)
+        first = missing[0]
+        last = missing[-1]
+        buffer = self._block_buffer(2 * (last - first + 1))
+        self._out_buffer[1] = start + first
+        if (self._observers):
+            self._notify_block_hits(start, count, first, last)
+            self._observe(READ, start + first, len(buffer),
+                          bus.write_readinto, self._out_buffer, buffer)
+        else:
+            bus.write_readinto(self._out_buffer, buffer)
+        return self._decode_block(buffer, start, values, missing,
+                                  generations)
+
+    def _notify_block_hits(self, start, count, first, last):
+        # Report the cached registers a block read did not transfer
+        for i in range(count):
+            if (i < first or i > last):
+                self._notify(start + i, READ, 0, True)
+
+    def _begin_write(self, addr, value):
+        # Apply the cache policy to a register write and return True when the
+        # value must go out on the bus now
+        if (not self._registers.flags(addr) & REG_CACHEABLE):
+            self.shadow.invalidate(addr)
+            return True
+
+        policy = self._cache_policy
+        if (policy == CACHE_WRITE_BACK):
+            self.shadow.set(addr, value, dirty=True)
+            return False
+        elif (policy == CACHE_INVALIDATE):
+            self.shadow.invalidate(addr)
+        return True
+
+    def _end_write(self, addr, value):
+        # Update the shadow after a value has been written to the bus. Under
+        # CACHE_INVALIDATE the register is dropped once more, as a read that
+        # raced the write may have shadowed the old value in between.
+        if (not self._registers.flags(addr) & REG_CACHEABLE):
+            return
+        if (self._cache_policy == CACHE_WRITE_THROUGH):
+            self.shadow.set(addr, value)
+        elif (self._cache_policy == CACHE_INVALIDATE):
+            self.shadow.invalidate(addr)
 
     def _bus_write(self, bus, addr, value):
-        addr = to_address(addr, self._use_nvm)
+        # Write the register at the provided wire address according to the
+        # configured cache policy
+        if (self._begin_write(addr, value)):
+            self._write_wire(bus, addr, value)
+            self._end_write(addr, value)
+
+    def _write_wire(self, bus, addr, value):
+        if (self._busy_until):
+            self._wait_ready(bus)
         parts = split_bytes(to_memory(value))
-        self._delete_cache(addr)
-        bus.write(addr, parts)
-
-    def _write_bits_at(self, bus, addr, bits, start, end):
-        value = self._bus_read(bus, addr)
-        count = (end - start) + 1
-        i = 0
-        while i < end + 1:
-            if (i < start):
-                i += 1
-                continue
-
-            # Get the value of the rightmost bit
-            bit = bits & 0b1
-            value = set_bit(value, bit, i)
-            # Digest the used bit by pushing it off
-            bits = bits >> 1
-            i += 1
+        if (self._observers):
+            self._observe(WRITE, addr, len(parts), bus.write, addr, parts)
+        else:
+            bus.write(addr, parts)
+        self._nvm_written(bus, addr)
 
-        self._bus_write(bus, addr, value)
+    def require_bus(self, bus=None):
+        # Return the bus to run on: bus when given, which also becomes the
+        # builder's bus, and the builder's own bus otherwise
+        if (bus is not None):
+            self._bus = bus
+        if (self._bus is None):
+            raise ValueError('Cannot execute without first providing a bus')
+        return self._bus
+
+    def _update_bits(self, bus, addr, mask, bits):
+        # Read the register once, apply every field and write it back once.
+        # Buses shared between threads expose a lock that keeps the
+        # read-modify-write atomic.
+        lock = getattr(bus, 'lock', None)
+        if (lock is None):
+            value = _apply_mask(self._bus_read(bus, addr), mask, bits)
+            self._bus_write(bus, addr, value)
+            return
+
+        with lock:
+            value = _apply_mask(self._bus_read(bus, addr), mask, bits)
+            self._bus_write(bus, addr, value)
+
+    def _apply_bits(self, bus, addr, mask, bits):
+        # Write the masked bits only when they differ from the register's
+        # current (usually shadowed) value and return (addr, old, new)
+        lock = getattr(bus, 'lock', None)
+        if (lock is None):
+            return self._apply_value(bus, addr, self._bus_read(bus, addr),
+                                     mask, bits)
+
+        with lock:
+            return self._apply_value(bus, addr, self._bus_read(bus, addr),
+                                     mask, bits)
+
+    def _apply_value(self, bus, addr, value, mask, bits):
+        target = _apply_mask(value, mask, bits)
+        if (target != value):
+            self._bus_write(bus, addr, target)
+        return (addr, value, target)
+
+    def _profile_bits(self, profile):
+        # Combine a {field name: value} profile into {wire: (mask, bits)}
+        pending = {}
+        for name, value in profile.items():
+            field = self._registers.field(name)
+            addr = self._writable_address(field.addr)
+            mask, bits = pending.get(addr, (0, 0))
+            bits = _apply_mask(bits, field.mask, field.encode(value))
+            pending[addr] = (mask | field.mask, bits)
+        return pending
+
+    def _apply_plan(self, pending):
+        # Compile {wire: (mask, bits)} into reads of every touched register,
+        # merged into block reads, followed by one conditional write per
+        # register
+        addrs = sorted(pending)
+        operations = [(_OP_READ, addr) for addr in addrs
+                      if self._registers.flags(addr) & REG_CACHEABLE]
+        for addr in addrs:
+            mask, bits = pending[addr]
+            operations.append((_OP_APPLY, addr, mask, bits))
+        return Plan(operations)
+
+    def _apply(self, pending, bus):
+        # Run an apply plan and return (wire, old, new) for every register
+        results = []
+        for step in self._apply_plan(pending).steps:
+            result = self._run_step(bus, step)
+            if (step[0] == _OP_APPLY):
+                results.append(result)
 
-    def _append_op(self, config, value):
-        addr = config[0]
-        start = config[1]
-        end = config[2]
-        self.operations.append(lambda bus: self._write_bits_at(bus, addr, value, start, end))
+        if (self._cache_policy == CACHE_WRITE_BACK):
+            self.flush(bus)
+        return results
+
+    def _profile_report(self, profile, results):
+        values = {addr: (old, new) for addr, old, new in results}
+        registers = [(from_address(addr), old, new)
+                     for addr, old, new in results if old != new]
+        fields = {}
+        for name in profile:
+            field = self._registers.field(name)
+            old, new = values[self._wire_address(field.addr)]
+            if (field.decode(old) != field.decode(new)):
+                fields[name] = (field.decode(old), field.decode(new))
+        return ProfileReport(registers, fields, len(results))
+
+    def _config_values(self, runs, blocks):
+        # Decode every field from the registers of a read_config() step
+        values = {}
+        for (_, count, addr), block in zip(runs, blocks):
+            for i in range(count):
+                values[addr + i] = block[i]
+        return decode_config(values, self._registers)
+
+    def _run_step(self, bus, step):
+        kind = step[0]
+        if (kind == _OP_READ):
+            return self._bus_read(bus, step[1])
+        elif (kind == _OP_READ_BLOCK):
+            return self._bus_read_block(bus, step[1], step[2])
+        elif (kind == _OP_WRITE):
+            self._bus_write(bus, step[1], step[2])
+        elif (kind == _OP_UPDATE):
+            self._update_bits(bus, step[1], step[2], step[3])
+        elif (kind == _OP_READ_FIELD):
+            return (self._bus_read(bus, step[1]) & step[2]) >> step[3]
+        elif (kind == _OP_READ_CONFIG):
+            blocks = [self._bus_read_block(bus, start, count)
+                      for start, count, _ in step[1]]
+            return self._config_values(step[1], blocks)
+        elif (kind == _OP_APPLY):
+            return self._apply_bits(bus, step[1], step[2], step[3])
+        return None
+
+    def _wire_address(self, addr):
+        return to_address(addr, self._use_nvm)
+
+    def _writable_address(self, addr):
+        wire = self._wire_address(addr)
+        if (self._registers.flags(wire) & REG_READ_ONLY):
+            raise ValueError('Register 0x' + format(addr, 'x') +
+                             ' is read-only')
+        return wire
+
+    def _append_field(self, field, value):
+        addr = self._writable_address(field.addr)
+        self.operations.append((_OP_FIELD, addr, field.mask,
+                                field.encode(value)))
 
     def clear_operations(self):
         self.operations = []
         return self
 
+    def set_cache_policy(self, policy):
+        # Select one of CACHE_INVALIDATE, CACHE_WRITE_THROUGH or
+        # CACHE_WRITE_BACK. Call flush() before leaving write-back if there
+        # may be dirty registers that have not been written yet.
+        if (policy not in _CACHE_POLICIES):
+            raise ValueError('Unknown cache policy ' + repr(policy) +
+                             ', expected one of ' + repr(_CACHE_POLICIES))
+        self._cache_policy = policy
+        return self
+
+    def flush(self, bus=None):
+        # Write every dirty (write-back) register to the bus once
+        bus = self.require_bus(bus)
+        for addr in self.shadow.dirty_addresses():
+            self._write_wire(bus, addr, self.shadow.get(addr))
+            self.shadow.mark_clean(addr)
+        return self
+
     def use_srb(self):
         # Turn off NVM flag
         self._use_nvm = False
@@ -235,86 +1276,308 @@ class I2CBuilder():
         self._use_nvm = True
         return self
 
-    def read_register(self, addr):
-        # Read a register on the next call to execute
-        self.operations.append(lambda bus: self._bus_read(bus, addr))
-        return self
-
-    def write_register(self, addr, value):
-        # Write a register on the next call to execute
-        self.operations.append(lambda bus: self._bus_write(bus, addr, value))
-        return self
-
-    def set_output_mode(self, mode):
-        self._append_op(Constants._OutputMode, mode)
-        return self
-
-    def set_spi_data_order(self, order):
-        self._append_op(Constants._SpiDataOrder, order)
-        return self
-
-    def set_spi_mode(self, mode):
-        self._append_op(Constants._SpiMode, mode)
-        return self
-
-    def set_i2c_address(self, addr):
-        self._append_op(Constants._I2CAddress, addr)
-        return self
-
-    def set_system_protocol(self, protocol):
-        self._append_op(Constants._SystemProtocol, protocol)
-        return self
+    def get_field(self, name):
+        # Read and decode a named field on the next call to execute
+        return self._append_get(self._registers.field(name))
 
-    def set_quad_mode_xor(self, value):
-        self._append_op(Constants._QuadModeXor, value)
+    def _append_get(self, field):
+        if (self._registers.get(field.addr).write_only):
+            raise ValueError('Register 0x' + format(field.addr, 'x') +
+                             ' is write-only')
+        self.operations.append((_OP_READ_FIELD, self._wire_address(field.addr),
+                                field.mask, field.shift))
         return self
 
-    def set_output_interrupt_enable(self, value):
-        self._append_op(Constants._OutputInterruptEnable, value)
+    def read_config(self, include_status=False):
+        # Read every configuration register of the selected space once (as
+        # block reads over contiguous registers) and return all fields decoded
+        # into a {field name: value} dict on the next call to execute. The
+        # read-only status SFRs are included when include_status is True.
+        addrs = [register.addr for register in self._registers.registers()
+                 if not register.write_only and
+                 (include_status or register.addr < 0x20)]
+        runs = []
+        for addr in addrs:
+            wire = self._wire_address(addr)
+            if (runs and runs[-1][0] + runs[-1][1] == wire and
+                    wire >> 5 == runs[-1][0] >> 5):
+                start, count, first = runs[-1]
+                runs[-1] = (start, count + 1, first)
+            else:
+                runs.append((wire, 1, addr))
+        self.operations.append((_OP_READ_CONFIG, tuple(runs)))
         return self
 
-    def set_cyber_security(self, value):
-        self._append_op(Constants._CyberSecurity, value)
-        return self
-
-    def set_quad_mode(self, value):
-        self._append_op(Constants._QuadMode, value)
+    def read_register(self, addr):
+        # Read a register on the next call to execute
+        self.operations.append((_OP_READ, self._wire_address(addr)))
         return self
 
-    def set_tx_charge_pump_enable(self, value):
-        self._append_op(Constants._TXChargePumpEnable, value)
+    def poll(self, addr, bus=None):
+        # Read one register immediately, bypassing the operation queue.
+        #
+        # This is the path for tight polling loops: in steady state it
+        # allocates no buffers, lists or strings. The only new object is the
+        # decoded value of an uncached read, which CircuitPython stores as an
+        # immediate small int.
+        return self._bus_read(self.require_bus(bus),
+                              to_address(addr, self._use_nvm))
+
+    def read_block(self, start, count):
+        # Read count consecutive registers on the next call to execute. Each
+        # register contributes its own entry to the execute results.
+        wire = self._wire_address(start)
+        if (count < 1 or (wire + count - 1) >> 5 != wire >> 5):
+            raise ValueError('Block of ' + str(count) + ' registers at 0x' +
+                             format(start, 'x') + ' must stay within one ' +
+                             'NVM or SRB/SFR space')
+        self.operations.append((_OP_READ_BLOCK, wire, count))
         return self
 
-    def set_tx_amplitude_control(self, value):
-        self._append_op(Constants._TXAmplitudeCtrl, value)
+    def write_register(self, addr, value):
+        # Write a register on the next call to execute
+        self.operations.append((_OP_WRITE, self._writable_address(addr), value))
         return self
 
-    def set_protocol_integrity_check(self, value):
-        self._append_op(Constants._ProtocolIntegrityCheck, value)
+    def set_field(self, name, value):
+        # Set a named field (see REGISTERS) on the next call to execute
+        self._append_field(self._registers.field(name), value)
         return self
 
-    def set_supply_voltage(self, value):
-        self._append_op(Constants._SupplyVoltage, value)
-        return self
+    def apply_profile(self, profile, bus=None):
+        # Bring the selected space in line with a {field name: value} profile
+        # now, writing only the registers whose bits differ from it, and
+        # return a ProfileReport. Current values come from the shadow where
+        # possible and otherwise from block reads of the touched registers,
+        # so a device that already matches costs no writes at all. Stored
+        # operations are left untouched.
+        bus = self.require_bus(bus)
+        results = self._apply(self._profile_bits(profile), bus)
+        return self._profile_report(profile, results)
+
+    def apply_masks(self, pending, bus=None):
+        # Bring registers in line with {wire address: (mask, bits)} now,
+        # writing only those whose masked bits differ, and return (wire, old
+        # value, new value) for every register: apply_profile() for callers
+        # that work on whole registers rather than fields
+        return self._apply(pending, self.require_bus(bus))
+
+    def prepare(self):
+        # Compile the stored operations into a reusable Plan and clear them
+        plan = Plan(self.operations)
+        self.clear_operations()
+        return plan
 
     def execute(self, bus=None):
         # Execute any stored operations
-        if (bus is not None):
-            self._bus = bus
-        if (self._bus is None):
-            raise ValueError('Cannot execute without first providing a bus')
-        results = []
-        for operation in self.operations:
-            result = operation(self._bus)
-            if (result is not None):
-                results.append(result)
-
+        results = self.run(Plan(self.operations), bus)
         self.clear_operations()
-        result_count = len(results)
-        if (result_count == 0):
-            return None
-        elif (result_count == 1):
-            return results[0]
+        return results
+
+    def run(self, plan, bus=None):
+        # Execute a prepared Plan, leaving any stored operations untouched
+        bus = self.require_bus(bus)
+        results = []
+        for step in plan.steps:
+            _collect(results, step, self._run_step(bus, step))
+
+        if (self._cache_policy == CACHE_WRITE_BACK):
+            self.flush(bus)
+        return _shape_results(results)
+
+    def run_step(self, step, bus=None):
+        # Run one compiled step of a Plan (see Plan.steps) and return its raw
+        # result, for callers that interleave plans. run() is every step
+        # followed by the write-back flush.
+        return self._run_step(self.require_bus(bus), step)
+
+    def _verified_write(self, bus, addr, value):
+        # Write a register for execute_verified() and return the value. It
+        # goes to the bus now whatever the cache policy, as it is read back
+        # next; the shadow is dropped first and refilled by the read back.
+        self.shadow.invalidate(addr)
+        self._write_wire(bus, addr, value)
+        return value
+
+    def _verified_update(self, bus, addr, mask, bits):
+        # Read-modify-write for execute_verified(), kept atomic on shared
+        # buses like _update_bits()
+        lock = getattr(bus, 'lock', None)
+        if (lock is None):
+            return self._verified_write(
+                bus, addr, _apply_mask(self._bus_read(bus, addr), mask, bits))
+
+        with lock:
+            return self._verified_write(
+                bus, addr, _apply_mask(self._bus_read(bus, addr), mask, bits))
+
+    def _verified_step(self, bus, step, results, index, written):
+        kind = step[0]
+        if (kind == _OP_WRITE):
+            written[step[1]] = self._verified_write(bus, step[1], step[2])
+        elif (kind == _OP_UPDATE):
+            written[step[1]] = self._verified_update(bus, step[1], step[2],
+                                                     step[3])
         else:
-            return results
+            results[index] = self._run_step(bus, step)
+
+    def _read_back(self, bus, expected):
+        # Read every expected register from the bus, in as few block reads as
+        # possible, and return {wire: (actual, error)} for the ones that
+        # differ. Confirmed registers are left shadowed by the read, the
+        # others are dropped.
+        wires = sorted(wire for wire in expected
+                       if not self._registers.flags(wire) & REG_WRITE_ONLY)
+        for wire in wires:
+            self.shadow.invalidate(wire)
+
+        mismatches = {}
+        for step in Plan([(_OP_READ, wire) for wire in wires]).steps:
+            try:
+                values = self._run_step(bus, step)
+            except Exception as err:
+                for wire in _step_wires(step):
+                    mismatches[wire] = (None, err)
+                continue
+            if (step[0] == _OP_READ):
+                values = [values]
+            for wire, value in zip(_step_wires(step), values):
+                if (value != expected[wire]):
+                    mismatches[wire] = (value, None)
+                    self.shadow.invalidate(wire)
+        return mismatches
+
+    def execute_verified(self, bus=None, retries=VERIFY_RETRIES,
+                         backoff=VERIFY_BACKOFF):
+        # Execute the stored operations, then read back every register that
+        # was written in one batched pass and compare it with the value that
+        # was written. Operations that raised and registers that read back
+        # wrong are replayed, and only those, up to retries times with an
+        # exponential backoff. A failure never stops the rest of the batch.
+        #
+        # Writes go to the bus at once under every cache policy and the
+        # shadow only keeps the values the read back confirmed. Returns a
+        # VerifyReport. The stored operations are cleared, except the ones
+        # touching a register that still failed, so they can be executed
+        # again later.
+        bus = self.require_bus(bus)
+        sleep = getattr(bus, 'sleep', time.sleep)
+        steps = Plan(self.operations).steps
+        results = [None] * len(steps)
+        expected = {}
+        errors = {}
+        pending = list(range(len(steps)))
+        mismatches = {}
+        replays = 0
+        while (True):
+            written = {}
+            for index in pending:
+                try:
+                    self._verified_step(bus, steps[index], results, index,
+                                        written)
+                except Exception as err:
+                    errors[index] = err
+                else:
+                    errors.pop(index, None)
+            for wire, (actual, _) in list(mismatches.items()):
+                try:
+                    self._verified_write(bus, wire, expected[wire])
+                except Exception as err:
+                    mismatches[wire] = (actual, err)
+                written[wire] = expected[wire]
+            expected.update(written)
+            mismatches = self._read_back(bus, written)
+
+            if ((not errors and not mismatches) or replays >= retries):
+                break
+            sleep(backoff * (1 << replays))
+            replays += 1
+            pending = sorted(errors)
+
+        failed = set(mismatches)
+        failures = []
+        for index in sorted(errors):
+            for wire in _step_wires(steps[index]):
+                # A write that raised may have reached the device
+                self.shadow.invalidate(wire)
+                if (wire not in failed):
+                    failed.add(wire)
+                    failures.append(VerifyFailure(from_address(wire),
+                                                  error=errors[index]))
+        for wire in sorted(mismatches):
+            actual, error = mismatches[wire]
+            failures.append(VerifyFailure(from_address(wire), expected[wire],
+                                          actual, error))
+        failures.sort(key=lambda failure: failure.addr)
+
+        values = []
+        for index, step in enumerate(steps):
+            if (index in errors and step[0] in (_OP_READ, _OP_READ_FIELD,
+                                                _OP_READ_CONFIG)):
+                values.append(None)
+            elif (index in errors and step[0] == _OP_READ_BLOCK):
+                values.extend([None] * step[2])
+            else:
+                _collect(values, step, results[index])
+
+        self.operations = [op for op in self.operations
+                           if any(wire in failed for wire in _step_wires(op))]
+        return VerifyReport(_shape_results(values), failures, replays)
+
+
+def decode_config(values, registers=REGISTERS):
+    # Decode every field from a {documented address: value} dict of register
+    # values (such as ShadowRegisters.registers()) into {field name: value}.
+    # Registers that are missing from values are skipped.
+    return decode_configs([values], registers)[0]
+
+
+def decode_configs(snapshots, registers=REGISTERS):
+    # Decode many register snapshots (e.g. one per device) in one pass over
+    # the field list
+    fields = [field for field in registers.fields()
+              if not registers.get(field.addr).write_only]
+    configs = []
+    for values in snapshots:
+        config = {}
+        for field in fields:
+            value = values.get(field.addr)
+            if (value is not None):
+                config[field.name] = (value & field.mask) >> field.shift
+        configs.append(config)
+    return configs
+
+
+def _field_setter(field):
+    def setter(self, value):
+        self._append_field(field, value)
+        return self
 
+    setter.__name__ = 'set_' + field.name
+    setter.__doc__ = ('Set ' + field.name + ' (register 0x' +
+                      format(field.addr, '02x') + ', bits ' +
+                      str(field.start) + '-' + str(field.end) +
+                      ') on the next call to execute')
+    return setter
+
+
+def _field_getter(field):
+    def getter(self):
+        return self._append_get(field)
+
+    getter.__name__ = 'get_' + field.name
+    getter.__doc__ = ('Read ' + field.name + ' (register 0x' +
+                      format(field.addr, '02x') + ', bits ' +
+                      str(field.start) + '-' + str(field.end) +
+                      ') on the next call to execute')
+    return getter
+
+
+# Generate set_<field> and get_<field> methods for the fields in the register
+# map that can be written and read
+for _field in REGISTERS.fields():
+    if (not REGISTERS.get(_field.addr).read_only):
+        setattr(I2CBuilder, 'set_' + _field.name, _field_setter(_field))
+    if (not REGISTERS.get(_field.addr).write_only):
+        setattr(I2CBuilder, 'get_' + _field.name, _field_getter(_field))
+del _field
@@ -0,0 +1,247 @@
+import asyncio
+import time
+
+from . import (I2CBuilder, Plan, CACHE_WRITE_BACK, READ, WRITE,
+               VERIFY_BACKOFF, VERIFY_RETRIES, _OP_READ, _OP_READ_BLOCK,
+               _OP_WRITE, _OP_UPDATE, _OP_READ_FIELD, _OP_READ_CONFIG,
+               _OP_APPLY, _apply_mask, _collect, _shape_results, split_bytes,
+               to_address, to_memory)
+
+
+class ExecutorBus():
+    # Adapt a blocking busio-style bus to the async bus interface.
+    #
+    # Each transaction runs in an executor (the loop's default thread pool
+    # unless one is provided) and transactions on the same adapter are
+    # serialized with a lock, so many coroutines can share one physical bus
+    # without blocking the event loop.
+    def __init__(self, bus, executor=None):
+        self._bus = bus
+        self._executor = executor
+        self._lock = asyncio.Lock()
+        self.auto_increment = getattr(bus, 'auto_increment', False)
+        self.monotonic = getattr(bus, 'monotonic', time.monotonic)
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def write_readinto(self, out_buffer, in_buffer):
+        await self._call(self._bus.write_readinto, out_buffer, in_buffer)
+
+    async def write(self, addr, value):
+        await self._call(self._bus.write, addr, value)
+
+    async def sleep(self, seconds):
+        # Wait without holding the bus, in the wrapped bus' time if it has
+        # its own clock
+        sleep = getattr(self._bus, 'sleep', None)
+        if (sleep is None):
+            await asyncio.sleep(seconds)
+        else:
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, sleep, seconds)
+
+
+class AsyncI2CBuilder(I2CBuilder):
+    # I2CBuilder for asyncio applications.
+    #
+    # Operations are queued, compiled and cached exactly as they are by
+    # I2CBuilder, but the bus is awaited: it must provide write_readinto() and
+    # write() coroutines (wrap a blocking bus in ExecutorBus). A builder
+    # reuses its transfer buffers, so run one coroutine per builder at a time
+    # and use one builder per device.
+    #
+    # The blocking entry points of I2CBuilder would call the bus coroutines
+    # without awaiting them and shadow whatever was left in the buffers, so
+    # they raise TypeError here; use their *_async counterparts.
+    def _blocking(self, name):
+        return TypeError('AsyncI2CBuilder cannot ' + name + '() on an async ' +
+                         'bus; await ' + name + '_async() instead')
+
+    def execute(self, bus=None):
+        raise self._blocking('execute')
+
+    def run(self, plan, bus=None):
+        raise self._blocking('run')
+
+    def poll(self, addr, bus=None):
+        raise self._blocking('poll')
+
+    def flush(self, bus=None):
+        raise self._blocking('flush')
+
+    def apply_profile(self, profile, bus=None):
+        raise self._blocking('apply_profile')
+
+    def execute_verified(self, bus=None, retries=VERIFY_RETRIES,
+                         backoff=VERIFY_BACKOFF):
+        raise TypeError('AsyncI2CBuilder cannot execute_verified() on an ' +
+                        'async bus')
+
+    # Helpers that drive the builder directly (snapshot, run_step) end up
+    # here
+    def _bus_read(self, bus, addr):
+        raise TypeError('AsyncI2CBuilder cannot read from an async bus ' +
+                        'synchronously')
+
+    def _bus_read_block(self, bus, start, count):
+        return self._bus_read(bus, start)
+
+    def _write_wire(self, bus, addr, value):
+        raise TypeError('AsyncI2CBuilder cannot write to an async bus ' +
+                        'synchronously')
+
+    async def _observe_async(self, direction, addr, size, call, first,
+                             second):
+        # Await one bus call and report it to the observers
+        start = time.perf_counter()
+        try:
+            await call(first, second)
+        except Exception as err:
+            self._notify(addr, direction, size, False,
+                         time.perf_counter() - start, err)
+            raise
+        self._notify(addr, direction, size, False, time.perf_counter() - start)
+
+    async def _wait_ready_async(self, bus):
+        # Await the rest of the NVM program cycle without blocking the loop
+        remaining = self._busy_until - getattr(bus, 'monotonic',
+                                               time.monotonic)()
+        if (remaining > 0):
+            sleep = getattr(bus, 'sleep', None)
+            await (asyncio.sleep(remaining) if sleep is None
+                   else sleep(remaining))
+        self._busy_until = 0.0
+
+    async def _bus_read_async(self, bus, addr):
+        cached = self._cached(addr)
+        if (cached is not None):
+            if (self._observers):
+                self._notify(addr, READ, 0, True)
+            return cached
+
+        if (self._busy_until):
+            await self._wait_ready_async(bus)
+        generation = self.shadow.generation(addr)
+        self._out_buffer[1] = addr
+        if (self._observers):
+            await self._observe_async(READ, addr, 2, bus.write_readinto,
+                                      self._out_buffer, self._in_buffer)
+        else:
+            await bus.write_readinto(self._out_buffer, self._in_buffer)
+        return self._decode(addr, generation)
+
+    async def _bus_read_block_async(self, bus, start, count):
+        values, missing = self._block_values(start, count)
+        if (len(missing) == 0 or not self._supports_auto_increment(bus)):
+            for i in range(count):
+                values[i] = await self._bus_read_async(bus, start + i)
+            return values
+
+        if (self._busy_until):
+            await self._wait_ready_async(bus)
+        generations = self._block_generations(start, missing)
+        first = missing[0]
+        last = missing[-1]
+        buffer = self._block_buffer(2 * (last - first + 1))
+        self._out_buffer[1] = start + first
+        if (self._observers):
+            self._notify_block_hits(start, count, first, last)
+            await self._observe_async(READ, start + first, len(buffer),
+                                      bus.write_readinto, self._out_buffer,
+                                      buffer)
+        else:
+            await bus.write_readinto(self._out_buffer, buffer)
+        return self._decode_block(buffer, start, values, missing,
+                                  generations)
+
+    async def _write_wire_async(self, bus, addr, value):
+        if (self._busy_until):
+            await self._wait_ready_async(bus)
+        parts = split_bytes(to_memory(value))
+        if (self._observers):
+            await self._observe_async(WRITE, addr, len(parts), bus.write, addr,
+                                      parts)
+        else:
+            await bus.write(addr, parts)
+        self._nvm_written(bus, addr)
+
+    async def _bus_write_async(self, bus, addr, value):
+        if (self._begin_write(addr, value)):
+            await self._write_wire_async(bus, addr, value)
+            self._end_write(addr, value)
+
+    async def _run_step_async(self, bus, step):
+        kind = step[0]
+        if (kind == _OP_READ):
+            return await self._bus_read_async(bus, step[1])
+        elif (kind == _OP_READ_BLOCK):
+            return await self._bus_read_block_async(bus, step[1], step[2])
+        elif (kind == _OP_WRITE):
+            await self._bus_write_async(bus, step[1], step[2])
+        elif (kind == _OP_UPDATE):
+            value = await self._bus_read_async(bus, step[1])
+            await self._bus_write_async(bus, step[1],
+                                        _apply_mask(value, step[2], step[3]))
+        elif (kind == _OP_READ_FIELD):
+            value = await self._bus_read_async(bus, step[1])
+            return (value & step[2]) >> step[3]
+        elif (kind == _OP_READ_CONFIG):
+            blocks = []
+            for start, count, _ in step[1]:
+                blocks.append(await self._bus_read_block_async(bus, start,
+                                                               count))
+            return self._config_values(step[1], blocks)
+        elif (kind == _OP_APPLY):
+            value = await self._bus_read_async(bus, step[1])
+            target = _apply_mask(value, step[2], step[3])
+            if (target != value):
+                await self._bus_write_async(bus, step[1], target)
+            return (step[1], value, target)
+        return None
+
+    async def flush_async(self, bus=None):
+        # Write every dirty (write-back) register to the bus once
+        bus = self.require_bus(bus)
+        for addr in self.shadow.dirty_addresses():
+            await self._write_wire_async(bus, addr, self.shadow.get(addr))
+            self.shadow.mark_clean(addr)
+        return self
+
+    async def poll_async(self, addr, bus=None):
+        # Read one register immediately, bypassing the operation queue
+        return await self._bus_read_async(self.require_bus(bus),
+                                          to_address(addr, self._use_nvm))
+
+    async def apply_profile_async(self, profile, bus=None):
+        # Awaitable apply_profile()
+        bus = self.require_bus(bus)
+        results = []
+        plan = self._apply_plan(self._profile_bits(profile))
+        for step in plan.steps:
+            result = await self._run_step_async(bus, step)
+            if (step[0] == _OP_APPLY):
+                results.append(result)
+
+        if (self._cache_policy == CACHE_WRITE_BACK):
+            await self.flush_async(bus)
+        return self._profile_report(profile, results)
+
+    async def execute_async(self, bus=None):
+        # Execute any stored operations
+        results = await self.run_async(Plan(self.operations), bus)
+        self.clear_operations()
+        return results
+
+    async def run_async(self, plan, bus=None):
+        # Execute a prepared Plan, leaving any stored operations untouched
+        bus = self.require_bus(bus)
+        results = []
+        for step in plan.steps:
+            _collect(results, step, await self._run_step_async(bus, step))
+
+        if (self._cache_policy == CACHE_WRITE_BACK):
+            await self.flush_async(bus)
+        return _shape_results(results)
@@ -0,0 +1,165 @@
+# Streaming angle computation for the SinCos output modes.
+#
+# AngleEngine turns chunks of sampled sin/cos voltages (and the reference
+# voltage in OutputModeSinCosRef) into angle, signal magnitude and unwrapped
+# multi-turn position. State is kept between chunks, so a long capture can be
+# fed through in pieces of any size. NumPy arrays are processed with
+# vectorized arctan2; without NumPy, or for other sequences, each sample is
+# converted with math.atan2 and the results are array('d').
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import Constants
+
+TWO_PI = 2 * math.pi
+
+
+class AngleEngine():
+    # Offset, gain and phase correction are applied in that order:
+    #
+    #   sin' = (sin - ref - offset_sin) * gain_sin
+    #   cos' = (cos - ref - offset_cos) * gain_cos
+    #   sin'' = (sin' - cos' * sin(phase)) / cos(phase)
+    #
+    # where phase (radians) is how far the sin channel leads a true
+    # quadrature signal. angle = atan2(sin'', cos') in radians within
+    # [-pi, pi], magnitude = hypot(sin'', cos'), and position counts turns of
+    # the target: the unwrapped angle divided by 2 pi and by periods, the
+    # number of electrical periods per mechanical turn. A correction (a
+    # linearize.CorrectionTable) is applied to the angle before unwrapping.
+    def __init__(self, reference=False, offset_sin=0.0, offset_cos=0.0,
+                 gain_sin=1.0, gain_cos=1.0, phase=0.0, periods=1,
+                 correction=None):
+        self.reference = reference
+        self.offset_sin = offset_sin
+        self.offset_cos = offset_cos
+        self.gain_sin = gain_sin
+        self.gain_cos = gain_cos
+        self.phase = phase
+        self.periods = periods
+        self.correction = correction
+        self.reset()
+
+    @classmethod
+    def from_config(cls, config, **options):
+        # Build an engine for a decoded configuration (see read_config)
+        mode = config['output_mode']
+        if (mode not in (Constants.OutputModeSinCosNN,
+                         Constants.OutputModeSinCosRef)):
+            raise ValueError('Output mode ' + str(mode) + ' is not a SinCos ' +
+                             'mode')
+        return cls(reference=mode == Constants.OutputModeSinCosRef, **options)
+
+    def reset(self, position=None):
+        # Forget the previous samples; the next chunk starts a new unwrap.
+        # With position (in turns) the next sample is unwrapped onto the
+        # nearest turn to it.
+        self._last_angle = None
+        self._last_unwrapped = None
+        self._start = position
+
+    @property
+    def position(self):
+        # Position of the last processed sample in turns, or None
+        if (self._last_unwrapped is None):
+            return None
+        return self._last_unwrapped / (TWO_PI * self.periods)
+
+    def _first(self, angle):
+        # Unwrapped angle of the very first sample
+        if (self._start is None):
+            return angle
+        target = self._start * TWO_PI * self.periods
+        return angle + TWO_PI * round((target - angle) / TWO_PI)
+
+    def process(self, sin, cos, ref=None):
+        # Convert one chunk and return (angle, magnitude, position) arrays
+        if (self.reference and ref is None):
+            raise ValueError('OutputModeSinCosRef needs the reference samples')
+        if (len(sin) != len(cos) or (ref is not None and
+                                     len(ref) != len(sin))):
+            raise ValueError('Sample buffers must have the same length')
+        if (numpy is not None and isinstance(sin, numpy.ndarray)):
+            if (len(sin) == 0):
+                return (numpy.empty(0), numpy.empty(0), numpy.empty(0))
+            return self._process_numpy(sin, cos, ref)
+        return self._process_python(sin, cos, ref)
+
+    def _process_numpy(self, sin, cos, ref):
+        s = numpy.asarray(sin, dtype=numpy.float64)
+        c = numpy.asarray(cos, dtype=numpy.float64)
+        if (ref is not None):
+            r = numpy.asarray(ref, dtype=numpy.float64)
+            s = s - r
+            c = c - r
+        s = (s - self.offset_sin) * self.gain_sin
+        c = (c - self.offset_cos) * self.gain_cos
+        if (self.phase):
+            s = (s - c * math.sin(self.phase)) / math.cos(self.phase)
+
+        angle = numpy.arctan2(s, c)
+        if (self.correction is not None):
+            angle = self.correction.apply(angle)
+        magnitude = numpy.hypot(s, c)
+        if (self._last_angle is None):
+            self._last_angle = float(angle[0])
+            self._last_unwrapped = self._first(self._last_angle)
+        steps = numpy.diff(angle, prepend=self._last_angle)
+        steps = (steps + math.pi) % TWO_PI - math.pi
+        unwrapped = self._last_unwrapped + numpy.cumsum(steps)
+        self._last_angle = float(angle[-1])
+        self._last_unwrapped = float(unwrapped[-1])
+        return (angle, magnitude, unwrapped / (TWO_PI * self.periods))
+
+    def _process_python(self, sin, cos, ref):
+        count = len(sin)
+        angles = array('d', bytes(8 * count))
+        magnitudes = array('d', bytes(8 * count))
+        positions = array('d', bytes(8 * count))
+        offset_sin = self.offset_sin
+        offset_cos = self.offset_cos
+        gain_sin = self.gain_sin
+        gain_cos = self.gain_cos
+        skew = math.sin(self.phase)
+        scale = 1 / math.cos(self.phase)
+        turn = 1 / (TWO_PI * self.periods)
+        correct = None
+        if (self.correction is not None):
+            correct = self.correction.correct
+        last = self._last_angle
+        unwrapped = self._last_unwrapped
+        for i in range(count):
+            s = sin[i]
+            c = cos[i]
+            if (ref is not None):
+                s -= ref[i]
+                c -= ref[i]
+            s = (s - offset_sin) * gain_sin
+            c = (c - offset_cos) * gain_cos
+            if (skew):
+                s = (s - c * skew) * scale
+            angle = math.atan2(s, c)
+            if (correct is not None):
+                angle = correct(angle)
+            if (last is None):
+                unwrapped = self._first(angle)
+            else:
+                unwrapped += (angle - last + math.pi) % TWO_PI - math.pi
+            last = angle
+            angles[i] = angle
+            magnitudes[i] = math.hypot(s, c)
+            positions[i] = unwrapped * turn
+        self._last_angle = last
+        self._last_unwrapped = unwrapped
+        return (angles, magnitudes, positions)
+
+    def stream(self, chunks):
+        # Generator over (sin, cos) or (sin, cos, ref) chunks that yields the
+        # (angle, magnitude, position) of each
+        for chunk in chunks:
+            yield self.process(*chunk)
@@ -0,0 +1,144 @@
+import threading
+import time
+
+from . import I2CBuilder, ShadowRegisters, BusEvent, READ, WRITE
+
+
+class _Flight():
+    # A read transaction that other callers can wait on
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class SharedBus():
+    # Share one physical bus between threads.
+    #
+    # SharedBus owns the bus and presents the same write_readinto()/write()
+    # interface, so it can be handed to any I2CBuilder. Every transaction is
+    # serialized with a lock, identical reads that are already in flight are
+    # merged (the later callers wait and receive the same bytes), and
+    # builders created with builder() share one coherent ShadowRegisters per
+    # device address instead of each keeping its own. Observers receive a
+    # BusEvent per transaction, with merged reads reported as cache hits.
+    def __init__(self, bus):
+        self._bus = bus
+        # Reentrant so builders can hold it across a read-modify-write
+        self.lock = threading.RLock()
+        self._flights_lock = threading.Lock()
+        self._flights = {}
+        self._shadows = {}
+        self.auto_increment = getattr(bus, 'auto_increment', False)
+        # Builders track NVM program cycles in the bus' own time if it has one
+        self.monotonic = getattr(bus, 'monotonic', time.monotonic)
+        self.sleep = getattr(bus, 'sleep', time.sleep)
+        # Transaction counters
+        self.reads = 0
+        self.merged_reads = 0
+        self.writes = 0
+        self._observers = []
+
+    def add_observer(self, observer):
+        self._observers.append(observer)
+        return self
+
+    def remove_observer(self, observer):
+        self._observers.remove(observer)
+        return self
+
+    def _notify(self, device_address, addr, direction, size, cache_hit,
+                duration, error):
+        event = BusEvent(device_address, addr, direction, size, cache_hit,
+                         duration, error)
+        for observer in self._observers:
+            observer(event)
+
+    @property
+    def bus(self):
+        return self._bus
+
+    def shadow(self, device_address):
+        # Return the shared shadow registers for a device
+        with self._flights_lock:
+            shadow = self._shadows.get(device_address)
+            if (shadow is None):
+                shadow = ShadowRegisters(threading.Lock())
+                self._shadows[device_address] = shadow
+            return shadow
+
+    def builder(self, device_address, builder_class=I2CBuilder, **options):
+        # Return a builder that talks through this bus and shares the
+        # device's shadow registers with every other builder made here
+        return builder_class(device_address, self,
+                             shadow=self.shadow(device_address), **options)
+
+    def invalidate(self, device_address=None):
+        # Drop the shared shadow for one device, or for all of them
+        with self._flights_lock:
+            shadows = list(self._shadows.values()) \
+                if device_address is None \
+                else [self._shadows.get(device_address)]
+        for shadow in shadows:
+            if (shadow is not None):
+                shadow.invalidate()
+
+    def write_readinto(self, out_buffer, in_buffer):
+        key = (bytes(out_buffer), len(in_buffer))
+        # A read is only in flight while its leader holds the lock, so a
+        # caller that owns the lock (e.g. across a read-modify-write) never
+        # waits on a read that needs the lock to finish
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if (flight is not None):
+                self.merged_reads += 1
+
+        if (flight is not None):
+            flight.done.wait()
+            if (self._observers):
+                self._notify(out_buffer[0], out_buffer[1], READ, 0, True, 0.0,
+                             flight.error)
+            if (flight.error is not None):
+                raise flight.error
+            in_buffer[:] = flight.data
+            return
+
+        start = time.perf_counter()
+        try:
+            with self.lock:
+                with self._flights_lock:
+                    flight = _Flight()
+                    self._flights[key] = flight
+                try:
+                    self.reads += 1
+                    self._bus.write_readinto(out_buffer, in_buffer)
+                    flight.data = bytes(in_buffer)
+                finally:
+                    # Retire the flight before any write can follow it, so
+                    # later readers never receive bytes from before a write
+                    with self._flights_lock:
+                        del self._flights[key]
+        except Exception as err:
+            flight.error = err
+            raise
+        finally:
+            flight.done.set()
+            if (self._observers):
+                self._notify(out_buffer[0], out_buffer[1], READ,
+                             len(in_buffer), False,
+                             time.perf_counter() - start, flight.error)
+
+    def write(self, addr, value):
+        start = time.perf_counter()
+        error = None
+        try:
+            with self.lock:
+                self.writes += 1
+                self._bus.write(addr, value)
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            if (self._observers):
+                self._notify(None, addr, WRITE, len(value), False,
+                             time.perf_counter() - start, error)
@@ -0,0 +1,166 @@
+# Transmitter calibration by search instead of sweeps.
+#
+# The TX frequency code is found by bisection on the transmitter counter SFR,
+# which moves monotonically with the code: after reading both ends of the
+# range every trial halves it, so 11 bit codes take 13 trials instead of 2048.
+# The TX current code is found by golden-section search for the highest score
+# of a caller supplied measure (e.g. the signal magnitude from an
+# AngleEngine), which must peak once over the range. Every trial is written
+# to the SRB only, as one write and, for the frequency, one counter read; the
+# winning codes are committed to the NVM once at the end, writing only the
+# registers that change.
+import math
+import time
+
+from . import Constants, Plan, REGISTER_MASK, _OP_READ, _OP_WRITE, to_address
+
+_INVERSE_PHI = (math.sqrt(5) - 1) / 2
+
+
+class CalibrationResult():
+    # Outcome of calibrate(). freq_code and counter are the tx_freq_calib
+    # code and the tx counter reading it gave; current_code and score the
+    # tx_current_calib code and its measure (None when the current was not
+    # calibrated). trials counts the codes tried and nvm is the
+    # ProfileReport of the NVM commit, or None when nothing was committed.
+    def __init__(self, freq_code, counter, current_code, score, trials, nvm):
+        self.freq_code = freq_code
+        self.counter = counter
+        self.current_code = current_code
+        self.score = score
+        self.trials = trials
+        self.nvm = nvm
+
+    def __repr__(self):
+        return ('CalibrationResult(freq 0x' + format(self.freq_code, 'x') +
+                ' -> counter 0x' + format(self.counter, 'x') + ', current ' +
+                ('None' if self.current_code is None
+                 else '0x' + format(self.current_code, 'x')) +
+                ', ' + str(self.trials) + ' trials)')
+
+
+def _trial(builder, bus, addr, settle):
+    # Return a function that writes a code to the SRB register at addr and
+    # waits settle seconds for the transmitter to follow
+    wire = to_address(addr, False)
+    sleep = getattr(bus, 'sleep', time.sleep)
+
+    def write(code):
+        builder.run(Plan([(_OP_WRITE, wire, code)]), bus)
+        if (settle):
+            sleep(settle)
+
+    return write
+
+
+def search_frequency(builder, target, bus=None, low=0, high=REGISTER_MASK,
+                     settle=0.0):
+    # Bisect tx_freq_calib (SRB) for the code whose tx counter reading is
+    # closest to target and return (code, counter, trials). Raises
+    # ValueError when target is outside the readings at low and high.
+    bus = builder.require_bus(bus)
+    write = _trial(builder, bus, Constants.RegAddrTXFreqCalib, settle)
+    read = Plan([(_OP_READ, to_address(Constants.RegAddrTXCounterState,
+                                       False))])
+    counters = {}
+    last = [None]
+
+    def counter(code):
+        write(code)
+        last[0] = code
+        counters[code] = builder.run(read, bus)
+        return counters[code]
+
+    # The direction the counter moves is taken from the two ends
+    direction = 1 if counter(high) >= counter(low) else -1
+    if (not (direction * counters[low] <= direction * target <=
+             direction * counters[high])):
+        raise ValueError('Target counter 0x' + format(target, 'x') +
+                         ' is outside 0x' + format(counters[low], 'x') +
+                         ' - 0x' + format(counters[high], 'x'))
+    while (high - low > 1):
+        middle = (low + high) // 2
+        if (direction * (counter(middle) - target) < 0):
+            low = middle
+        else:
+            high = middle
+
+    code = min((low, high), key=lambda c: abs(counters[c] - target))
+    if (code != last[0]):
+        write(code)
+    return code, counters[code], len(counters)
+
+
+def search_current(builder, measure, bus=None, low=0, high=REGISTER_MASK,
+                   settle=0.0):
+    # Golden-section search of tx_current_calib (SRB) for the code with the
+    # highest measure(code), called once the code has been written and
+    # settled, and return (code, score, trials)
+    bus = builder.require_bus(bus)
+    write = _trial(builder, bus, Constants.RegAddrTXCurrentCalib, settle)
+    scores = {}
+    last = [None]
+
+    def score(code):
+        if (code not in scores):
+            write(code)
+            last[0] = code
+            scores[code] = measure(code)
+        return scores[code]
+
+    while (high - low > 2):
+        step = int(round((high - low) * _INVERSE_PHI))
+        left = high - step
+        right = low + step
+        if (score(left) >= score(right)):
+            high = right
+        else:
+            low = left
+
+    code = max(range(low, high + 1), key=score)
+    if (code != last[0]):
+        write(code)
+    return code, scores[code], len(scores)
+
+
+def calibrate(builder, target, measure=None, bus=None, limit_margin=None,
+              settings=None, commit=True, settle=0.0):
+    # Calibrate the transmitter of the builder's device and return a
+    # CalibrationResult. The current is searched first (when a measure is
+    # given), then the frequency for the target tx counter reading. With
+    # limit_margin the TX frequency lower and upper limits are set that many
+    # counts either side of the reading. settings is a {field name: value}
+    # profile (e.g. r1_gain) committed along with the codes. The result
+    # is applied to the SRB and, with commit, to the NVM in one pass.
+    bus = builder.require_bus(bus)
+    current_code = score = None
+    trials = 0
+    if (measure is not None):
+        current_code, score, trials = search_current(builder, measure, bus,
+                                                     settle=settle)
+    freq_code, counter, freq_trials = search_frequency(builder, target, bus,
+                                                       settle=settle)
+    trials += freq_trials
+
+    profile = dict(settings or {})
+    profile['tx_freq_calib'] = freq_code
+    if (current_code is not None):
+        profile['tx_current_calib'] = current_code
+    if (limit_margin is not None):
+        profile['tx_freq_lower_limit'] = max(counter - limit_margin, 0)
+        profile['tx_freq_upper_limit'] = min(counter + limit_margin,
+                                             REGISTER_MASK)
+
+    use_nvm = builder.uses_nvm
+    try:
+        builder.use_srb().apply_profile(profile, bus)
+        nvm = None
+        if (commit):
+            nvm = builder.use_nvm().apply_profile(profile, bus)
+    finally:
+        if (use_nvm):
+            builder.use_nvm()
+        else:
+            builder.use_srb()
+    return CalibrationResult(freq_code, counter, current_code, score, trials,
+                             nvm)
@@ -0,0 +1,150 @@
+# Bulk counterparts of the scalar address and memory word conversions.
+#
+# Every function takes a whole sequence and returns the same values the scalar
+# function would return for each element. NumPy arrays are converted with
+# array operations and return NumPy arrays (uint8 for addresses and bytes,
+# uint16 for words). Anything else (lists, bytes, array('B'/'H'), memoryviews)
+# is handled without NumPy and returns bytes for byte values and array('H')
+# for words. Inputs must fit their domain: addresses and bytes 0x00 - 0xff,
+# register values 0x000 - 0x7ff and memory words 0x0000 - 0xffff.
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import REGISTER_MASK, to_address
+
+# to_address() and from_address() over every byte, for bytes.translate()
+_NVM_ADDRESSES = bytes(to_address(value, True) for value in range(0x100))
+_SRB_ADDRESSES = bytes(to_address(value, False) for value in range(0x100))
+_DOCUMENTED_ADDRESSES = bytes(value ^ 0b11000000 for value in range(0x100))
+
+
+def _is_numpy(values):
+    return numpy is not None and isinstance(values, numpy.ndarray)
+
+
+def _check(values, limit, kind):
+    if (len(values) and (values.min() < 0 or values.max() > limit)):
+        raise ValueError(kind + ' must be within 0x0 - 0x' +
+                         format(limit, 'x'))
+
+
+def _numpy(values, limit, kind):
+    _check(values, limit, kind)
+    return values.astype(numpy.uint8 if limit == 0xff else numpy.uint16)
+
+
+def _bytes(values):
+    if (isinstance(values, bytes)):
+        return values
+    if (isinstance(values, (bytearray, memoryview, array)) and
+            memoryview(values).format == 'B'):
+        return bytes(values)
+    try:
+        # Wider buffers (e.g. array('H')) are converted element by element,
+        # not copied byte for byte
+        return bytes(list(values))
+    except ValueError:
+        raise ValueError('Bytes must be within 0x0 - 0xff')
+
+
+def _words(values, limit=0xffff, kind='Memory words'):
+    if (isinstance(values, (bytes, bytearray))):
+        # array() would take these as raw machine words
+        values = list(values)
+    try:
+        words = values if isinstance(values, array) and \
+            values.typecode == 'H' else array('H', values)
+    except (OverflowError, TypeError):
+        words = None
+    if (words is None or (limit != 0xffff and len(words) and
+                          max(words) > limit)):
+        raise ValueError(kind + ' must be within 0x0 - 0x' +
+                         format(limit, 'x'))
+    return words
+
+
+def to_addresses(values, use_nvm):
+    # to_address() for every documented address
+    if (_is_numpy(values)):
+        values = _numpy(values, 0xff, 'Addresses')
+        return values | (0b11000000 if use_nvm else 0b11100000)
+    return _bytes(values).translate(_NVM_ADDRESSES if use_nvm
+                                    else _SRB_ADDRESSES)
+
+
+def from_addresses(values):
+    # from_address() for every wire address
+    if (_is_numpy(values)):
+        return _numpy(values, 0xff, 'Addresses') ^ 0b11000000
+    return _bytes(values).translate(_DOCUMENTED_ADDRESSES)
+
+
+def to_memories(values):
+    # to_memory() for every register value
+    if (_is_numpy(values)):
+        values = _numpy(values, REGISTER_MASK, 'Register values')
+        return (values << 5) ^ 0b11111
+    words = _words(values, REGISTER_MASK, 'Register values')
+    return array('H', [(value << 5) ^ 0b11111 for value in words])
+
+
+def from_memories(values):
+    # from_memory() for every memory word
+    if (_is_numpy(values)):
+        return _numpy(values, 0xffff, 'Memory words') >> 5
+    return array('H', [value >> 5 for value in _words(values)])
+
+
+def split_words(values):
+    # split_bytes() for every word, flattened into one byte sequence (low
+    # byte first), which is the order the words travel on the wire
+    if (_is_numpy(values)):
+        words = _numpy(values, 0xffff, 'Memory words').astype('<u2')
+        return words.view(numpy.uint8)
+    words = _words(values)
+    if (sys.byteorder == 'big'):
+        words = array('H', words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def join_words(left, right):
+    # join_bytes(left, right) for every pair of high and low bytes
+    if (_is_numpy(left) or _is_numpy(right)):
+        left = _numpy(numpy.asarray(left), 0xff, 'Bytes')
+        right = _numpy(numpy.asarray(right), 0xff, 'Bytes')
+        return (left.astype(numpy.uint16) << 8) ^ right
+    left = _bytes(left)
+    right = _bytes(right)
+    if (len(left) != len(right)):
+        raise ValueError('Cannot join ' + str(len(left)) + ' high bytes ' +
+                         'with ' + str(len(right)) + ' low bytes')
+    return array('H', [(high << 8) ^ low for high, low in zip(left, right)])
+
+
+def encode_words(values):
+    # Register values to wire bytes: to_memory() and split_bytes() of each
+    return split_words(to_memories(values))
+
+
+def decode_words(data):
+    # Wire bytes (low byte first, as read from the bus) to register values:
+    # from_memory(join_bytes(high, low)) of each pair
+    if (_is_numpy(data)):
+        data = _numpy(data, 0xff, 'Bytes')
+        if (len(data) % 2):
+            raise ValueError('Wire data must hold whole 2 byte words')
+        return data.view('<u2').astype(numpy.uint16) >> 5
+    data = _bytes(data)
+    if (len(data) % 2):
+        raise ValueError('Wire data must hold whole 2 byte words')
+    words = array('H')
+    words.frombytes(data)
+    if (sys.byteorder == 'big'):
+        words.byteswap()
+    return array('H', [word >> 5 for word in words])
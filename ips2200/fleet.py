@@ -0,0 +1,190 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import (I2CBuilder, Plan, CACHE_WRITE_BACK, _collect,
+               _shape_results)
+
+
+class FleetResult():
+    # Outcome of running a plan on one device
+    def __init__(self, bus, device_address, value=None, error=None,
+                 elapsed=0.0):
+        self.bus = bus
+        self.device_address = device_address
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        outcome = repr(self.value) if self.ok else repr(self.error)
+        return ('FleetResult(0x' + format(self.device_address, 'x') + ', ' +
+                outcome + ', ' + format(self.elapsed, '.6f') + 's)')
+
+
+class FleetReport():
+    # Results of one Fleet.run(), in the same order as the fleet's targets
+    def __init__(self, results, elapsed, bus_elapsed):
+        self.results = results
+        self.elapsed = elapsed
+        # Wall time spent on each bus, in the order the buses first appear
+        self.bus_elapsed = bus_elapsed
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __getitem__(self, index):
+        return self.results[index]
+
+    @property
+    def ok(self):
+        return all(result.ok for result in self.results)
+
+    def errors(self):
+        return [result for result in self.results if not result.ok]
+
+    def values(self):
+        return [result.value for result in self.results]
+
+
+class Fleet():
+    # Run the same operations on many devices spread across many buses.
+    #
+    # Targets are (bus, device_address) pairs. There is one worker thread per
+    # physical bus: devices on the same bus are driven one after another,
+    # while different buses run in parallel, so a run takes roughly as long
+    # as the busiest bus rather than the sum of all devices. Each target keeps
+    # its own I2CBuilder (and so its own shadow registers) across runs.
+    #
+    # When the builders track NVM program cycles (nvm_program_time), plans
+    # are interleaved: a device keeps the bus until a step leaves it
+    # programming NVM, then the bus moves on to the next device that is
+    # ready instead of idling, and only sleeps when every device is busy.
+    def __init__(self, targets, builder_class=I2CBuilder, **builder_options):
+        self._targets = list(targets)
+        self._builders = [builder_class(device_address, bus, **builder_options)
+                          for bus, device_address in self._targets]
+        self._buses = []
+        for bus, _ in self._targets:
+            if (not any(bus is known for known in self._buses)):
+                self._buses.append(bus)
+
+    @property
+    def targets(self):
+        return list(self._targets)
+
+    @property
+    def buses(self):
+        return list(self._buses)
+
+    def builder(self, bus, device_address):
+        # Return the builder used for one target
+        for i, (target_bus, target_address) in enumerate(self._targets):
+            if (target_bus is bus and target_address == device_address):
+                return self._builders[i]
+        raise KeyError('No target 0x' + format(device_address, 'x') +
+                       ' on the provided bus')
+
+    def _indexes_on(self, bus):
+        return [i for i, (target_bus, _) in enumerate(self._targets)
+                if target_bus is bus]
+
+    def _run_one(self, index, operation):
+        bus, device_address = self._targets[index]
+        builder = self._builders[index]
+        # Writes carry no device address, so buses that route them (such as
+        # the simulator) are pointed at the device first
+        select = getattr(bus, 'select', None)
+        start = time.perf_counter()
+        try:
+            if (select is not None):
+                select(device_address)
+            if (isinstance(operation, Plan)):
+                value = builder.run(operation)
+            else:
+                value = operation(builder)
+            error = None
+        except Exception as err:
+            value = None
+            error = err
+        elapsed = time.perf_counter() - start
+        return FleetResult(bus, device_address, value, error, elapsed)
+
+    def _run_bus(self, bus, operation, results):
+        start = time.perf_counter()
+        indexes = self._indexes_on(bus)
+        if (isinstance(operation, Plan) and
+                any(self._builders[i].nvm_program_time is not None
+                    for i in indexes)):
+            self._interleave(bus, indexes, operation, results)
+        else:
+            for index in indexes:
+                results[index] = self._run_one(index, operation)
+        return time.perf_counter() - start
+
+    def _interleave(self, bus, indexes, plan, results):
+        # Run a plan on every device of one bus, switching devices while one
+        # is programming NVM
+        clock = getattr(bus, 'monotonic', time.monotonic)
+        sleep = getattr(bus, 'sleep', time.sleep)
+        select = getattr(bus, 'select', None)
+        steps = plan.steps
+        positions = {index: 0 for index in indexes}
+        values = {index: [] for index in indexes}
+        started = {}
+        current = None
+        while positions:
+            now = clock()
+            ready = [index for index in positions
+                     if self._builders[index].busy_until <= now]
+            if (not ready):
+                sleep(min(self._builders[index].busy_until
+                          for index in positions) - now)
+                continue
+            index = current if current in ready else ready[0]
+            started.setdefault(index, time.perf_counter())
+            builder = self._builders[index]
+            try:
+                if (index != current and select is not None):
+                    # Writes carry no device address, so tell buses that
+                    # route them which device the next transactions are for
+                    select(self._targets[index][1])
+                current = index
+                position = positions[index]
+                if (position < len(steps)):
+                    step = steps[position]
+                    _collect(values[index], step, builder.run_step(step, bus))
+                    positions[index] = position + 1
+                    continue
+                if (builder.cache_policy == CACHE_WRITE_BACK):
+                    builder.flush(bus)
+                value = _shape_results(values[index])
+                error = None
+            except Exception as err:
+                value = None
+                error = err
+            del positions[index]
+            results[index] = FleetResult(
+                bus, self._targets[index][1], value, error,
+                time.perf_counter() - started[index])
+
+    def run(self, operation):
+        # Run a Plan (or a callable that takes the device's builder and
+        # returns its result) on every target and return a FleetReport.
+        # Errors are captured per device and never stop the other devices.
+        results = [None] * len(self._targets)
+        start = time.perf_counter()
+        if (len(self._buses) == 0):
+            return FleetReport(results, 0.0, [])
+
+        with ThreadPoolExecutor(max_workers=len(self._buses)) as pool:
+            futures = [pool.submit(self._run_bus, bus, operation, results)
+                       for bus in self._buses]
+            bus_elapsed = [future.result() for future in futures]
+        return FleetReport(results, time.perf_counter() - start, bus_elapsed)
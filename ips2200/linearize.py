@@ -0,0 +1,244 @@
+# Lookup table correction of the repeatable angle error of an installation.
+#
+# CorrectionTable holds the angle error (measured - true, radians) at size
+# evenly spaced electrical angles over one period, starting at -pi. It is
+# built once from a reference sweep (angles from the device next to angles
+# from a reference encoder) and then corrects any buffer of angles with a
+# linear interpolation between the two nearest entries: one multiply, one
+# floor and two table lookups per sample, or whole array operations for
+# NumPy arrays. The table is periodic, so unwrapped angles can be corrected
+# too.
+#
+# The error depends on the coil settings, so every table carries the key it
+# was measured with: the device address and the R1/R2 coil offset and gain
+# registers. Tables are stored as a small blob that can follow the device's
+# register snapshot (see save() and load()), which checks the key on load.
+#
+# Table layout, little endian:
+#
+#   0   4 bytes  MAGIC
+#   4   1 byte   VERSION
+#   5   1 byte   device address
+#   6   2 bytes  size (number of entries)
+#   8  10 bytes  key register values, in KEY_REGISTERS order
+#  18   2 bytes  reserved (zero)
+#  20   4 bytes  float32 error per entry
+#   .   4 bytes  CRC-32 of everything before it
+import math
+import struct
+import sys
+import zlib
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import Constants
+from .snapshot import SNAPSHOT_SIZE, Snapshot
+
+MAGIC = b'IPSL'
+VERSION = 1
+DEFAULT_SIZE = 256
+TWO_PI = 2 * math.pi
+
+# Registers whose settings change the angle error
+KEY_REGISTERS = (Constants.RegAddrR1CoilOffset,
+                 Constants.RegAddrR2CoilOffset,
+                 Constants.RegAddrR1R2Gain,
+                 Constants.RegAddrR1FineGain,
+                 Constants.RegAddrR2FineGain)
+
+_HEADER = struct.Struct('<4sBBH5Hxx')
+_CRC = struct.Struct('<I')
+
+
+def _wrap(angle):
+    return (angle + math.pi) % TWO_PI - math.pi
+
+
+def key(snapshot):
+    # The (device address, key register values...) a table measured on the
+    # snapshot's device belongs to. The running (SRB) values are used, or
+    # the NVM values when the SRB was not captured.
+    if (not isinstance(snapshot, Snapshot)):
+        snapshot = Snapshot(snapshot)
+    values = []
+    for addr in KEY_REGISTERS:
+        value = snapshot.value(0b100000 | addr)
+        if (value is None):
+            value = snapshot.value(addr)
+        if (value is None):
+            raise ValueError('Snapshot has no value for register 0x' +
+                             format(addr, 'x'))
+        values.append(value)
+    return (snapshot.device_address,) + tuple(values)
+
+
+class CorrectionTable():
+    def __init__(self, errors, key=None):
+        if (len(errors) < 2):
+            raise ValueError('A correction table needs at least 2 entries')
+        # Kept at the precision they are stored with, so a table and its
+        # blob correct alike
+        self.errors = array('f', errors)
+        self.key = key
+        size = len(self.errors)
+        self._scale = size / TWO_PI
+        self._offsets = tuple(self.errors)
+        self._slopes = tuple(self.errors[(i + 1) % size] - self.errors[i]
+                             for i in range(size))
+        self._numpy = None
+
+    def __len__(self):
+        return len(self.errors)
+
+    def __eq__(self, other):
+        if (not isinstance(other, CorrectionTable)):
+            return NotImplemented
+        return self.key == other.key and self.errors == other.errors
+
+    @classmethod
+    def from_sweep(cls, measured, reference, size=DEFAULT_SIZE, key=None):
+        # Build a table from a reference sweep: measured and reference hold
+        # the electrical angle (radians) of the same samples, as read from the
+        # device and from the reference. The errors of the samples nearest to
+        # each entry are averaged; entries without samples are interpolated
+        # from their neighbours.
+        if (len(measured) != len(reference)):
+            raise ValueError('Sample buffers must have the same length')
+        scale = size / TWO_PI
+        if (numpy is not None and (isinstance(measured, numpy.ndarray) or
+                                   isinstance(reference, numpy.ndarray))):
+            angles = numpy.asarray(measured, dtype=numpy.float64)
+            error = numpy.asarray(reference, dtype=numpy.float64)
+            error = (angles - error + math.pi) % TWO_PI - math.pi
+            bins = numpy.round((angles + math.pi) * scale).astype(
+                numpy.int64) % size
+            totals = numpy.bincount(bins, error, size).tolist()
+            counts = numpy.bincount(bins, None, size).tolist()
+        else:
+            totals = [0.0] * size
+            counts = [0] * size
+            for angle, true in zip(measured, reference):
+                i = int(math.floor((angle + math.pi) * scale + 0.5)) % size
+                totals[i] += _wrap(angle - true)
+                counts[i] += 1
+
+        filled = [i for i in range(size) if counts[i]]
+        if (len(filled) < 2):
+            raise ValueError('The sweep must cover at least 2 table entries')
+        errors = [totals[i] / counts[i] if counts[i] else None
+                  for i in range(size)]
+        # Fill the gaps linearly, around the period
+        for k, start in enumerate(filled):
+            end = filled[(k + 1) % len(filled)]
+            gap = (end - start) % size or size
+            for step in range(1, gap):
+                errors[(start + step) % size] = (
+                    errors[start] +
+                    (errors[end] - errors[start]) * step / gap)
+        return cls(errors, key)
+
+    def correct(self, angle):
+        # Correct one angle
+        x = (angle + math.pi) * self._scale
+        i = math.floor(x)
+        return angle - (self._offsets[i % len(self._offsets)] +
+                        (x - i) * self._slopes[i % len(self._slopes)])
+
+    def apply(self, angles):
+        # Correct a buffer of angles; returns a NumPy array for NumPy input
+        # and array('d') otherwise
+        if (numpy is not None and isinstance(angles, numpy.ndarray)):
+            if (self._numpy is None):
+                self._numpy = (numpy.array(self._offsets),
+                               numpy.array(self._slopes))
+            offsets, slopes = self._numpy
+            angles = numpy.asarray(angles, dtype=numpy.float64)
+            x = (angles + math.pi) * self._scale
+            i = numpy.floor(x)
+            index = i.astype(numpy.int64) % len(offsets)
+            return angles - (offsets[index] + (x - i) * slopes[index])
+
+        floor = math.floor
+        pi = math.pi
+        scale = self._scale
+        offsets = self._offsets
+        slopes = self._slopes
+        size = len(offsets)
+        out = array('d', bytes(8 * len(angles)))
+        for n in range(len(angles)):
+            angle = angles[n]
+            x = (angle + pi) * scale
+            i = floor(x)
+            index = i % size
+            out[n] = angle - (offsets[index] + (x - i) * slopes[index])
+        return out
+
+    def check(self, snapshot):
+        # Raise ValueError when the table was measured with other settings
+        # than the snapshot's device is running
+        expected = key(snapshot)
+        if (self.key != expected):
+            raise ValueError('Correction table was measured with ' +
+                             str(self.key) + ', device has ' + str(expected))
+
+    def __bytes__(self):
+        device_address = 0
+        values = (0,) * len(KEY_REGISTERS)
+        if (self.key is not None):
+            device_address = self.key[0]
+            values = self.key[1:]
+        errors = array('f', self.errors)
+        if (sys.byteorder == 'big'):
+            errors.byteswap()
+        blob = (_HEADER.pack(MAGIC, VERSION, device_address,
+                             len(errors), *values) + errors.tobytes())
+        return blob + _CRC.pack(zlib.crc32(blob))
+
+    @classmethod
+    def load(cls, blob):
+        # Read a table back from its blob
+        data = memoryview(blob).cast('B')
+        if (len(data) < _HEADER.size + _CRC.size):
+            raise ValueError('Correction table is truncated')
+        header = _HEADER.unpack_from(data)
+        magic, version, device_address, size = header[:4]
+        if (magic != MAGIC):
+            raise ValueError('Not an IPS2200 correction table')
+        if (version != VERSION):
+            raise ValueError('Unsupported correction table version ' +
+                             str(version))
+        end = _HEADER.size + 4 * size
+        if (len(data) != end + _CRC.size):
+            raise ValueError('Correction table must be ' +
+                             str(end + _CRC.size) + ' bytes but was ' +
+                             str(len(data)))
+        if (_CRC.unpack_from(data, end)[0] != zlib.crc32(data[:end])):
+            raise ValueError('Correction table checksum mismatch')
+        errors = array('f')
+        errors.frombytes(data[_HEADER.size:end])
+        if (sys.byteorder == 'big'):
+            errors.byteswap()
+        return cls(errors, (device_address,) + header[4:])
+
+
+def save(snapshot, table):
+    # One blob holding a register snapshot followed by its correction table.
+    # The table must have been measured with the snapshot's settings.
+    if (not isinstance(snapshot, Snapshot)):
+        snapshot = Snapshot(snapshot)
+    table.check(snapshot)
+    return bytes(snapshot) + bytes(table)
+
+
+def load(blob):
+    # Split a blob written by save() into (Snapshot, CorrectionTable),
+    # checking that they still belong together
+    data = memoryview(blob).cast('B')
+    snapshot = Snapshot(data[:SNAPSHOT_SIZE])
+    table = CorrectionTable.load(data[SNAPSHOT_SIZE:])
+    table.check(snapshot)
+    return snapshot, table
@@ -0,0 +1,163 @@
+from . import READ, from_address
+
+# Number of power of two latency buckets, in microseconds. The last bucket
+# collects everything from about 4 seconds up.
+HISTOGRAM_BUCKETS = 23
+
+
+class LatencyHistogram():
+    # Power of two latency histogram.
+    #
+    # Bucket i counts durations below 2 ** i microseconds (and at least
+    # 2 ** (i - 1)), so adding a sample is a bit_length() and an increment.
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = int(seconds * 1000000).bit_length()
+        if (bucket >= HISTOGRAM_BUCKETS):
+            bucket = HISTOGRAM_BUCKETS - 1
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if (seconds > self.max):
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        # Upper bound, in seconds, of the bucket holding the percentile
+        if (self.count == 0):
+            return 0.0
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if (seen >= rank and count):
+                return (1 << bucket) / 1000000.0
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean_s': self.mean,
+            'max_s': self.max,
+            'p50_s': self.percentile(50),
+            'p99_s': self.percentile(99),
+            'buckets_us': {str(1 << i): count
+                           for i, count in enumerate(self.counts) if count},
+        }
+
+
+class TransactionStats():
+    # Counters and a latency histogram for one device or register
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency = LatencyHistogram()
+
+    def add(self, event, share=1):
+        # Count an event, or 1/share of its bytes and time when it is split
+        # between the share registers of a block transfer
+        if (event.cache_hit):
+            self.cache_hits += 1
+            return
+        if (event.direction == READ):
+            self.reads += 1
+        else:
+            self.writes += 1
+        if (event.error is not None):
+            self.errors += 1
+        self.bytes += event.size // share
+        self.latency.add(event.duration / share)
+
+    @property
+    def hit_rate(self):
+        # Fraction of register reads served without a bus transaction
+        lookups = self.cache_hits + self.reads
+        return self.cache_hits / lookups if lookups else 0.0
+
+    def as_dict(self):
+        return {
+            'reads': self.reads,
+            'writes': self.writes,
+            'cache_hits': self.cache_hits,
+            'hit_rate': self.hit_rate,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'latency': self.latency.as_dict(),
+        }
+
+
+class MetricsCollector():
+    # Observer that aggregates BusEvents per device and per register.
+    #
+    # Register it with add_observer() on an I2CBuilder or SharedBus. Registers
+    # are keyed by documented address (NVM 0x00 - 0x1f, SRB/SFR 0x20 - 0x3f).
+    # Device and total stats count a block read as one transaction; every
+    # register it covers is credited with a read and an even share of its
+    # bytes and latency.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.total = TransactionStats()
+        self._devices = {}
+        self._registers = {}
+
+    def __call__(self, event):
+        self.total.add(event)
+        device = self._devices.get(event.device_address)
+        if (device is None):
+            device = TransactionStats()
+            self._devices[event.device_address] = device
+        device.add(event)
+        count = event.count
+        for addr in range(event.addr, event.addr + count):
+            key = (event.device_address, from_address(addr))
+            register = self._registers.get(key)
+            if (register is None):
+                register = TransactionStats()
+                self._registers[key] = register
+            register.add(event, count)
+
+    def devices(self):
+        return sorted(self._devices, key=lambda addr: (addr is None, addr))
+
+    def device(self, device_address):
+        return self._devices.get(device_address) or TransactionStats()
+
+    def register(self, device_address, addr):
+        # Stats for a documented register address on one device
+        return self._registers.get((device_address, addr)) or \
+            TransactionStats()
+
+    def slowest(self, count=5):
+        # Devices ordered by mean transaction latency, slowest first
+        devices = sorted(self._devices.items(),
+                         key=lambda item: item[1].latency.mean, reverse=True)
+        return [(addr, stats) for addr, stats in devices[:count]]
+
+    def summary(self):
+        def key(addr):
+            return 'None' if addr is None else '0x' + format(addr, 'x')
+
+        return {
+            'total': self.total.as_dict(),
+            'devices': {key(addr): stats.as_dict()
+                        for addr, stats in self._devices.items()},
+            'registers': {key(device) + '/0x' + format(addr, '02x'):
+                          stats.as_dict()
+                          for (device, addr), stats in
+                          sorted(self._registers.items(),
+                                 key=lambda item: (str(item[0][0]),
+                                                   item[0][1]))},
+        }
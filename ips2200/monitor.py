@@ -0,0 +1,152 @@
+import time
+
+from . import (I2CBuilder, Plan, Constants, REGISTER_MASK, _OP_WRITE,
+               to_address)
+
+# How often lines without a wait() method are sampled, in seconds
+POLL_INTERVAL = 0.001
+
+
+class InterruptEvent():
+    # Interrupt state read from one device after IRQN asserted. state_1 and
+    # state_2 are the raw values of the interrupt state SFRs; the same bits
+    # have been cleared on the device. error is the bus error (e.g. a NACK)
+    # that kept the device from being serviced, with the states read before
+    # it (zero when the read itself failed), and None otherwise.
+    def __init__(self, device_address, state_1, state_2, when, error=None):
+        self.device_address = device_address
+        self.state_1 = state_1
+        self.state_2 = state_2
+        self.when = when
+        self.error = error
+
+    def bits(self):
+        # Every set state bit as (state register 1 or 2, bit index)
+        return [(register, bit)
+                for register, state in ((1, self.state_1), (2, self.state_2))
+                for bit in range(11) if state & (1 << bit)]
+
+    def __repr__(self):
+        return ('InterruptEvent(0x' + format(self.device_address, 'x') +
+                ', 0x' + format(self.state_1, '03x') + ', 0x' +
+                format(self.state_2, '03x') +
+                ('' if self.error is None else ', ' + repr(self.error)) + ')')
+
+
+class InterruptMonitor():
+    # Event driven interrupt handling for devices that share one IRQN line.
+    #
+    # configure() enables the interrupt sources and the IRQN output (and
+    # optionally the IRQN watchdog) in the SRB. After that the bus is left
+    # alone until the line asserts: only then are the interrupt state SFRs
+    # of each device read, in one block read per device, the bits that were
+    # seen are cleared, and an InterruptEvent per interrupting device is
+    # passed to the callbacks. A device that fails on the bus is reported
+    # to the on_error() callbacks and the other devices are still serviced.
+    #
+    # line is any object with a digitalio style value (False while IRQN is
+    # asserted, as it is active low). Lines with a wait(timeout) method that
+    # returns True once asserted, like an edge interrupt, are waited on;
+    # other lines are sampled every poll_interval seconds.
+    def __init__(self, line, builders, enable_1=REGISTER_MASK,
+                 enable_2=REGISTER_MASK, watchdog_1=None, watchdog_2=None,
+                 poll_interval=POLL_INTERVAL):
+        if (isinstance(builders, I2CBuilder)):
+            builders = [builders]
+        self.line = line
+        self.builders = list(builders)
+        self.poll_interval = poll_interval
+        self._callbacks = []
+        self._error_callbacks = []
+
+        setup = I2CBuilder(0).use_srb()
+        setup.set_output_interrupt_enable(Constants.On)
+        setup.write_register(Constants.RegAddrInterrupt1Enable, enable_1)
+        setup.write_register(Constants.RegAddrInterrupt2Enable, enable_2)
+        if (watchdog_1 is not None):
+            setup.write_register(Constants.RegAddrIRQNWatchdog1, watchdog_1)
+        if (watchdog_2 is not None):
+            setup.write_register(Constants.RegAddrIRQNWatchdog2, watchdog_2)
+        self._configure = setup.prepare()
+        self._read_state = setup.read_block(
+            Constants.RegAddrInterruptState1, 2).prepare()
+        self._clear_1 = to_address(Constants.RegAddrInterruptClear1, False)
+        self._clear_2 = to_address(Constants.RegAddrInterruptClear2, False)
+
+    def on(self, callback, state_1=REGISTER_MASK, state_2=REGISTER_MASK):
+        # Call callback(event) for events with any of the masked state bits
+        self._callbacks.append((callback, state_1, state_2))
+        return self
+
+    def on_error(self, callback):
+        # Call callback(event) for every device that could not be serviced
+        self._error_callbacks.append(callback)
+        return self
+
+    def configure(self):
+        # Enable the interrupts on every device
+        for builder in self.builders:
+            builder.run(self._configure)
+        return self
+
+    def asserted(self):
+        return not self.line.value
+
+    def wait(self, timeout=None):
+        # Block until IRQN asserts and return True, or False on timeout
+        wait = getattr(self.line, 'wait', None)
+        if (wait is not None):
+            return wait(timeout)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while (not self.asserted()):
+            if (deadline is not None and time.monotonic() >= deadline):
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def service(self):
+        # Read and clear the interrupt state of every device and dispatch the
+        # events. Called after the line asserted; returns the events,
+        # including one with its error set per device that failed.
+        events = []
+        for builder in self.builders:
+            state_1 = state_2 = 0
+            try:
+                state_1, state_2 = builder.run(self._read_state)
+                if (state_1 == 0 and state_2 == 0):
+                    continue
+                # Clear only the bits that were read so none raised
+                # meanwhile are lost
+                clear = []
+                if (state_1):
+                    clear.append((_OP_WRITE, self._clear_1, state_1))
+                if (state_2):
+                    clear.append((_OP_WRITE, self._clear_2, state_2))
+                builder.run(Plan(clear))
+                error = None
+            except OSError as err:
+                error = err
+            events.append(InterruptEvent(builder.device_address, state_1,
+                                         state_2, time.monotonic(), error))
+
+        for event in events:
+            if (event.error is not None):
+                for callback in self._error_callbacks:
+                    callback(event)
+                continue
+            for callback, mask_1, mask_2 in self._callbacks:
+                if (event.state_1 & mask_1 or event.state_2 & mask_2):
+                    callback(event)
+        return events
+
+    def run_once(self, timeout=None):
+        # Wait for one interrupt and service it; [] when none arrived
+        if (not self.wait(timeout)):
+            return []
+        return self.service()
+
+    def run(self, stop, timeout=0.1):
+        # Service interrupts until stop (a threading.Event) is set
+        while (not stop.is_set()):
+            self.run_once(timeout)
@@ -0,0 +1,224 @@
+# Bulk decoding of the quadrature (ABN / AB) output modes.
+#
+# QuadratureDecoder takes chunks of sampled A, B (and N) line levels and
+# keeps a x4 position count: every valid A/B transition counts one step,
+# forward when A leads B. A change of both lines between two samples cannot
+# be decoded (an edge was missed) and is counted as illegal; a step that is
+# undone on the very next sample is counted as a glitch. In ABN mode a rising
+# edge on N resets the count to index_position. All state carries over from
+# one chunk to the next. NumPy arrays are decoded with array operations,
+# other sequences sample by sample.
+#
+# With QuadModeDoublePulse the A output is assumed to carry A XOR B, which
+# gives two pulses per A period; the decoder XORs B back out before counting.
+# Only the default (0) quad_mode is decoded; configurations with quad_mode set
+# are refused rather than counted wrong.
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import I2CBuilder, Constants
+
+# Step for each (previous state << 2 | state), with state = A << 1 | B and
+# the forward sequence 00, 10, 11, 01. Transitions that change both lines
+# are marked with _ILLEGAL.
+_ILLEGAL = 2
+_STEPS = (0, -1, 1, _ILLEGAL,
+          1, 0, _ILLEGAL, -1,
+          -1, _ILLEGAL, 0, 1,
+          _ILLEGAL, 1, -1, 0)
+_STEP_VALUES = tuple(0 if step == _ILLEGAL else step for step in _STEPS)
+
+if (numpy is not None):
+    _NUMPY_STEPS = numpy.array(_STEP_VALUES, dtype=numpy.int64)
+    _NUMPY_ILLEGAL = numpy.array([step == _ILLEGAL for step in _STEPS])
+
+
+class QuadratureChunk():
+    # Result of decoding one chunk. positions holds the count after every
+    # sample, velocity is the net count change per second across the chunk
+    # (None when the chunk has no duration), and index, illegal and glitches
+    # count the events within the chunk.
+    def __init__(self, positions, velocity, index, illegal, glitches):
+        self.positions = positions
+        self.velocity = velocity
+        self.index = index
+        self.illegal = illegal
+        self.glitches = glitches
+
+    @property
+    def position(self):
+        return self.positions[-1] if len(self.positions) else None
+
+
+class QuadratureDecoder():
+    # sample_rate (Hz) times the samples of chunks that come without
+    # timestamps. Chunks may instead pass times, one timestamp in seconds per
+    # sample, e.g. from an edge capturing logic analyser.
+    def __init__(self, index=True, double_pulse=False, sample_rate=None,
+                 index_position=0):
+        self.index = index
+        self.double_pulse = double_pulse
+        self.sample_rate = sample_rate
+        self.index_position = index_position
+        self.reset()
+
+    @classmethod
+    def from_config(cls, config, **options):
+        # Build a decoder for a decoded configuration (see read_config)
+        mode = config['output_mode']
+        if (mode not in (Constants.OutputModeQuadABN,
+                         Constants.OutputModeQuadAB)):
+            raise ValueError('Output mode ' + str(mode) + ' is not a ' +
+                             'quadrature mode')
+        if (config['quad_mode'] != 0):
+            raise ValueError('Quad mode ' + str(config['quad_mode']) +
+                             ' is not supported by the decoder')
+        return cls(index=mode == Constants.OutputModeQuadABN,
+                   double_pulse=(config['quad_mode_xor'] ==
+                                 Constants.QuadModeDoublePulse),
+                   **options)
+
+    @classmethod
+    def from_builder(cls, builder, bus=None, **options):
+        # Build a decoder for the configuration a device is running (its SRB)
+        plan = (I2CBuilder(0).get_output_mode().get_quad_mode()
+                .get_quad_mode_xor().prepare())
+        mode, quad_mode, xor = builder.run(plan, bus)
+        return cls.from_config({'output_mode': mode, 'quad_mode': quad_mode,
+                                'quad_mode_xor': xor}, **options)
+
+    def reset(self, position=0):
+        self.position = position
+        self.index_count = 0
+        self.illegal = 0
+        self.glitches = 0
+        self._state = None
+        self._n = None
+        self._step = 0
+        self._time = None
+
+    def _duration(self, count, times):
+        # Seconds covered by a chunk, from the end of the previous one
+        if (times is not None):
+            start = self._time if self._time is not None else times[0]
+            self._time = times[-1]
+            return times[-1] - start
+        if (self.sample_rate):
+            return count / self.sample_rate
+        return None
+
+    def process(self, a, b, n=None, times=None):
+        # Decode one chunk of samples and return a QuadratureChunk
+        if (n is not None and not self.index):
+            raise ValueError('QuadAB mode has no index line')
+        count = len(a)
+        if (len(b) != count or (n is not None and len(n) != count) or
+                (times is not None and len(times) != count)):
+            raise ValueError('Sample buffers must have the same length')
+        if (count == 0):
+            positions = array('q')
+            net = index = illegal = glitches = 0
+        elif (numpy is not None and isinstance(a, numpy.ndarray)):
+            positions, net, index, illegal, glitches = \
+                self._process_numpy(a, b, n)
+        else:
+            positions, net, index, illegal, glitches = \
+                self._process_python(a, b, n)
+
+        # Velocity from the net steps, so index resets do not show up as
+        # jumps
+        duration = self._duration(count, times) if count else None
+        velocity = net / duration if duration else None
+        self.index_count += index
+        self.illegal += illegal
+        self.glitches += glitches
+        return QuadratureChunk(positions, velocity, index, illegal, glitches)
+
+    def _process_numpy(self, a, b, n):
+        a = numpy.asarray(a, dtype=numpy.int64) & 1
+        b = numpy.asarray(b, dtype=numpy.int64) & 1
+        if (self.double_pulse):
+            a = a ^ b
+        states = (a << 1) | b
+        first = self._state if self._state is not None else states[0]
+        previous = numpy.concatenate(([first], states[:-1]))
+        transitions = (previous << 2) | states
+        steps = _NUMPY_STEPS[transitions]
+        illegal = int(numpy.count_nonzero(_NUMPY_ILLEGAL[transitions]))
+
+        # Glitches: a step followed by the opposite step on the next sample
+        before = numpy.concatenate(([self._step], steps[:-1]))
+        glitches = int(numpy.count_nonzero((steps != 0) &
+                                           (steps == -before)))
+
+        positions = self.position + numpy.cumsum(steps)
+        index = 0
+        if (n is not None):
+            n = numpy.asarray(n, dtype=numpy.int64) & 1
+            last_n = self._n if self._n is not None else n[0]
+            rising = (n == 1) & (numpy.concatenate(([last_n], n[:-1])) == 0)
+            index = int(numpy.count_nonzero(rising))
+            if (index):
+                # Rebase everything after the latest index edge at or before
+                # each sample
+                marks = numpy.where(rising, numpy.arange(len(n)), -1)
+                latest = numpy.maximum.accumulate(marks)
+                after = latest >= 0
+                positions[after] = (positions[after] -
+                                    positions[latest[after]] +
+                                    self.index_position)
+            self._n = int(n[-1])
+
+        self._state = int(states[-1])
+        self._step = int(steps[-1])
+        self.position = int(positions[-1])
+        return positions, int(steps.sum()), index, illegal, glitches
+
+    def _process_python(self, a, b, n):
+        positions = array('q', bytes(8 * len(a)))
+        double_pulse = self.double_pulse
+        index_position = self.index_position
+        position = self.position
+        state = self._state
+        last_step = self._step
+        last_n = self._n
+        net = index = illegal = glitches = 0
+        for i in range(len(a)):
+            level_b = b[i] & 1
+            level_a = a[i] & 1
+            if (double_pulse):
+                level_a ^= level_b
+            current = (level_a << 1) | level_b
+            step = _STEPS[((state if state is not None else current) << 2) |
+                          current]
+            if (step == _ILLEGAL):
+                illegal += 1
+                step = 0
+            elif (step and step == -last_step):
+                glitches += 1
+            position += step
+            net += step
+            if (n is not None):
+                level_n = n[i] & 1
+                if (level_n and last_n == 0):
+                    index += 1
+                    position = index_position
+                last_n = level_n
+            positions[i] = position
+            state = current
+            last_step = step
+        self._state = state
+        self._step = last_step
+        self._n = last_n
+        self.position = position
+        return positions, net, index, illegal, glitches
+
+    def stream(self, chunks):
+        # Generator over (a, b), (a, b, n) or (a, b, n, times) chunks that
+        # yields the QuadratureChunk of each
+        for chunk in chunks:
+            yield self.process(*chunk)
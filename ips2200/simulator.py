@@ -0,0 +1,338 @@
+import threading
+import time
+from array import array
+
+from . import (DEFAULT_DEVICE_ADDRESS, NVM_PROGRAM_TIME, REGISTER_MASK,
+               REGISTERS, REG_READ_ONLY, REG_WRITE_ONLY, Constants, to_memory)
+
+# Standard I2C bus clock frequencies in Hz
+BUS_100KHZ = 100000
+BUS_400KHZ = 400000
+BUS_1MHZ = 1000000
+
+# Register values after reset, as listed in the Programming Guide
+RESET_VALUES = {
+    Constants.RegAddrSystemConfig1: 0x0323,
+    Constants.RegAddrSystemConfig2: 0x0101,
+    Constants.RegAddrR1R2Gain: 0x0056,
+    Constants.RegAddrTXCurrentCalib: 0x00be,
+}
+
+
+class TimingModel():
+    # Bus and device timing for the simulator.
+    #
+    # Every byte on the wire costs 9 clocks (8 data bits and an ACK) plus one
+    # clock each for START, repeated START and STOP conditions. A register
+    # read is [dev+W, reg, RESTART, dev+R, data...], a write is
+    # [dev+W, reg, data...]. When realtime is True the simulator also sleeps
+    # for the modelled duration.
+    def __init__(self, frequency=BUS_100KHZ, nvm_program_time=NVM_PROGRAM_TIME,
+                 realtime=False):
+        self.frequency = frequency
+        self.nvm_program_time = nvm_program_time
+        self.realtime = realtime
+
+    def read_time(self, count):
+        # Duration of a read transaction returning count bytes
+        return (9 * (3 + count) + 3) / self.frequency
+
+    def write_time(self, count):
+        # Duration of a write transaction carrying count data bytes
+        return (9 * (2 + count) + 2) / self.frequency
+
+
+class TXModel():
+    # Transmitter response to the SRB calibration codes.
+    #
+    # counter() is the tx_counter_state reading for a tx_freq_calib code: it
+    # moves linearly by counts_per_code from count_at_zero (either way, as
+    # the sign of counts_per_code says) and is clipped to the register.
+    # amplitude() is the coil amplitude for a tx_current_calib code, which
+    # peaks at best_current and falls off on both sides as the drive
+    # starves or saturates; it has no register and is measured off chip.
+    def __init__(self, count_at_zero=0x100, counts_per_code=0.5,
+                 best_current=0x200, width=0x100):
+        self.count_at_zero = count_at_zero
+        self.counts_per_code = counts_per_code
+        self.best_current = best_current
+        self.width = width
+
+    def counter(self, freq_code):
+        count = int(round(self.count_at_zero +
+                          self.counts_per_code * freq_code))
+        return min(max(count, 0), REGISTER_MASK)
+
+    def amplitude(self, current_code):
+        return 1 / (1 + ((current_code - self.best_current) /
+                         self.width) ** 2)
+
+
+class IRQNLine():
+    # A GPIO stand-in for the open drain, active low IRQN line.
+    #
+    # value follows digitalio: True while the line idles high and False
+    # while any device pulls it low. wait() blocks until the line asserts,
+    # like an edge interrupt would, so monitors do not have to spin on it.
+    # Several devices may share one line (wired-OR).
+    def __init__(self):
+        self._pulling = set()
+        self._asserted = threading.Event()
+
+    @property
+    def value(self):
+        return not self._asserted.is_set()
+
+    def pull(self, source, low):
+        # Let a device (or a test) pull the line low or release it
+        if (low):
+            self._pulling.add(source)
+            self._asserted.set()
+        else:
+            self._pulling.discard(source)
+            if (not self._pulling):
+                self._asserted.clear()
+
+    def wait(self, timeout=None):
+        # Return True once the line is asserted, False on timeout
+        return self._asserted.wait(timeout)
+
+
+class IPS2200Simulator():
+    # A single simulated IPS2200.
+    #
+    # Register values are kept in a 64 entry array indexed by documented
+    # address: 0x00 - 0x1f is NVM and 0x20 - 0x3f the SRB/SFR space, which is
+    # also the low 6 bits of the wire address. The NVM and SRB copies of a
+    # configuration register are independent until reset() reloads the SRB
+    # from NVM. Write-only SFRs read as zero, writes to read-only SFRs are
+    # ignored, and writing the interrupt clear registers clears the matching
+    # interrupt state bits.
+    #
+    # Changing the I2C address field of the SRB system configuration moves the
+    # device to a new bus address; the simulator assumes the field supplies
+    # the low four bits of the 7 bit address.
+    #
+    # Interrupts are raised with raise_interrupt(). The device pulls its IRQN
+    # line low while the output interrupt is enabled and an interrupt state
+    # bit is set whose interrupt enable bit is set as well.
+    #
+    # With a TXModel as tx, reads of the transmitter counter SFR follow the
+    # SRB tx_freq_calib code.
+    def __init__(self, device_address=DEFAULT_DEVICE_ADDRESS, values=None,
+                 registers=REGISTERS, irqn=None, tx=None):
+        self.address = device_address
+        self.irqn = irqn
+        self.tx = tx
+        self._registers = registers
+        self._values = array('H', bytes(2 * 0x40))
+        for addr, value in (values or RESET_VALUES).items():
+            self._values[addr] = value
+            if (addr < 0x20):
+                self._values[addr + 0x20] = value
+        # Simulated time until which an NVM program cycle is running
+        self.busy_until = 0.0
+        self.reads = 0
+        self.writes = 0
+        self.ignored_writes = 0
+
+    def peek(self, addr):
+        # Return a register value by documented address, ignoring access rules
+        return self._values[addr]
+
+    def poke(self, addr, value):
+        # Set a register value by documented address, ignoring access rules
+        self._values[addr] = value
+
+    def reset(self):
+        # Power cycle: reload every SRB configuration register from NVM and
+        # clear the SFRs
+        for addr in range(0x20):
+            self._values[addr + 0x20] = self._values[addr]
+        for addr in range(Constants.RegAddrInterruptClear1, 0x40):
+            self._values[addr] = 0
+        self.busy_until = 0.0
+        self._update_irqn()
+
+    def raise_interrupt(self, state_1=0, state_2=0):
+        # Set interrupt state bits, as a fault or event on the device would
+        self._values[Constants.RegAddrInterruptState1] |= state_1
+        self._values[Constants.RegAddrInterruptState2] |= state_2
+        self._update_irqn()
+
+    def _update_irqn(self):
+        if (self.irqn is None):
+            return
+        values = self._values
+        enabled = values[Constants.RegAddrSystemConfig2 + 0x20] & (
+            1 << Constants._OutputInterruptEnable[1])
+        pending = ((values[Constants.RegAddrInterruptState1] &
+                    values[Constants.RegAddrInterrupt1Enable + 0x20]) or
+                   (values[Constants.RegAddrInterruptState2] &
+                    values[Constants.RegAddrInterrupt2Enable + 0x20]))
+        self.irqn.pull(self, bool(enabled and pending))
+
+    def read_word(self, wire):
+        # Return the 16 bit wire word for a register read
+        self.reads += 1
+        if (self._registers.flags(wire) & REG_WRITE_ONLY):
+            return to_memory(0)
+        if (self.tx is not None and
+                wire & 0x3f == Constants.RegAddrTXCounterState):
+            self._values[Constants.RegAddrTXCounterState] = self.tx.counter(
+                self._values[Constants.RegAddrTXFreqCalib + 0x20])
+        return to_memory(self._values[wire & 0x3f])
+
+    def write_word(self, wire, word):
+        # Apply a 16 bit wire word written to a register
+        self.writes += 1
+        flags = self._registers.flags(wire)
+        addr = wire & 0x3f
+        value = word >> 5
+        if (flags & REG_READ_ONLY):
+            self.ignored_writes += 1
+            return
+        if (addr == Constants.RegAddrInterruptClear1 or
+                addr == Constants.RegAddrInterruptClear2):
+            state = addr + 2
+            self._values[state] = self._values[state] & ~value
+            self._update_irqn()
+            return
+        if (addr == Constants.RegAddrSystemConfig1 + 0x20):
+            field = (value >> 4) & 0b1111
+            if (field != (self._values[addr] >> 4) & 0b1111):
+                self.address = (self.address & ~0b1111) | field
+        self._values[addr] = value
+        self._update_irqn()
+
+    def is_nvm(self, wire):
+        return wire & 0b100000 == 0
+
+
+class SimulatedI2C():
+    # A simulated I2C bus with any number of IPS2200Simulator devices.
+    #
+    # It implements the write_readinto()/write() interface I2CBuilder uses,
+    # including auto-incrementing block reads and writes, and counts
+    # transactions, bytes and modelled bus time. Reads are routed by the
+    # device address in out_buffer[0]. write(addr, parts) carries no device
+    # address, so it goes to the device addressed by the previous read (or
+    # select()), which is the only device when there is just one.
+    #
+    # Transactions to a device that is still programming NVM either wait for
+    # it, advancing the simulated clock, or raise OSError like a NACK when
+    # nack_while_busy is set.
+    def __init__(self, devices=None, timing=None, auto_increment=True,
+                 nack_while_busy=False):
+        if (devices is None):
+            devices = [IPS2200Simulator()]
+        elif (isinstance(devices, IPS2200Simulator)):
+            devices = [devices]
+        self._devices = {}
+        for device in devices:
+            self.attach(device)
+        self._selected = devices[0] if len(devices) == 1 else None
+        self.timing = timing or TimingModel()
+        self.auto_increment = auto_increment
+        self.nack_while_busy = nack_while_busy
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.reads = 0
+        self.writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        # Modelled time spent transferring, and idle waiting on NVM programs
+        self.bus_time = 0.0
+        self.wait_time = 0.0
+        self.now = 0.0
+
+    def attach(self, device):
+        self._devices[device.address] = device
+        return device
+
+    def device(self, device_address):
+        return self._devices[device_address]
+
+    @property
+    def devices(self):
+        return list(self._devices.values())
+
+    def select(self, device_address):
+        # Direct the following write() calls at a device
+        self._selected = self._device(device_address)
+
+    def tick(self, seconds):
+        # Let simulated time pass with the bus idle
+        self.now += seconds
+
+    def monotonic(self):
+        # The simulated clock, used by builders to track NVM program cycles
+        return self.now
+
+    def sleep(self, seconds):
+        # A driver waiting out an NVM program cycle: the bus idles in
+        # simulated time, which counts as waiting
+        if (seconds > 0):
+            self.wait_time += seconds
+            self.tick(seconds)
+            if (self.timing.realtime):
+                time.sleep(seconds)
+
+    def _device(self, device_address):
+        device = self._devices.get(device_address)
+        if (device is None):
+            raise OSError('No device at 0x' + format(device_address, 'x'))
+        return device
+
+    def _wait_ready(self, device):
+        if (device.busy_until <= self.now):
+            return
+        if (self.nack_while_busy):
+            raise OSError('Device 0x' + format(device.address, 'x') +
+                          ' is programming NVM')
+        self.wait_time += device.busy_until - self.now
+        self.now = device.busy_until
+
+    def _spend(self, duration):
+        self.bus_time += duration
+        self.now += duration
+        if (self.timing.realtime):
+            time.sleep(duration)
+
+    def write_readinto(self, out_buffer, in_buffer):
+        device = self._device(out_buffer[0])
+        self._selected = device
+        self._wait_ready(device)
+        wire = out_buffer[1]
+        count = len(in_buffer) if self.auto_increment else 2
+        for offset in range(0, count, 2):
+            word = device.read_word(wire + (offset >> 1))
+            in_buffer[offset] = word & 0xff
+            in_buffer[offset + 1] = word >> 8
+        self.transactions += 1
+        self.reads += 1
+        self.bytes_read += count
+        self._spend(self.timing.read_time(count))
+
+    def write(self, addr, value):
+        device = self._selected
+        if (device is None):
+            raise OSError('No device selected for write to 0x' +
+                          format(addr, 'x'))
+        self._wait_ready(device)
+        count = len(value) if self.auto_increment else 2
+        previous = device.address
+        for offset in range(0, count, 2):
+            device.write_word(addr + (offset >> 1),
+                              value[offset] | (value[offset + 1] << 8))
+        self.transactions += 1
+        self.writes += 1
+        self.bytes_written += count
+        self._spend(self.timing.write_time(count))
+        if (device.is_nvm(addr)):
+            device.busy_until = self.now + self.timing.nvm_program_time
+        if (device.address != previous):
+            del self._devices[previous]
+            self._devices[device.address] = device
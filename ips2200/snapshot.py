@@ -0,0 +1,172 @@
+import struct
+import zlib
+
+from . import (Plan, REGISTER_MASK, REG_READ_ONLY, REG_VOLATILE,
+               REG_WRITE_ONLY, _OP_READ_BLOCK, from_address, to_memory)
+
+# Snapshot layout, little endian:
+#
+#   0   4 bytes  MAGIC
+#   4   1 byte   VERSION
+#   5   1 byte   device address
+#   6   2 bytes  reserved (zero)
+#   8 128 bytes  one wire word per documented address 0x00 - 0x3f, i.e.
+#                the NVM space followed by the SRB/SFR space: the decoded
+#                register value encoded the way it is written to the device
+#                (value << 5 ^ 0x1f, low byte first). The low 5 bits are
+#                rebuilt, not the bits the device sent with the value.
+# 136   4 bytes  CRC-32 of bytes 0 - 135
+#
+# Registers that were not read (unmapped or write-only) hold a zero word,
+# which no register read can produce, so the layout is fixed and any register
+# can be found at IMAGE_OFFSET + 2 * address without parsing.
+MAGIC = b'IPS2'
+VERSION = 1
+IMAGE_OFFSET = 8
+IMAGE_SIZE = 2 * 0x40
+SNAPSHOT_SIZE = IMAGE_OFFSET + IMAGE_SIZE + 4
+
+_HEADER = struct.Struct('<4sBBxx')
+_CRC = struct.Struct('<I')
+
+
+def pack(device_address, values):
+    # Build a snapshot blob from a {documented address: value} dict
+    blob = bytearray(SNAPSHOT_SIZE)
+    _HEADER.pack_into(blob, 0, MAGIC, VERSION, device_address)
+    for addr, value in values.items():
+        if (not 0 <= addr < 0x40):
+            raise ValueError('Address 0x' + format(addr, 'x') +
+                             ' is outside the snapshot image')
+        struct.pack_into('<H', blob, IMAGE_OFFSET + 2 * addr, to_memory(value))
+    _CRC.pack_into(blob, SNAPSHOT_SIZE - 4, zlib.crc32(blob[:-4]))
+    return bytes(blob)
+
+
+class Snapshot():
+    # A validated, read-only view of a snapshot blob.
+    #
+    # blob may be any bytes-like object, including a slice of a memory map
+    # holding many snapshots back to back, and is not copied.
+    def __init__(self, blob):
+        data = memoryview(blob).cast('B')
+        if (len(data) != SNAPSHOT_SIZE):
+            raise ValueError('Snapshot must be ' + str(SNAPSHOT_SIZE) +
+                             ' bytes but was ' + str(len(data)))
+        magic, version, device_address = _HEADER.unpack_from(data)
+        if (magic != MAGIC):
+            raise ValueError('Not an IPS2200 snapshot')
+        if (version != VERSION):
+            raise ValueError('Unsupported snapshot version ' + str(version))
+        if (_CRC.unpack_from(data, SNAPSHOT_SIZE - 4)[0] !=
+                zlib.crc32(data[:-4])):
+            raise ValueError('Snapshot checksum mismatch')
+        self._data = data
+        self.device_address = device_address
+
+    def __bytes__(self):
+        return bytes(self._data)
+
+    def __len__(self):
+        return SNAPSHOT_SIZE
+
+    def __eq__(self, other):
+        if (not isinstance(other, Snapshot)):
+            return NotImplemented
+        return self._data == other._data
+
+    @property
+    def image(self):
+        # The raw register words, without header and checksum
+        return self._data[IMAGE_OFFSET:IMAGE_OFFSET + IMAGE_SIZE]
+
+    def value(self, addr):
+        # Return a register value by documented address, or None when the
+        # register was not captured
+        word = struct.unpack_from('<H', self._data, IMAGE_OFFSET + 2 * addr)[0]
+        return word >> 5 if word else None
+
+    def registers(self):
+        # Every captured register as {documented address: value}
+        words = struct.unpack_from('<64H', self._data, IMAGE_OFFSET)
+        return {addr: word >> 5 for addr, word in enumerate(words) if word}
+
+    def diff(self, other):
+        # Return {address: (other value, this value)} for every register
+        # that differs from another snapshot
+        if (self.image == other.image):
+            return {}
+        mine = self.registers()
+        theirs = other.registers()
+        changes = {}
+        for addr in sorted(set(mine) | set(theirs)):
+            if (mine.get(addr) != theirs.get(addr)):
+                changes[addr] = (theirs.get(addr), mine.get(addr))
+        return changes
+
+
+def _spans(registers):
+    # One (wire start, count) block per space, covering every register in
+    # the map that can be read
+    wires = sorted(wire for register in registers.registers()
+                   if not register.write_only
+                   for wire in register.wire_addresses())
+    spans = []
+    for space in (0b11000000, 0b11100000):
+        inside = [wire for wire in wires if wire & 0b11100000 == space]
+        if (inside):
+            spans.append((inside[0], inside[-1] - inside[0] + 1))
+    return spans
+
+
+def snapshot(builder, bus=None):
+    # Capture the NVM and SRB/SFR registers of the builder's device as a
+    # Snapshot, with one block read per space when the bus auto-increments.
+    # Values the builder has shadowed are not read again.
+    spans = _spans(builder.registers)
+    values = builder.run(Plan([(_OP_READ_BLOCK, start, count)
+                               for start, count in spans]), bus)
+    image = {}
+    index = 0
+    for start, count in spans:
+        for wire in range(start, start + count):
+            if (not builder.registers.flags(wire) & REG_WRITE_ONLY):
+                image[from_address(wire)] = values[index]
+            index += 1
+    return Snapshot(pack(builder.device_address, image))
+
+
+def restore(builder, blob, bus=None, keep_address=True):
+    # Write a snapshot back to the builder's device, NVM and SRB alike, and
+    # return (documented address, old value, new value) for every register
+    # that was written. Only writable configuration registers are restored,
+    # and only those that differ from the device. With keep_address the
+    # device keeps its own I2C address bits, so one snapshot can be cloned
+    # onto many devices.
+    if (not isinstance(blob, Snapshot)):
+        blob = Snapshot(blob)
+    registers = builder.registers
+    keep = None
+    if (keep_address):
+        try:
+            keep = registers.field('i2c_address')
+        except KeyError:
+            keep = None
+
+    pending = {}
+    for register in registers.registers():
+        for wire in register.wire_addresses():
+            if (registers.flags(wire) &
+                    (REG_READ_ONLY | REG_WRITE_ONLY | REG_VOLATILE)):
+                continue
+            value = blob.value(from_address(wire))
+            if (value is None):
+                continue
+            mask = REGISTER_MASK
+            if (keep is not None and keep.addr == register.addr):
+                mask &= ~keep.mask
+            pending[wire] = (mask, value & mask)
+
+    results = builder.apply_masks(pending, bus)
+    return [(from_address(wire), old, new) for wire, old, new in results
+            if old != new]
@@ -0,0 +1,9 @@
+# Verified execution is I2CBuilder.execute_verified(); this module keeps the
+# names it has always provided.
+from . import VERIFY_BACKOFF, VERIFY_RETRIES, VerifyFailure, VerifyReport
+
+
+def execute_verified(builder, bus=None, retries=VERIFY_RETRIES,
+                     backoff=VERIFY_BACKOFF):
+    # Same as builder.execute_verified()
+    return builder.execute_verified(bus, retries, backoff)
@@ -0,0 +1,175 @@
+import asyncio
+import time
+import unittest
+from ips2200 import Constants, CACHE_WRITE_BACK
+from ips2200.aio import AsyncI2CBuilder, ExecutorBus
+from ips2200.simulator import SimulatedI2C, TimingModel
+from ips2200.snapshot import snapshot
+from ips2200.verify import execute_verified
+import tests.fakes.busio as busio
+from tests.ips2200_test import doc_data, generate_sim_data
+
+
+class SlowAsyncBus():
+    # Native async bus that wraps the fake busio and takes delay seconds per
+    # transaction
+    def __init__(self, delay, auto_increment=False):
+        self._i2c = busio.I2C(generate_sim_data(doc_data), auto_increment)
+        self._delay = delay
+        self.auto_increment = auto_increment
+
+    async def write_readinto(self, out_buffer, in_buffer):
+        await asyncio.sleep(self._delay)
+        self._i2c.write_readinto(out_buffer, in_buffer)
+
+    async def write(self, addr, value):
+        await asyncio.sleep(self._delay)
+        self._i2c.write(addr, value)
+
+
+class TestAsyncI2CBuilder(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data))
+        self.bus = ExecutorBus(self.i2c)
+        self.builder = AsyncI2CBuilder(0x18, self.bus)
+
+    async def test_read(self):
+        b = self.builder
+        b.read_register(Constants.RegAddrSystemConfig1)
+        self.assertEqual(await b.execute_async(), 0x323)
+
+    async def test_set_and_read(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.set_spi_data_order(Constants.SpiDataOrderLsb)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.read_register(Constants.RegAddrSystemConfig2)
+        self.assertEqual(await b.execute_async(), [0x72b, 0x101])
+        self.assertEqual(self.i2c.writes, 1)
+        self.assertEqual(b.operations, [])
+
+    async def test_block_read(self):
+        i2c = busio.I2C(generate_sim_data(doc_data), auto_increment=True)
+        b = AsyncI2CBuilder(0x18, ExecutorBus(i2c))
+        b.read_block(Constants.RegAddrSystemConfig1, 3)
+        self.assertEqual(await b.execute_async(), [0x323, 0x101, 0x56])
+        self.assertEqual(i2c.reads, 1)
+
+    async def test_block_read_keeps_pending_write_back(self):
+        bus = SimulatedI2C()
+        b = AsyncI2CBuilder(0x18, ExecutorBus(bus),
+                            cache_policy=CACHE_WRITE_BACK)
+        b.set_quad_mode(Constants.On)
+        b.read_block(0x00, 3)
+        self.assertEqual(await b.execute_async(), [0x323, 0x121, 0x56])
+        self.assertEqual(bus.device(0x18).peek(0x21), 0x121)
+
+    async def test_blocking_calls_are_refused(self):
+        b = self.builder
+        b.read_register(Constants.RegAddrSystemConfig1)
+        with self.assertRaises(TypeError):
+            b.execute()
+        plan = b.prepare()
+        with self.assertRaises(TypeError):
+            b.run(plan)
+        with self.assertRaises(TypeError):
+            plan.run(b)
+        with self.assertRaises(TypeError):
+            b.poll(0x00)
+        with self.assertRaises(TypeError):
+            b.flush()
+        with self.assertRaises(TypeError):
+            b.apply_profile({'output_mode': Constants.OutputModeQuadABN})
+        with self.assertRaises(TypeError):
+            snapshot(b)
+        b.write_register(0x07, 0x12)
+        with self.assertRaises(TypeError):
+            execute_verified(b)
+        with self.assertRaises(TypeError):
+            b.run_step(plan.steps[0])
+        b.clear_operations()
+        # Nothing reached the bus or the shadow
+        self.assertEqual((self.i2c.reads, self.i2c.writes), (0, 0))
+        self.assertEqual(b.shadow.valid_addresses(), [])
+        self.assertEqual(await b.run_async(plan), 0x323)
+
+    async def test_getters(self):
+        i2c = busio.I2C(generate_sim_data(doc_data), auto_increment=True)
+        b = AsyncI2CBuilder(0x18, ExecutorBus(i2c))
+        b.get_output_mode()
+        b.read_config()
+        mode, config = await b.execute_async()
+        self.assertEqual(mode, Constants.OutputModeSinCosNN)
+        self.assertEqual(config['tx_current_calib'], 0xbe)
+        # One read for the getter, three blocks for the configuration
+        self.assertEqual(i2c.reads, 4)
+
+    async def test_apply_profile(self):
+        b = self.builder
+        report = await b.apply_profile_async({
+            'output_mode': Constants.OutputModeQuadABN,
+            'tx_current_calib': 0xbe,
+        })
+        self.assertEqual(report.registers, [(0x20, 0x323, 0x32b)])
+        self.assertEqual(self.i2c.writes, 1)
+
+    async def test_waits_for_nvm_programming(self):
+        bus = SimulatedI2C(timing=TimingModel(nvm_program_time=0.01),
+                           nack_while_busy=True)
+        b = AsyncI2CBuilder(0x18, ExecutorBus(bus), nvm_program_time=0.01)
+        b.use_nvm()
+        b.write_register(0x07, 0x12)
+        b.write_register(0x08, 0x12)
+        await b.execute_async()
+        self.assertEqual(await b.poll_async(0x07), 0x12)
+        self.assertAlmostEqual(bus.wait_time, 0.02)
+
+    async def test_write_back(self):
+        b = AsyncI2CBuilder(0x18, self.bus, cache_policy=CACHE_WRITE_BACK)
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.set_spi_data_order(Constants.SpiDataOrderLsb)
+        await b.execute_async()
+        self.assertEqual(self.i2c.writes, 1)
+        self.assertEqual(b.shadow.dirty_addresses(), [])
+
+    async def test_prepared_plan(self):
+        b = self.builder
+        plan = b.read_register(Constants.RegAddrInterruptState1).prepare()
+        self.assertEqual(await b.run_async(plan), 0)
+        self.assertEqual(await b.run_async(plan), 0)
+        self.assertEqual(self.i2c.reads, 2)
+
+    async def test_poll(self):
+        self.assertEqual(await self.builder.poll_async(0x01), 0x101)
+
+    async def test_observers(self):
+        events = []
+        b = self.builder
+        b.add_observer(events.append)
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        await b.execute_async()
+        self.assertEqual([(e.direction, e.cache_hit) for e in events],
+                         [('read', False), ('write', False), ('read', False)])
+
+    async def test_requires_bus(self):
+        with self.assertRaises(ValueError):
+            await AsyncI2CBuilder(0x18).execute_async()
+
+    async def test_drives_many_sensors_concurrently(self):
+        builders = [AsyncI2CBuilder(0x18, SlowAsyncBus(0.05))
+                    for i in range(10)]
+        for b in builders:
+            b.set_output_mode(Constants.OutputModeQuadABN)
+            b.read_register(Constants.RegAddrSystemConfig1)
+
+        start = time.monotonic()
+        values = await asyncio.gather(*[b.execute_async() for b in builders])
+        elapsed = time.monotonic() - start
+        self.assertEqual(values, [0x32b] * 10)
+        # 3 transactions each, run side by side rather than one after another
+        self.assertLess(elapsed, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import math
+import unittest
+from array import array
+from ips2200 import Constants
+from ips2200.angle import AngleEngine
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def sweep(turns, count, offset_sin=0.0, offset_cos=0.0, gain_sin=1.0,
+          gain_cos=1.0, phase=0.0, ref=0.0):
+    # Samples of a target turning at constant speed, as (sin, cos, ref,
+    # true position in turns)
+    positions = [turns * i / count for i in range(count)]
+    sin = [ref + offset_sin +
+           math.sin(2 * math.pi * p + phase) / gain_sin for p in positions]
+    cos = [ref + offset_cos + math.cos(2 * math.pi * p) / gain_cos
+           for p in positions]
+    return sin, cos, [ref] * count, positions
+
+
+class TestAngleEngine(unittest.TestCase):
+    def assertClose(self, actual, expected, places=9):
+        self.assertEqual(len(actual), len(expected))
+        for a, e in zip(actual, expected):
+            self.assertAlmostEqual(a, e, places)
+
+    def test_angle_and_magnitude(self):
+        angles, magnitudes, positions = AngleEngine().process(
+            [0.0, 1.0, 0.0, -2.0], [1.0, 0.0, -1.0, 0.0])
+        self.assertIsInstance(angles, array)
+        self.assertClose(angles, [0, math.pi / 2, math.pi, -math.pi / 2])
+        self.assertClose(magnitudes, [1, 1, 1, 2])
+        self.assertClose(positions, [0, 0.25, 0.5, 0.75])
+
+    def test_unwraps_multiple_turns(self):
+        sin, cos, _, expected = sweep(3.5, 700)
+        engine = AngleEngine()
+        _, _, positions = engine.process(sin, cos)
+        self.assertClose(positions, expected)
+        self.assertAlmostEqual(engine.position, expected[-1])
+
+        # And backwards
+        _, _, positions = AngleEngine().process(sin[::-1], cos[::-1])
+        self.assertClose(positions, [p - expected[-1] + expected[-1] % 1
+                                     for p in expected[::-1]])
+
+    def test_chunks_match_one_pass(self):
+        sin, cos, _, expected = sweep(-2.25, 900)
+        engine = AngleEngine()
+        chunks = [(sin[i:i + 128], cos[i:i + 128])
+                  for i in range(0, 900, 128)]
+        positions = []
+        for _, _, chunk in engine.stream(chunks):
+            positions.extend(chunk)
+        self.assertClose(positions, expected)
+
+    def test_corrections(self):
+        sin, cos, ref, expected = sweep(1.5, 300, offset_sin=0.1,
+                                        offset_cos=-0.2, gain_sin=2.0,
+                                        gain_cos=0.5, phase=0.05, ref=1.65)
+        engine = AngleEngine(reference=True, offset_sin=0.1, offset_cos=-0.2,
+                             gain_sin=2.0, gain_cos=0.5, phase=0.05)
+        _, magnitudes, positions = engine.process(sin, cos, ref)
+        self.assertClose(positions, expected)
+        self.assertClose(magnitudes, [1.0] * 300)
+        with self.assertRaises(ValueError):
+            engine.process(sin, cos)
+
+    def test_periods_and_reset(self):
+        sin, cos, _, expected = sweep(4, 400)
+        engine = AngleEngine(periods=4)
+        _, _, positions = engine.process(sin, cos)
+        self.assertAlmostEqual(positions[-1], expected[-1] / 4)
+        engine.reset(position=10.0)
+        _, _, positions = engine.process(sin[:1], cos[:1])
+        self.assertAlmostEqual(positions[0], 10.0)
+
+    def test_from_config(self):
+        engine = AngleEngine.from_config(
+            {'output_mode': Constants.OutputModeSinCosRef}, periods=2)
+        self.assertTrue(engine.reference)
+        self.assertEqual(engine.periods, 2)
+        self.assertFalse(AngleEngine.from_config(
+            {'output_mode': Constants.OutputModeSinCosNN}).reference)
+        with self.assertRaises(ValueError):
+            AngleEngine.from_config(
+                {'output_mode': Constants.OutputModeQuadABN})
+
+    def test_rejects_mismatched_buffers(self):
+        with self.assertRaises(ValueError):
+            AngleEngine().process([0.0], [1.0, 0.0])
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestAngleEngineNumpy(unittest.TestCase):
+    def test_matches_python(self):
+        sin, cos, ref, _ = sweep(5.3, 4000, offset_sin=0.01, gain_cos=1.1,
+                                 phase=0.02, ref=0.5)
+        options = dict(reference=True, offset_sin=0.01, gain_cos=1.1,
+                       phase=0.02, periods=3)
+        python = AngleEngine(**options)
+        vector = AngleEngine(**options)
+        for i in range(0, 4000, 1000):
+            part = slice(i, i + 1000)
+            expected = python.process(sin[part], cos[part], ref[part])
+            actual = vector.process(numpy.array(sin[part]),
+                                    numpy.array(cos[part]),
+                                    numpy.array(ref[part]))
+            for a, e in zip(actual, expected):
+                self.assertTrue(numpy.allclose(a, numpy.array(e)))
+        self.assertAlmostEqual(vector.position, python.position)
+
+
+if __name__ == '__main__':
+    unittest.main()
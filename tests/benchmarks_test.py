@@ -0,0 +1,46 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from benchmarks import run
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_reports_every_workload(self):
+        results = run.run(repeat=1)
+        names = [name for name, _, _ in run.WORKLOADS]
+        self.assertEqual(sorted(results['workloads']), sorted(names))
+        for values in results['workloads'].values():
+            for key in ('transactions', 'reads', 'writes', 'bytes',
+                        'bus_time_s', 'cpu_time_s', 'nvm_wait_s'):
+                self.assertIn(key, values)
+
+    def test_transaction_counts(self):
+        # One read and one write per touched register
+        self.assertEqual(run.measure(run.single_field, repeat=1)
+                         ['transactions'], 2)
+        self.assertEqual(run.measure(run.full_profile, repeat=1)
+                         ['transactions'], 4)
+        # Only the reads to verify an already provisioned device
+        self.assertEqual(run.measure(run.reprovision_nvm, repeat=1)
+                         ['writes'], 0)
+        self.assertEqual(run.measure(run.register_dump, repeat=1)
+                         ['transactions'], 2)
+        self.assertEqual(run.measure(run.multi_device, devices=4, repeat=1)
+                         ['transactions'], 16)
+
+    def test_writes_and_compares_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.json')
+            run.main(['--output', path, '--repeat', '1'])
+            with open(path) as f:
+                saved = json.load(f)
+            self.assertIn('workloads', saved)
+            out = io.StringIO()
+            run.report(saved, saved, out)
+            self.assertIn('transactions 1.00x', out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import threading
+import time
+import unittest
+from ips2200 import I2CBuilder, Constants, CACHE_WRITE_THROUGH, READ
+from ips2200.bus import SharedBus
+import tests.fakes.busio as busio
+from tests.ips2200_test import doc_data, generate_sim_data
+
+
+class GatedI2C(busio.I2C):
+    # Fake bus whose reads block until released, so tests can line up
+    # concurrent callers
+    def __init__(self, error=None):
+        super().__init__(generate_sim_data(doc_data))
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self._error = error
+
+    def write_readinto(self, out_buffer, in_buffer):
+        self.entered.set()
+        self.release.wait(5)
+        if (self._error is not None):
+            raise self._error
+        super().write_readinto(out_buffer, in_buffer)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if (time.monotonic() > deadline):
+            raise AssertionError('Timed out waiting for condition')
+        time.sleep(0.001)
+
+
+class TestSharedBus(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data))
+        self.shared = SharedBus(self.i2c)
+
+    def test_builders_share_the_device_shadow(self):
+        a = self.shared.builder(0x18)
+        b = self.shared.builder(0x18)
+        other = self.shared.builder(0x19)
+        self.assertIs(a.shadow, b.shadow)
+        self.assertIsNot(a.shadow, other.shadow)
+        self.assertEqual(a.read_register(0x00).execute(), 0x323)
+        self.assertEqual(b.read_register(0x00).execute(), 0x323)
+        self.assertEqual(self.i2c.reads, 1)
+
+    def test_writes_keep_the_shared_shadow_coherent(self):
+        a = self.shared.builder(0x18, cache_policy=CACHE_WRITE_THROUGH)
+        b = self.shared.builder(0x18)
+        b.read_register(0x00).execute()
+        a.set_output_mode(Constants.OutputModeQuadABN).execute()
+        self.assertEqual(b.read_register(0x00).execute(), 0x32b)
+        self.assertEqual(self.i2c.reads, 1)
+
+    def test_read_racing_a_write_is_not_shadowed(self):
+        a = self.shared.builder(0x18)
+        b = self.shared.builder(0x18)
+        transferred = threading.Event()
+        resume = threading.Event()
+
+        def pause(event):
+            # Hold the reader between its transfer and its shadow store
+            if (event.direction == READ and not event.cache_hit):
+                transferred.set()
+                resume.wait(5)
+
+        a.add_observer(pause)
+        reader = threading.Thread(target=a.poll, args=(0x00,))
+        reader.start()
+        self.assertTrue(transferred.wait(5))
+        b.set_output_mode(Constants.OutputModeQuadABN).execute()
+        resume.set()
+        reader.join()
+        a.remove_observer(pause)
+        self.assertEqual(b.poll(0x00), 0x32b)
+        self.assertEqual(a.poll(0x00), 0x32b)
+
+    def test_lock_holder_does_not_wait_on_a_queued_read(self):
+        a = self.shared.builder(0x18)
+        b = self.shared.builder(0x18)
+        reader = threading.Thread(target=a.poll, args=(0x00,), daemon=True)
+
+        def update():
+            # Read-modify-write while a read of the same register is queued
+            # on the lock
+            with self.shared.lock:
+                reader.start()
+                time.sleep(0.05)
+                b.set_output_mode(Constants.OutputModeQuadABN).execute()
+
+        writer = threading.Thread(target=update, daemon=True)
+        writer.start()
+        writer.join(5)
+        reader.join(5)
+        self.assertFalse(writer.is_alive())
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(self.shared.merged_reads, 0)
+        self.assertEqual(b.poll(0x00), 0x32b)
+
+    def test_invalidate(self):
+        a = self.shared.builder(0x18)
+        a.read_register(0x00).execute()
+        self.shared.invalidate(0x18)
+        a.read_register(0x00).execute()
+        self.shared.invalidate()
+        a.read_register(0x00).execute()
+        self.assertEqual(self.i2c.reads, 3)
+
+    def test_concurrent_identical_reads_are_merged(self):
+        i2c = GatedI2C()
+        shared = SharedBus(i2c)
+        values = []
+
+        def read():
+            values.append(shared.builder(0x18).poll(0x00))
+
+        first = threading.Thread(target=read)
+        first.start()
+        i2c.entered.wait(5)
+        second = threading.Thread(target=read)
+        second.start()
+        wait_for(lambda: shared.merged_reads == 1)
+        i2c.release.set()
+        first.join()
+        second.join()
+        self.assertEqual(values, [0x323, 0x323])
+        self.assertEqual(i2c.reads, 1)
+        self.assertEqual(shared.reads, 1)
+
+    def test_merged_reads_share_errors(self):
+        i2c = GatedI2C(OSError('No ACK'))
+        shared = SharedBus(i2c)
+        errors = []
+
+        def read():
+            try:
+                shared.builder(0x18).poll(Constants.RegAddrInterruptState1)
+            except OSError as err:
+                errors.append(err)
+
+        first = threading.Thread(target=read)
+        first.start()
+        i2c.entered.wait(5)
+        second = threading.Thread(target=read)
+        second.start()
+        wait_for(lambda: shared.merged_reads == 1)
+        i2c.release.set()
+        first.join()
+        second.join()
+        self.assertEqual(len(errors), 2)
+
+    def test_concurrent_field_updates_are_not_lost(self):
+        setters = [
+            lambda b: b.set_output_mode(Constants.OutputModeQuadABN),
+            lambda b: b.set_spi_data_order(Constants.SpiDataOrderLsb),
+            lambda b: b.set_system_protocol(Constants.SystemProtocolSpi),
+            lambda b: b.set_i2c_address(0xb),
+        ]
+        threads = [threading.Thread(
+            target=lambda fn=fn: fn(self.shared.builder(0x18)).execute())
+            for fn in setters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        check = I2CBuilder(0x18, self.i2c)
+        self.assertEqual(check.read_register(0x00).execute(), 0b11110111000)
+
+
+if __name__ == '__main__':
+    unittest.main()
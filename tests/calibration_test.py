@@ -0,0 +1,97 @@
+import unittest
+from ips2200 import I2CBuilder, Constants, NVM_PROGRAM_TIME, REGISTER_MASK
+from ips2200.calibration import calibrate, search_current, search_frequency
+from ips2200.simulator import IPS2200Simulator, SimulatedI2C, TXModel
+
+SRB = 0x20
+
+
+class TestCalibration(unittest.TestCase):
+    def setUp(self):
+        self.tx = TXModel(count_at_zero=0x600, counts_per_code=-0.75,
+                          best_current=0x1d3, width=0x100)
+        self.device = IPS2200Simulator(0x18, tx=self.tx)
+        self.bus = SimulatedI2C(self.device)
+        self.builder = I2CBuilder(0x18, self.bus)
+
+    def amplitude(self, code):
+        # What a scope on the coil would show for the code in the SRB
+        self.assertEqual(
+            self.device.peek(SRB | Constants.RegAddrTXCurrentCalib), code)
+        return self.tx.amplitude(code)
+
+    def test_counter_model(self):
+        self.builder.use_srb().write_register(Constants.RegAddrTXFreqCalib,
+                                              0x100)
+        self.builder.read_register(Constants.RegAddrTXCounterState)
+        self.assertEqual(self.builder.execute(), 0x600 - 0xc0)
+        self.assertEqual(TXModel().counter(REGISTER_MASK), 0x500)
+        self.assertEqual(TXModel(counts_per_code=-1).counter(0x200), 0)
+
+    def test_search_frequency(self):
+        code, counter, trials = search_frequency(self.builder, 0x400)
+        self.assertEqual(code, 682)
+        self.assertEqual(counter, 0x400)
+        self.assertEqual(trials, 13)
+        self.assertEqual(self.device.peek(SRB | Constants.RegAddrTXFreqCalib),
+                         682)
+        # One SRB write and one counter read per trial, NVM untouched
+        self.assertLessEqual(self.bus.writes, trials + 1)
+        self.assertEqual(self.bus.reads, trials)
+        self.assertEqual(self.device.peek(Constants.RegAddrTXFreqCalib), 0)
+
+    def test_unreachable_target(self):
+        with self.assertRaises(ValueError):
+            search_frequency(self.builder, 0x7f0)
+        with self.assertRaises(ValueError):
+            search_frequency(self.builder, 0x400, low=0, high=0x100)
+
+    def test_search_current(self):
+        code, score, trials = search_current(self.builder, self.amplitude)
+        self.assertEqual(code, 0x1d3)
+        self.assertEqual(score, 1.0)
+        self.assertLess(trials, 25)
+        self.assertEqual(
+            self.device.peek(SRB | Constants.RegAddrTXCurrentCalib), 0x1d3)
+
+    def test_calibrate_commits_once(self):
+        builder = I2CBuilder(0x18, self.bus,
+                             nvm_program_time=NVM_PROGRAM_TIME)
+        result = calibrate(builder, 0x400, self.amplitude, limit_margin=0x20,
+                           settings={'r1_gain': 0x0, 'r2_gain': 0x6})
+        self.assertEqual((result.freq_code, result.counter), (682, 0x400))
+        self.assertEqual(result.current_code, 0x1d3)
+        self.assertLess(result.trials, 40)
+        for addr, value in ((Constants.RegAddrTXFreqCalib, 682),
+                            (Constants.RegAddrTXCurrentCalib, 0x1d3),
+                            (Constants.RegAddrTXFreqLowerLimit, 0x3e0),
+                            (Constants.RegAddrTXFreqUpperLimit, 0x420),
+                            (Constants.RegAddrR1R2Gain, 0x60)):
+            self.assertEqual(self.device.peek(addr), value)
+            self.assertEqual(self.device.peek(SRB | addr), value)
+        self.assertEqual(len(result.nvm), 5)
+        # The builder is left in the space it was in
+        self.assertFalse(builder.uses_nvm)
+
+        # Nothing changes the second time around
+        again = calibrate(builder, 0x400, self.amplitude, limit_margin=0x20,
+                          settings={'r1_gain': 0x0, 'r2_gain': 0x6})
+        self.assertEqual(len(again.nvm), 0)
+
+    def test_calibrate_without_commit(self):
+        result = calibrate(self.builder.use_nvm(), 0x500, commit=False)
+        self.assertIsNone(result.nvm)
+        self.assertIsNone(result.current_code)
+        self.assertEqual(result.counter, 0x500)
+        self.assertEqual(self.device.peek(Constants.RegAddrTXFreqCalib), 0)
+        self.assertEqual(self.device.peek(SRB | Constants.RegAddrTXFreqCalib),
+                         result.freq_code)
+        self.assertTrue(self.builder.uses_nvm)
+
+    def test_settle(self):
+        code, _, trials = search_frequency(self.builder, 0x400, settle=0.002)
+        self.assertAlmostEqual(self.bus.wait_time, 0.002 * trials)
+
+
+if __name__ == '__main__':
+    unittest.main()
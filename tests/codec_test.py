@@ -0,0 +1,100 @@
+import unittest
+from array import array
+from ips2200 import (to_address, from_address, to_memory, from_memory,
+                     split_bytes, join_bytes)
+from ips2200 import codec
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ADDRESSES = list(range(0x100))
+VALUES = list(range(0x800))
+WORDS = [to_memory(value) for value in VALUES] + [0, 0x1234, 0xffff]
+
+
+class TestCodec(unittest.TestCase):
+    def test_addresses(self):
+        documented = ADDRESSES[:0x40]
+        for use_nvm in (True, False):
+            self.assertEqual(list(codec.to_addresses(documented, use_nvm)),
+                             [to_address(a, use_nvm) for a in documented])
+        self.assertEqual(list(codec.from_addresses(ADDRESSES)),
+                         [from_address(a) for a in ADDRESSES])
+        self.assertEqual(codec.from_addresses(b'\xe0\xc7'), b'\x20\x07')
+
+    def test_memory(self):
+        self.assertEqual(list(codec.to_memories(VALUES)),
+                         [to_memory(v) for v in VALUES])
+        self.assertEqual(list(codec.from_memories(WORDS)),
+                         [from_memory(w) for w in WORDS])
+        self.assertEqual(codec.to_memories(array('H', [0x323])).typecode, 'H')
+
+    def test_bytes(self):
+        self.assertEqual(list(codec.split_words(WORDS)),
+                         [b for w in WORDS for b in split_bytes(w)])
+        high = [w >> 8 for w in WORDS]
+        low = [w & 0xff for w in WORDS]
+        self.assertEqual(list(codec.join_words(high, low)),
+                         [join_bytes(h, l) for h, l in zip(high, low)])
+
+    def test_wire_round_trip(self):
+        data = codec.encode_words(VALUES)
+        self.assertEqual(len(data), 2 * len(VALUES))
+        self.assertEqual(data[:4], bytes(split_bytes(to_memory(0)) +
+                                         split_bytes(to_memory(1))))
+        self.assertEqual(list(codec.decode_words(data)), VALUES)
+        self.assertEqual(list(codec.decode_words(bytearray(data))), VALUES)
+        self.assertEqual(list(codec.decode_words(memoryview(data))), VALUES)
+
+    def test_wide_buffers_convert_by_element(self):
+        self.assertEqual(codec.from_addresses(array('H', [0xe0])), b'\x20')
+        self.assertEqual(list(codec.to_memories(b'\x01')), [to_memory(1)])
+
+    def test_rejects_out_of_range(self):
+        with self.assertRaises(ValueError):
+            codec.from_addresses([0x100])
+        with self.assertRaises(ValueError):
+            codec.to_memories([0x800])
+        with self.assertRaises(ValueError):
+            codec.from_memories([-1])
+        with self.assertRaises(ValueError):
+            codec.join_words([1, 2], [3])
+        with self.assertRaises(ValueError):
+            codec.decode_words(b'\x00')
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestCodecNumpy(unittest.TestCase):
+    def test_matches_fallback(self):
+        addresses = numpy.array(ADDRESSES)
+        values = numpy.array(VALUES)
+        words = numpy.array(WORDS)
+        for use_nvm in (True, False):
+            self.assertEqual(
+                codec.to_addresses(addresses[:0x40], use_nvm).tolist(),
+                list(codec.to_addresses(ADDRESSES[:0x40], use_nvm)))
+        self.assertEqual(codec.from_addresses(addresses).tolist(),
+                         list(codec.from_addresses(ADDRESSES)))
+        self.assertEqual(codec.to_memories(values).tolist(),
+                         list(codec.to_memories(VALUES)))
+        self.assertEqual(codec.from_memories(words).tolist(),
+                         list(codec.from_memories(WORDS)))
+        self.assertEqual(codec.split_words(words).tobytes(),
+                         codec.split_words(WORDS))
+        self.assertEqual(codec.join_words(words >> 8, words & 0xff).tolist(),
+                         WORDS)
+        data = numpy.frombuffer(codec.encode_words(VALUES), numpy.uint8)
+        self.assertEqual(codec.decode_words(data).tolist(), VALUES)
+        self.assertIsInstance(codec.encode_words(values), numpy.ndarray)
+
+    def test_rejects_out_of_range(self):
+        with self.assertRaises(ValueError):
+            codec.to_memories(numpy.array([0x800]))
+        with self.assertRaises(ValueError):
+            codec.from_addresses(numpy.array([-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
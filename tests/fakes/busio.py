@@ -1,13 +1,20 @@
 
 class I2C():
 
-    def __init__(self, cache=None):
+    def __init__(self, cache=None, auto_increment=False):
         self._cache = cache
+        # When True, reads with a larger in_buffer continue at the following
+        # register addresses
+        self.auto_increment = auto_increment
+        # Transaction counters so tests can assert on bus traffic
+        self.reads = 0
+        self.writes = 0
 
     def write_readinto(self, out_buffer, in_buffer):
         # For IPS2200 I2C, the out_buffer has 2 entries [dev addr, mem addr].
         # The in_buffer has 2 entries, which are both bytes from storage being
         # read from the provided address.
+        self.reads += 1
         index = out_buffer[1]
 
         # NOTE: Was storing double byte integers, but trying out storing bytes
@@ -17,9 +24,19 @@ class I2C():
         # right = parts & 0xff
         # in_buffer[0] = left
         # in_buffer[1] = right
-        values = self._cache[index]
-        in_buffer[0] = values[0]
-        in_buffer[1] = values[1]
+        count = len(in_buffer) // 2 if self.auto_increment else 1
+        for i in range(count):
+            values = self._cache[index + i]
+            if (values is None):
+                if (i == 0):
+                    raise AssertionError('Read of unset address 0x' +
+                                         format(index, 'x'))
+                # Registers the test never set that an auto-increment read
+                # runs over (unused addresses) read as zero
+                values = [0x00, 0x00]
+            in_buffer[2 * i] = values[0]
+            in_buffer[2 * i + 1] = values[1]
 
     def write(self, addr, value):
+        self.writes += 1
         self._cache[addr] = value
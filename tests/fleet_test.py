@@ -0,0 +1,134 @@
+import time
+import unittest
+from ips2200 import I2CBuilder, Constants
+from ips2200.fleet import Fleet, FleetReport
+from ips2200.simulator import IPS2200Simulator, SimulatedI2C, TimingModel
+import tests.fakes.busio as busio
+from tests.ips2200_test import doc_data, generate_sim_data
+
+
+class SlowI2C(busio.I2C):
+    # Fake bus that takes delay seconds per transaction and can fail every
+    # read for a set of device addresses
+    def __init__(self, delay=0.0, failing=()):
+        super().__init__(generate_sim_data(doc_data))
+        self._delay = delay
+        self._failing = failing
+
+    def write_readinto(self, out_buffer, in_buffer):
+        time.sleep(self._delay)
+        if (out_buffer[0] in self._failing):
+            raise OSError('No ACK from 0x' + format(out_buffer[0], 'x'))
+        super().write_readinto(out_buffer, in_buffer)
+
+    def write(self, addr, value):
+        time.sleep(self._delay)
+        super().write(addr, value)
+
+
+class TestFleet(unittest.TestCase):
+    def test_runs_plan_on_every_target(self):
+        buses = [SlowI2C(), SlowI2C()]
+        targets = [(bus, addr) for bus in buses for addr in (0x18, 0x19)]
+        fleet = Fleet(targets)
+        plan = I2CBuilder(0x18).read_register(0x00).prepare()
+        report = fleet.run(plan)
+        self.assertIsInstance(report, FleetReport)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.values(), [0x323] * 4)
+        self.assertEqual([r.device_address for r in report],
+                         [0x18, 0x19, 0x18, 0x19])
+        self.assertIs(report[2].bus, buses[1])
+        self.assertEqual(len(report.bus_elapsed), 2)
+
+    def test_targets_keep_their_builders(self):
+        bus = SlowI2C()
+        fleet = Fleet([(bus, 0x18)])
+        plan = I2CBuilder(0x18).read_register(0x00).prepare()
+        fleet.run(plan)
+        fleet.run(plan)
+        self.assertEqual(bus.reads, 1)
+        self.assertEqual(fleet.builder(bus, 0x18).shadow.get(0xe0), 0x323)
+        with self.assertRaises(KeyError):
+            fleet.builder(bus, 0x19)
+
+    def test_write_only_plan_reaches_every_device(self):
+        bus = SimulatedI2C([IPS2200Simulator(0x18), IPS2200Simulator(0x19)])
+        fleet = Fleet([(bus, 0x18), (bus, 0x19)])
+        report = fleet.run(I2CBuilder(0).write_register(0x07, 0x12).prepare())
+        self.assertTrue(report.ok)
+        self.assertEqual(bus.device(0x18).peek(0x27), 0x12)
+        self.assertEqual(bus.device(0x19).peek(0x27), 0x12)
+
+    def test_accepts_callables(self):
+        fleet = Fleet([(SlowI2C(), 0x18)])
+        report = fleet.run(lambda b: b.set_output_mode(
+            Constants.OutputModeQuadABN).read_register(0x00).execute())
+        self.assertEqual(report.values(), [0x32b])
+
+    def test_errors_are_reported_per_device(self):
+        bus = SlowI2C(failing=(0x19,))
+        fleet = Fleet([(bus, 0x18), (bus, 0x19), (bus, 0x1a)])
+        report = fleet.run(I2CBuilder(0x18).read_register(0x00).prepare())
+        self.assertFalse(report.ok)
+        self.assertEqual(report.values(), [0x323, None, 0x323])
+        self.assertEqual(len(report.errors()), 1)
+        self.assertIsInstance(report[1].error, OSError)
+
+    def test_buses_run_in_parallel(self):
+        delay = 0.02
+        buses = [SlowI2C(delay) for i in range(4)]
+        targets = [(bus, addr) for bus in buses for addr in (0x18, 0x19)]
+        fleet = Fleet(targets)
+        report = fleet.run(I2CBuilder(0x18).read_register(0x00).prepare())
+        self.assertTrue(report.ok)
+        sequential = len(targets) * delay
+        self.assertLess(report.elapsed, sequential * 0.75)
+        for elapsed in report.bus_elapsed:
+            self.assertGreaterEqual(elapsed, 2 * delay)
+
+    def test_interleaves_nvm_programming(self):
+        def nvm_profile(**options):
+            bus = SimulatedI2C([IPS2200Simulator(addr)
+                                for addr in (0x18, 0x19, 0x1a, 0x1b)],
+                               timing=TimingModel(nvm_program_time=0.01))
+            fleet = Fleet([(bus, dev.address) for dev in bus.devices],
+                          **options)
+            b = I2CBuilder(0x18).use_nvm()
+            b.set_output_mode(Constants.OutputModeQuadABN)
+            b.set_quad_mode(Constants.On)
+            b.set_tx_current_calib(0x12)
+            b.read_register(Constants.RegAddrTXCurrentCalib)
+            report = fleet.run(b.prepare())
+            self.assertTrue(report.ok)
+            self.assertEqual(report.values(), [0x12] * 4)
+            for dev in bus.devices:
+                self.assertEqual(dev.peek(0x00), 0x32b)
+                self.assertEqual(dev.peek(0x01), 0x121)
+            return bus
+
+        sequential = nvm_profile()
+        interleaved = nvm_profile(nvm_program_time=0.01)
+        self.assertEqual(interleaved.transactions, sequential.transactions)
+        # Each device still waits for its own programming, but the other
+        # devices' writes fill most of that time
+        self.assertAlmostEqual(sequential.wait_time, 0.12)
+        self.assertLess(interleaved.wait_time, sequential.wait_time / 2)
+        self.assertLess(interleaved.now, sequential.now / 2)
+
+    def test_interleave_reports_errors_per_device(self):
+        bus = SimulatedI2C([IPS2200Simulator(0x18)])
+        fleet = Fleet([(bus, 0x18), (bus, 0x19)], nvm_program_time=0.01)
+        b = I2CBuilder(0x18).use_nvm().write_register(0x07, 0x12)
+        b.read_register(0x07)
+        report = fleet.run(b.prepare())
+        self.assertEqual(report.values(), [0x12, None])
+        self.assertIsInstance(report[1].error, OSError)
+
+    def test_empty_fleet(self):
+        report = Fleet([]).run(I2CBuilder(0x18).prepare())
+        self.assertEqual(len(report), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
-from ips2200 import I2CBuilder, print_value, to_address, from_address, to_memory, from_memory, split_bytes, join_bytes, Constants
+from ips2200 import I2CBuilder, Plan, ProfileReport, decode_config, decode_configs, ShadowRegisters, Field, Register, RegisterMap, REGISTERS, CACHE_INVALIDATE, CACHE_WRITE_THROUGH, CACHE_WRITE_BACK, print_value, to_address, from_address, to_memory, from_memory, split_bytes, join_bytes, Constants
+from ips2200.simulator import SimulatedI2C
 import tests.fakes.busio as busio
+from benchmarks import alloc
 
 
 # These values were found in the Programming Guide here:
@@ -372,5 +374,656 @@ class TestIps2200Builder(unittest.TestCase):
         self.assertEqual(value, 0b100000000)
 
 
+class TestIps2200Coalescing(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data))
+        self.builder = I2CBuilder(0x18, self.i2c)
+
+    def test_fields_on_one_register_cost_one_read_and_write(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.set_spi_mode(Constants.SpiModePolarityFallingRising)
+        b.set_system_protocol(Constants.SystemProtocolI2CInterrupt)
+        b.set_i2c_address(0xb)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 1)
+        self.assertEqual(self.i2c.writes, 1)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        self.assertEqual(b.execute(), 0b1110111010)
+
+    def test_fields_are_grouped_per_register_and_space(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.set_quad_mode_xor(Constants.QuadModeDoublePulse)
+        b.set_spi_data_order(Constants.SpiDataOrderLsb)
+        b.use_nvm()
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 3)
+        self.assertEqual(self.i2c.writes, 3)
+
+    def test_explicit_reads_keep_their_order(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeSinCosRef)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        values = b.execute()
+        self.assertEqual(values, [0x0327, 0x032b])
+
+    def test_explicit_write_is_a_barrier(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.write_register(Constants.RegAddrSystemConfig1, 0x0323)
+        b.set_spi_data_order(Constants.SpiDataOrderLsb)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        self.assertEqual(b.execute(), 0x723)
+
+    def test_space_is_captured_when_queued(self):
+        b = self.builder
+        b.use_nvm()
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.use_srb()
+        b.read_register(Constants.RegAddrSystemConfig1)
+        self.assertEqual(b.execute(), 0x0323)
+        b.use_nvm()
+        b.read_register(Constants.RegAddrSystemConfig1)
+        self.assertEqual(b.execute(), 0x032b)
+
+
+class TestIps2200ShadowRegisters(unittest.TestCase):
+    def test_starts_invalid(self):
+        s = ShadowRegisters()
+        self.assertIsNone(s.get(0xe0))
+        self.assertFalse(s.is_valid(0xe0))
+        self.assertEqual(s.snapshot(), {})
+
+    def test_set_and_get(self):
+        s = ShadowRegisters()
+        s.set(0xe0, 0x323)
+        s.set(0xc0, 0x7ff)
+        self.assertEqual(s.get(0xe0), 0x323)
+        self.assertEqual(s.get(0xc0), 0x7ff)
+        self.assertIsNone(s.get(0xe1))
+        self.assertEqual(s.valid_addresses(), [0xc0, 0xe0])
+
+    def test_dirty_tracking(self):
+        s = ShadowRegisters()
+        s.set(0xe0, 0x323, dirty=True)
+        s.set(0xe1, 0x101)
+        self.assertTrue(s.is_dirty(0xe0))
+        self.assertEqual(s.dirty_addresses(), [0xe0])
+        s.mark_clean(0xe0)
+        self.assertEqual(s.dirty_addresses(), [])
+        self.assertEqual(s.get(0xe0), 0x323)
+
+    def test_invalidate(self):
+        s = ShadowRegisters()
+        s.set(0xe0, 0x323, dirty=True)
+        s.set(0xe1, 0x101)
+        s.invalidate(0xe0)
+        self.assertIsNone(s.get(0xe0))
+        self.assertFalse(s.is_dirty(0xe0))
+        self.assertEqual(s.get(0xe1), 0x101)
+        s.invalidate()
+        self.assertEqual(s.snapshot(), {})
+
+    def test_snapshot_and_diff(self):
+        s = ShadowRegisters()
+        s.set(0xe0, 0x323)
+        s.set(0xe1, 0x101)
+        before = s.snapshot()
+        self.assertEqual(before, {0xe0: 0x323, 0xe1: 0x101})
+        s.set(0xe0, 0x327)
+        s.invalidate(0xe1)
+        s.set(0xe2, 0x56)
+        self.assertEqual(s.diff(before), {
+            0xe0: (0x323, 0x327),
+            0xe1: (0x101, None),
+            0xe2: (None, 0x56),
+        })
+
+    def test_store_drops_values_older_than_a_write(self):
+        s = ShadowRegisters()
+        generation = s.generation(0xe0)
+        self.assertTrue(s.store(0xe0, 0x323, generation))
+        generation = s.generation(0xe0)
+        s.invalidate(0xe0)
+        self.assertFalse(s.store(0xe0, 0x323, generation))
+        self.assertIsNone(s.get(0xe0))
+        generation = s.generation(0xe1)
+        s.set(0xe1, 0x121, dirty=True)
+        self.assertFalse(s.store(0xe1, 0x101, generation))
+        self.assertEqual(s.get(0xe1), 0x121)
+        self.assertTrue(s.is_dirty(0xe1))
+
+    def test_builder_fills_shadow(self):
+        b = I2CBuilder(0x18, busio.I2C(generate_sim_data(doc_data)))
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.execute()
+        self.assertEqual(b.shadow.snapshot(), {0xe0: 0x323})
+
+
+class TestIps2200CachePolicy(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data))
+
+    def test_rejects_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            I2CBuilder(0x18, self.i2c, cache_policy='sometimes')
+
+    def test_invalidate_rereads_after_write(self):
+        b = I2CBuilder(0x18, self.i2c, cache_policy=CACHE_INVALIDATE)
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        self.assertEqual(b.execute(), 0x032b)
+        self.assertEqual(self.i2c.reads, 2)
+        self.assertEqual(self.i2c.writes, 1)
+
+    def test_write_through_keeps_written_value(self):
+        b = I2CBuilder(0x18, self.i2c, cache_policy=CACHE_WRITE_THROUGH)
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        self.assertEqual(b.execute(), 0x032b)
+        self.assertEqual(self.i2c.reads, 1)
+        self.assertEqual(self.i2c.writes, 1)
+
+    def test_write_back_writes_once_per_execute(self):
+        b = I2CBuilder(0x18, self.i2c, cache_policy=CACHE_WRITE_BACK)
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.set_spi_data_order(Constants.SpiDataOrderLsb)
+        b.write_register(Constants.RegAddrSystemConfig2, 0x0501)
+        values = b.execute()
+        self.assertEqual(values, 0x032b)
+        self.assertEqual(self.i2c.reads, 1)
+        self.assertEqual(self.i2c.writes, 2)
+        self.assertEqual(b.shadow.dirty_addresses(), [])
+
+        check = I2CBuilder(0x18, self.i2c)
+        check.read_register(Constants.RegAddrSystemConfig1)
+        check.read_register(Constants.RegAddrSystemConfig2)
+        self.assertEqual(check.execute(), [0x072b, 0x0501])
+
+    def test_write_back_flush(self):
+        b = I2CBuilder(0x18, self.i2c, cache_policy=CACHE_WRITE_BACK)
+        b.shadow.set(0xe0, 0x0327, dirty=True)
+        b.flush()
+        self.assertEqual(self.i2c.writes, 1)
+        self.assertEqual(b.shadow.dirty_addresses(), [])
+
+
+class TestIps2200RegisterMap(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data))
+        self.builder = I2CBuilder(0x18, self.i2c)
+
+    def test_lookup_by_wire_address(self):
+        self.assertEqual(REGISTERS.lookup(0xc0).name, 'system_config_1')
+        self.assertEqual(REGISTERS.lookup(0xe0).name, 'system_config_1')
+        self.assertEqual(REGISTERS.lookup(0xf6).name, 'interrupt_state_1')
+        self.assertIsNone(REGISTERS.lookup(0xc5))
+
+    def test_config_registers_are_cached(self):
+        b = self.builder
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 1)
+
+    def test_status_registers_are_never_cached(self):
+        b = self.builder
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.read_register(Constants.RegAddrInterruptState1)
+        b.read_register(Constants.RegAddrTXCounterState)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 3)
+
+        # Poll status again without re-reading configuration
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.read_register(Constants.RegAddrInterruptState1)
+        b.read_register(Constants.RegAddrTXCounterState)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 5)
+        self.assertFalse(b.shadow.is_valid(0xf6))
+
+    def test_write_only_registers_are_not_shadowed(self):
+        b = I2CBuilder(0x18, self.i2c, cache_policy=CACHE_WRITE_BACK)
+        b.write_register(Constants.RegAddrInterruptClear1, 0b1)
+        b.execute()
+        self.assertEqual(self.i2c.writes, 1)
+        self.assertFalse(b.shadow.is_valid(0xf4))
+
+    def test_read_only_registers_reject_writes(self):
+        with self.assertRaises(ValueError) as context:
+            self.builder.write_register(Constants.RegAddrTXCounterState, 0)
+        self.assertIn('0x38 is read-only', str(context.exception))
+
+    def test_ttl_expires_cached_value(self):
+        registers = RegisterMap([
+            Register('system_config_1', Constants.RegAddrSystemConfig1,
+                     ttl=60),
+        ])
+        b = I2CBuilder(0x18, self.i2c, registers=registers)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 1)
+
+        b.shadow.stamp(0xe0, b.shadow.stamped(0xe0) - 61)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 2)
+
+
+class TestIps2200BlockRead(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data), auto_increment=True)
+        self.builder = I2CBuilder(0x18, self.i2c)
+
+    def test_read_block(self):
+        b = self.builder
+        b.read_block(Constants.RegAddrSystemConfig1, 8)
+        values = b.execute()
+        self.assertEqual(values, [0x323, 0x101, 0x56, 0, 0, 0, 0, 0xbe])
+        self.assertEqual(self.i2c.reads, 1)
+
+    def test_adjacent_reads_are_merged(self):
+        b = self.builder
+        b.read_register(0x00)
+        b.read_register(0x01)
+        b.read_register(0x02)
+        b.write_register(0x07, 0xbe)
+        b.read_register(0x03)
+        b.read_register(0x04)
+        values = b.execute()
+        self.assertEqual(values, [0x323, 0x0101, 0x0056, 0x0000, 0x0000])
+        self.assertEqual(self.i2c.reads, 2)
+
+    def test_block_only_reads_uncached_registers(self):
+        b = self.builder
+        b.read_register(0x00)
+        b.read_register(0x02)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 2)
+        b.read_block(0x00, 3)
+        self.assertEqual(b.execute(), [0x323, 0x101, 0x56])
+        self.assertEqual(self.i2c.reads, 3)
+        b.read_block(0x00, 3)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 3)
+
+    def test_block_keeps_pending_write_back(self):
+        # A block spanning a dirty register must not overwrite it
+        bus = SimulatedI2C()
+        b = I2CBuilder(0x18, bus, cache_policy=CACHE_WRITE_BACK)
+        b.set_quad_mode(Constants.On)
+        b.read_block(0x00, 3)
+        self.assertEqual(b.execute(), [0x323, 0x121, 0x56])
+        self.assertEqual(bus.device(0x18).peek(0x21), 0x121)
+        self.assertEqual(b.shadow.dirty_addresses(), [])
+
+    def test_block_must_stay_in_one_space(self):
+        with self.assertRaises(ValueError):
+            self.builder.read_block(0x1e, 4)
+        with self.assertRaises(ValueError):
+            self.builder.read_block(0x00, 0)
+
+    def test_reads_are_not_merged_across_spaces(self):
+        # NVM 0x1f is unused, but its wire address is next to SRB 0x00
+        self.i2c._cache[to_address(0x1f, True)] = [0x00, 0x00]
+        b = self.builder
+        b.use_nvm()
+        b.read_register(0x1f)
+        b.use_srb()
+        b.read_register(0x00)
+        b.read_register(0x01)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 2)
+
+    def test_falls_back_without_auto_increment(self):
+        i2c = busio.I2C(generate_sim_data(doc_data))
+        b = I2CBuilder(0x18, i2c)
+        b.read_block(Constants.RegAddrSystemConfig1, 3)
+        self.assertEqual(b.execute(), [0x323, 0x101, 0x56])
+        self.assertEqual(i2c.reads, 3)
+
+    def test_builder_can_disable_auto_increment(self):
+        b = I2CBuilder(0x18, self.i2c, auto_increment=False)
+        b.read_block(Constants.RegAddrSystemConfig1, 3)
+        self.assertEqual(b.execute(), [0x323, 0x101, 0x56])
+        self.assertEqual(self.i2c.reads, 3)
+
+
+class TestIps2200Plan(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data))
+        self.builder = I2CBuilder(0x18, self.i2c)
+
+    def test_prepare_clears_operations(self):
+        b = self.builder
+        b.read_register(Constants.RegAddrSystemConfig1)
+        plan = b.prepare()
+        self.assertIsInstance(plan, Plan)
+        self.assertEqual(b.operations, [])
+        self.assertEqual(len(plan), 1)
+
+    def test_plan_runs_repeatedly(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        b.read_register(Constants.RegAddrInterruptState1)
+        plan = b.prepare()
+        self.assertEqual(b.run(plan), [0x032b, 0x0000])
+        self.assertEqual(plan.run(b), [0x032b, 0x0000])
+        # The second run starts from the shadowed configuration register
+        self.assertEqual(self.i2c.reads, 5)
+
+    def test_plan_runs_against_other_devices(self):
+        plan = I2CBuilder(0x18).read_register(0x00).read_register(0x01).prepare()
+        other = busio.I2C(generate_sim_data(doc_data))
+        self.assertEqual(plan.run(I2CBuilder(0x19, other)), [0x323, 0x101])
+        self.assertEqual(plan.run(self.builder), [0x323, 0x101])
+
+    def test_plan_is_immutable(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        plan = b.prepare()
+        self.assertIsInstance(plan.steps, tuple)
+        with self.assertRaises(TypeError):
+            plan.steps[0] = None
+
+    def test_plan_transactions(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.set_spi_mode(Constants.SpiModePolarityFallingRising)
+        b.read_register(0x01)
+        b.read_register(0x02)
+        b.write_register(0x07, 0xbe)
+        plan = b.prepare()
+        self.assertEqual(plan.transactions(), [
+            ('read', 0xe0, 2),
+            ('write', 0xe0, 2),
+            ('read', 0xe1, 4),
+            ('write', 0xe7, 2),
+        ])
+        self.assertEqual(plan.transactions(auto_increment=False), [
+            ('read', 0xe0, 2),
+            ('write', 0xe0, 2),
+            ('read', 0xe1, 2),
+            ('read', 0xe2, 2),
+            ('write', 0xe7, 2),
+        ])
+
+
+class TestIps2200Allocation(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data))
+        self.builder = I2CBuilder(0x18, self.i2c)
+
+    def test_poll_reads_immediately(self):
+        b = self.builder
+        b.read_register(Constants.RegAddrSystemConfig2)
+        self.assertEqual(b.poll(Constants.RegAddrSystemConfig1), 0x323)
+        self.assertEqual(self.i2c.reads, 1)
+        self.assertEqual(len(b.operations), 1)
+
+    def test_cached_reads_allocate_nothing(self):
+        b = I2CBuilder(0x18, alloc.StaticBus())
+        b.poll(Constants.RegAddrSystemConfig1)
+        retained, peak = alloc.measure(
+            lambda: b.poll(Constants.RegAddrSystemConfig1), 1000)
+        self.assertEqual(retained, 0)
+        self.assertEqual(peak, 0)
+
+    def test_uncached_reads_retain_nothing(self):
+        b = I2CBuilder(0x18, alloc.StaticBus())
+        retained, peak = alloc.measure(
+            lambda: b.poll(Constants.RegAddrInterruptState1), 1000)
+        self.assertEqual(retained, 0)
+        # Only the decoded int (and its intermediate) are ever alive
+        self.assertLessEqual(peak, 64)
+
+
+class TestIps2200Fields(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data))
+        self.builder = I2CBuilder(0x18, self.i2c)
+
+    def test_field_mask_and_shift(self):
+        f = Field('spi_mode', Constants._SpiMode)
+        self.assertEqual(f.mask, 0b1100000000)
+        self.assertEqual(f.shift, 8)
+        self.assertEqual(f.max, 0b11)
+        self.assertEqual(f.encode(0b10), 0b1000000000)
+        self.assertEqual(f.decode(0x323), 0b11)
+        self.assertEqual(f.insert(0x323, 0b01), 0x123)
+
+    def test_field_validates_range(self):
+        f = REGISTERS.field('i2c_address')
+        with self.assertRaises(ValueError) as context:
+            f.validate(0x10)
+        self.assertIn('i2c_address (0x0 - 0xf)', str(context.exception))
+        with self.assertRaises(ValueError):
+            self.builder.set_i2c_address(0x10)
+        with self.assertRaises(ValueError):
+            self.builder.set_output_mode(-1)
+
+    def test_register_map_covers_documented_registers(self):
+        names = [register.name for register in REGISTERS.registers()]
+        for name in ('system_config_3', 'r1_r2_gain', 'r1_coil_offset',
+                     'r2_coil_offset', 'tx_current_calib', 'tx_freq_calib',
+                     'tx_freq_lower_limit', 'tx_freq_upper_limit',
+                     'interrupt_1_enable', 'interrupt_2_enable',
+                     'irqn_watchdog_1', 'irqn_watchdog_2', 'r1_fine_gain',
+                     'r2_fine_gain', 'interrupt_state_1', 'tx_counter_state'):
+            self.assertIn(name, names)
+        self.assertEqual(REGISTERS.field('output_mode').addr, 0x00)
+        self.assertEqual(Constants.RegAddrInterrupt2Enable, 0x0c)
+        with self.assertRaises(KeyError):
+            REGISTERS.field('warp_drive')
+
+    def test_setters_are_generated(self):
+        for field in REGISTERS.fields():
+            read_only = REGISTERS.get(field.addr).read_only
+            self.assertEqual(hasattr(I2CBuilder, 'set_' + field.name),
+                             not read_only, field.name)
+        self.assertIn('bits 2-3', I2CBuilder.set_output_mode.__doc__)
+
+    def test_duplicate_field_names_are_rejected(self):
+        with self.assertRaises(ValueError):
+            RegisterMap([
+                Register('a', 0x00, fields=[Field('x', (0x00, 0, 1))]),
+                Register('b', 0x01, fields=[Field('x', (0x01, 0, 1))]),
+            ])
+
+    def test_whole_register_fields_skip_the_read(self):
+        b = self.builder
+        b.set_tx_current_calib(0x1ab)
+        b.set_r1_coil_offset(0x12)
+        b.set_interrupt_clear_1(0b11)
+        b.execute()
+        self.assertEqual(self.i2c.reads, 0)
+        self.assertEqual(self.i2c.writes, 3)
+        b.read_register(Constants.RegAddrTXCurrentCalib)
+        b.read_register(Constants.RegAddrR1CoilOffset)
+        self.assertEqual(b.execute(), [0x1ab, 0x12])
+
+    def test_flag_registers_have_a_field_per_bit(self):
+        b = self.builder
+        b.set_interrupt_1_enable_0(Constants.On)
+        b.set_interrupt_1_enable_10(Constants.On)
+        b.set_r2_gain(0x3)
+        b.read_register(Constants.RegAddrInterrupt1Enable)
+        b.read_register(Constants.RegAddrR1R2Gain)
+        self.assertEqual(b.execute(), [0x401, 0x36])
+        self.assertTrue(hasattr(I2CBuilder, 'get_interrupt_state_2_4'))
+        self.assertFalse(hasattr(I2CBuilder, 'set_interrupt_state_2_4'))
+
+    def test_later_fields_win(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.set_output_mode(Constants.OutputModeSinCosRef)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        self.assertEqual(b.execute(), 0x327)
+
+    def test_set_field_by_name(self):
+        b = self.builder
+        b.set_field('output_mode', Constants.OutputModeQuadABN)
+        b.read_register(Constants.RegAddrSystemConfig1)
+        self.assertEqual(b.execute(), 0x32b)
+
+
+class TestIps2200Getters(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data), auto_increment=True)
+        self.builder = I2CBuilder(0x18, self.i2c)
+
+    def test_getters_decode_fields(self):
+        b = self.builder
+        b.get_output_mode()
+        b.get_system_protocol()
+        b.get_spi_mode()
+        b.get_i2c_address()
+        b.get_supply_voltage()
+        b.get_tx_current_calib()
+        values = b.execute()
+        self.assertEqual(values, [Constants.OutputModeSinCosNN,
+                                  Constants.SystemProtocolI2CInterruptAddress,
+                                  Constants.SpiModePolarityFallingRising,
+                                  0x2, Constants.On, 0xbe])
+        # One read per register, not per field
+        self.assertEqual(self.i2c.reads, 3)
+
+    def test_getter_sees_queued_setters(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadAB)
+        b.get_output_mode()
+        self.assertEqual(b.execute(), Constants.OutputModeQuadAB)
+
+    def test_getters_are_generated(self):
+        self.assertTrue(hasattr(I2CBuilder, 'get_tx_counter_state'))
+        self.assertFalse(hasattr(I2CBuilder, 'get_interrupt_clear_1'))
+        with self.assertRaises(ValueError):
+            self.builder.get_field('interrupt_clear_1')
+        self.assertEqual(self.builder.get_field('quad_mode').execute(), 0)
+
+    def test_read_config(self):
+        b = self.builder
+        config = b.read_config().execute()
+        self.assertEqual(config['output_mode'], Constants.OutputModeSinCosNN)
+        self.assertEqual(config['spi_mode'],
+                         Constants.SpiModePolarityFallingRising)
+        self.assertEqual(config['supply_voltage'], Constants.On)
+        self.assertEqual((config['r1_gain'], config['r2_gain']), (0x6, 0x5))
+        self.assertEqual(config['interrupt_1_enable_10'], 0)
+        self.assertEqual(config['tx_current_calib'], 0xbe)
+        self.assertNotIn('interrupt_state_1', config)
+        self.assertNotIn('interrupt_clear_1', config)
+        # Contiguous registers 0x00-0x04, 0x06-0x0e and 0x12-0x13
+        self.assertEqual(self.i2c.reads, 3)
+
+        # A second audit is served from the shadow
+        b.read_config().execute()
+        self.assertEqual(self.i2c.reads, 3)
+
+    def test_read_config_with_status(self):
+        config = self.builder.read_config(include_status=True).execute()
+        self.assertEqual(config['tx_counter_state'], 0)
+        self.assertEqual(config['nvm_ecc_fail_state'], 0)
+
+    def test_read_config_transactions(self):
+        plan = self.builder.read_config().prepare()
+        self.assertEqual(plan.transactions(), [
+            ('read', 0xe0, 10), ('read', 0xe6, 18), ('read', 0xf2, 4),
+        ])
+
+    def test_decode_config_from_shadow(self):
+        b = self.builder
+        b.read_config().execute()
+        config = decode_config(b.shadow.registers())
+        self.assertEqual(config, b.read_config().execute())
+        self.assertEqual(decode_config(b.shadow.registers(use_nvm=True)), {})
+
+    def test_decode_configs(self):
+        configs = decode_configs([{0x00: 0x323}, {0x00: 0x32b, 0x07: 0x12}])
+        self.assertEqual(configs[0]['output_mode'],
+                         Constants.OutputModeSinCosNN)
+        self.assertEqual(configs[1]['output_mode'],
+                         Constants.OutputModeQuadABN)
+        self.assertEqual(configs[1]['tx_current_calib'], 0x12)
+        self.assertNotIn('tx_current_calib', configs[0])
+
+
+class TestIps2200ApplyProfile(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data), auto_increment=True)
+        self.builder = I2CBuilder(0x18, self.i2c)
+
+    def test_matching_profile_only_reads(self):
+        report = self.builder.apply_profile({
+            'output_mode': Constants.OutputModeSinCosNN,
+            'spi_mode': Constants.SpiModePolarityFallingRising,
+            'tx_current_calib': 0xbe,
+        })
+        self.assertIsInstance(report, ProfileReport)
+        self.assertFalse(report.changed)
+        self.assertEqual(report.checked, 2)
+        self.assertEqual(report.fields, {})
+        self.assertEqual(self.i2c.writes, 0)
+        # 0x00 and 0x07 are not adjacent
+        self.assertEqual(self.i2c.reads, 2)
+
+    def test_writes_only_registers_that_differ(self):
+        report = self.builder.apply_profile({
+            'output_mode': Constants.OutputModeQuadABN,
+            'spi_data_order': Constants.SpiDataOrderLsb,
+            'supply_voltage': Constants.On,
+            'tx_current_calib': 0xbe,
+        })
+        self.assertTrue(report.changed)
+        self.assertEqual(report.checked, 3)
+        self.assertEqual(report.registers, [(0x20, 0x323, 0x72b)])
+        self.assertEqual(report.fields, {
+            'output_mode': (Constants.OutputModeSinCosNN,
+                            Constants.OutputModeQuadABN),
+            'spi_data_order': (Constants.SpiDataOrderMsb,
+                               Constants.SpiDataOrderLsb),
+        })
+        self.assertEqual(self.i2c.writes, 1)
+        self.assertEqual(self.builder.poll(0x00), 0x72b)
+
+    def test_uses_cached_values(self):
+        b = I2CBuilder(0x18, self.i2c, cache_policy=CACHE_WRITE_THROUGH)
+        profile = {'output_mode': Constants.OutputModeQuadABN}
+        self.assertEqual(len(b.apply_profile(profile)), 1)
+        reads = self.i2c.reads
+        # Already applied, answered entirely from the shadow
+        self.assertFalse(b.apply_profile(profile).changed)
+        self.assertEqual(self.i2c.reads, reads)
+        self.assertEqual(self.i2c.writes, 1)
+
+    def test_nvm(self):
+        b = self.builder.use_nvm()
+        report = b.apply_profile({'tx_current_calib': 0x12})
+        self.assertEqual(report.registers, [(0x07, 0xbe, 0x12)])
+        self.assertEqual(b.poll(0x07), 0x12)
+
+    def test_keeps_queued_operations(self):
+        b = self.builder
+        b.read_register(Constants.RegAddrSystemConfig2)
+        b.apply_profile({'quad_mode': Constants.On})
+        self.assertEqual(len(b.operations), 1)
+
+    def test_rejects_bad_profiles(self):
+        with self.assertRaises(KeyError):
+            self.builder.apply_profile({'no_such_field': 1})
+        with self.assertRaises(ValueError):
+            self.builder.apply_profile({'output_mode': 0x10})
+        with self.assertRaises(ValueError):
+            self.builder.apply_profile({'tx_counter_state': 1})
+        self.assertEqual(self.i2c.writes, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,142 @@
+import math
+import unittest
+from array import array
+from ips2200 import I2CBuilder, Constants
+from ips2200.angle import AngleEngine
+from ips2200.linearize import CorrectionTable, key, load, save
+from ips2200.simulator import IPS2200Simulator, SimulatedI2C
+from ips2200.snapshot import snapshot
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def error(angle):
+    # Repeatable error of a made up installation
+    return 0.01 + 0.02 * math.sin(2 * angle) + 0.005 * math.cos(3 * angle)
+
+
+def wrap(angle):
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+def sweep(count):
+    # (measured, true) angles of a reference sweep over one period
+    true = [wrap(2 * math.pi * i / count) for i in range(count)]
+    return [wrap(a + error(a)) for a in true], true
+
+
+class TestCorrectionTable(unittest.TestCase):
+    def test_corrects_sweep(self):
+        measured, true = sweep(5000)
+        table = CorrectionTable.from_sweep(measured, true, 128)
+        self.assertEqual(len(table), 128)
+        before = max(abs(wrap(m - t)) for m, t in zip(measured, true))
+        corrected = table.apply(measured)
+        self.assertIsInstance(corrected, array)
+        after = max(abs(wrap(c - t)) for c, t in zip(corrected, true))
+        self.assertGreater(before, 0.03)
+        self.assertLess(after, 0.002)
+        for angle, expected in zip(measured[::97], corrected[::97]):
+            self.assertAlmostEqual(table.correct(angle), expected, 12)
+
+    def test_periodic(self):
+        measured, true = sweep(1000)
+        table = CorrectionTable.from_sweep(measured, true, 64)
+        for angle in (-3.0, -0.5, 0.0, 1.25, 3.1):
+            corrected = table.correct(angle)
+            for turns in (-3, 1, 10):
+                self.assertAlmostEqual(
+                    table.correct(angle + 2 * math.pi * turns),
+                    corrected + 2 * math.pi * turns, 9)
+
+    def test_fills_gaps(self):
+        # Only 4 entries measured; the rest lie on straight lines between
+        table = CorrectionTable.from_sweep(
+            [-math.pi, -math.pi / 2, 0.0, math.pi / 2],
+            [-math.pi - 0.1, -math.pi / 2 - 0.2, -0.1, math.pi / 2],
+            8)
+        self.assertEqual(list(table.errors),
+                         list(array('f', [0.1, 0.15, 0.2, 0.15, 0.1, 0.05,
+                                          0.0, 0.05])))
+        with self.assertRaises(ValueError):
+            CorrectionTable.from_sweep([0.0, 0.01], [0.0, 0.0], 8)
+        with self.assertRaises(ValueError):
+            CorrectionTable.from_sweep([0.0], [0.0, 1.0])
+
+    def test_blob_round_trip(self):
+        measured, true = sweep(1000)
+        table = CorrectionTable.from_sweep(measured, true, 32,
+                                           (0x18, 1, 2, 3, 4, 5))
+        blob = bytes(table)
+        self.assertEqual(len(blob), 20 + 4 * 32 + 4)
+        copy = CorrectionTable.load(blob)
+        self.assertEqual(copy, table)
+        self.assertEqual(copy.key, (0x18, 1, 2, 3, 4, 5))
+        self.assertEqual(list(copy.apply(measured)),
+                         list(table.apply(measured)))
+
+        with self.assertRaises(ValueError):
+            CorrectionTable.load(blob[:-1])
+        with self.assertRaises(ValueError):
+            CorrectionTable.load(b'XXXX' + blob[4:])
+        corrupt = bytearray(blob)
+        corrupt[30] ^= 1
+        with self.assertRaises(ValueError):
+            CorrectionTable.load(corrupt)
+
+    def test_stored_with_snapshot(self):
+        device = IPS2200Simulator(0x18)
+        builder = I2CBuilder(0x18, SimulatedI2C(device))
+        builder.use_srb().write_register(Constants.RegAddrR1CoilOffset,
+                                         0x12).execute()
+        snap = snapshot(builder)
+        self.assertEqual(key(snap), (0x18, 0x12, 0, 0x56, 0, 0))
+
+        measured, true = sweep(1000)
+        table = CorrectionTable.from_sweep(measured, true, 32, key(snap))
+        stored, loaded = load(save(snap, table))
+        self.assertEqual(stored, snap)
+        self.assertEqual(loaded, table)
+
+        # Measured with other coil settings
+        builder.use_srb().write_register(Constants.RegAddrR2FineGain,
+                                         0x3).execute()
+        with self.assertRaises(ValueError):
+            table.check(snapshot(builder))
+        with self.assertRaises(ValueError):
+            save(snapshot(builder), table)
+
+    def test_angle_engine(self):
+        measured, true = sweep(2000)
+        table = CorrectionTable.from_sweep(measured, true)
+        engine = AngleEngine(correction=table)
+        angles, _, positions = engine.process([math.sin(a) for a in measured],
+                                              [math.cos(a) for a in measured])
+        for actual, expected in zip(angles, true):
+            self.assertAlmostEqual(wrap(actual - expected), 0, 2)
+        self.assertAlmostEqual(positions[-1], 1999 / 2000, 2)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestCorrectionTableNumpy(unittest.TestCase):
+    def test_matches_python(self):
+        measured, true = sweep(5000)
+        table = CorrectionTable.from_sweep(measured, true, 128)
+        vector = CorrectionTable.from_sweep(numpy.array(measured),
+                                            numpy.array(true), 128)
+        self.assertEqual(vector, table)
+        angles = numpy.linspace(-20, 20, 10001)
+        self.assertTrue(numpy.allclose(table.apply(angles),
+                                       table.apply(angles.tolist())))
+        engine = AngleEngine(correction=table)
+        self.assertTrue(numpy.allclose(
+            engine.process(numpy.sin(angles), numpy.cos(angles))[0],
+            AngleEngine(correction=table).process(
+                numpy.sin(angles).tolist(), numpy.cos(angles).tolist())[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+from ips2200 import I2CBuilder, Constants, BusEvent, READ, WRITE
+from ips2200.bus import SharedBus
+from ips2200.metrics import MetricsCollector, LatencyHistogram
+from ips2200.simulator import SimulatedI2C
+import tests.fakes.busio as busio
+from tests.ips2200_test import doc_data, generate_sim_data
+
+
+class FailingI2C(busio.I2C):
+    def write_readinto(self, out_buffer, in_buffer):
+        raise OSError('No ACK')
+
+
+class TestObservers(unittest.TestCase):
+    def setUp(self):
+        self.i2c = busio.I2C(generate_sim_data(doc_data))
+        self.builder = I2CBuilder(0x18, self.i2c)
+        self.events = []
+        self.builder.add_observer(self.events.append)
+
+    def test_reports_reads_hits_and_writes(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.read_register(Constants.RegAddrSystemConfig2)
+        b.read_register(Constants.RegAddrSystemConfig2)
+        b.execute()
+        self.assertEqual([(e.addr, e.direction, e.size, e.cache_hit)
+                          for e in self.events], [
+            (0xe0, READ, 2, False),
+            (0xe0, WRITE, 2, False),
+            (0xe1, READ, 2, False),
+            (0xe1, READ, 0, True),
+        ])
+        for event in self.events:
+            self.assertIsInstance(event, BusEvent)
+            self.assertEqual(event.device_address, 0x18)
+            self.assertIsNone(event.error)
+            self.assertGreaterEqual(event.duration, 0.0)
+
+    def test_reports_block_reads(self):
+        b = I2CBuilder(0x18, SimulatedI2C())
+        events = []
+        b.add_observer(events.append)
+        b.poll(0x00)
+        b.read_block(0x00, 3).execute()
+        self.assertEqual([(e.addr, e.size, e.cache_hit, e.count)
+                          for e in events], [
+            (0xe0, 2, False, 1),
+            (0xe0, 0, True, 1),
+            (0xe1, 4, False, 2),
+        ])
+
+        collector = MetricsCollector()
+        for event in events:
+            collector(event)
+        device = collector.device(0x18)
+        self.assertEqual((device.reads, device.cache_hits, device.bytes),
+                         (2, 1, 6))
+        first = collector.register(0x18, 0x20)
+        self.assertEqual((first.reads, first.cache_hits, first.bytes),
+                         (1, 1, 2))
+        block = events[2]
+        for addr in (0x21, 0x22):
+            stats = collector.register(0x18, addr)
+            self.assertEqual((stats.reads, stats.cache_hits, stats.bytes),
+                             (1, 0, 2))
+            self.assertAlmostEqual(stats.latency.total, block.duration / 2)
+        self.assertEqual(collector.register(0x18, 0x23).reads, 0)
+
+    def test_reports_errors(self):
+        b = I2CBuilder(0x18, FailingI2C())
+        events = []
+        b.add_observer(events.append)
+        with self.assertRaises(OSError):
+            b.poll(0x00)
+        self.assertEqual(len(events), 1)
+        self.assertIsInstance(events[0].error, OSError)
+
+    def test_remove_observer(self):
+        self.builder.remove_observer(self.events.append)
+        self.builder.poll(0x00)
+        self.assertEqual(self.events, [])
+
+    def test_shared_bus_reports_transactions(self):
+        shared = SharedBus(self.i2c)
+        events = []
+        shared.add_observer(events.append)
+        shared.builder(0x18).set_output_mode(
+            Constants.OutputModeQuadABN).execute()
+        self.assertEqual([(e.device_address, e.addr, e.direction)
+                          for e in events],
+                         [(0x18, 0xe0, READ), (None, 0xe0, WRITE)])
+        self.assertIn('None', repr(events[1]))
+
+
+class TestMetricsCollector(unittest.TestCase):
+    def test_histogram(self):
+        h = LatencyHistogram()
+        for seconds in (0.000001, 0.0001, 0.0001, 0.01):
+            h.add(seconds)
+        self.assertEqual(h.count, 4)
+        self.assertAlmostEqual(h.max, 0.01)
+        self.assertEqual(h.percentile(50), 128 / 1000000.0)
+        self.assertEqual(h.percentile(100), 16384 / 1000000.0)
+        self.assertEqual(LatencyHistogram().percentile(50), 0.0)
+
+    def test_collects_per_device_and_register(self):
+        collector = MetricsCollector()
+        bus = SimulatedI2C()
+        b = I2CBuilder(0x18, bus)
+        b.add_observer(collector)
+        for i in range(4):
+            b.read_register(Constants.RegAddrSystemConfig1)
+            b.read_register(Constants.RegAddrInterruptState1)
+            b.execute()
+
+        device = collector.device(0x18)
+        self.assertEqual(device.reads, 5)
+        self.assertEqual(device.cache_hits, 3)
+        self.assertAlmostEqual(device.hit_rate, 3 / 8.0)
+        config = collector.register(0x18, 0x20)
+        self.assertEqual((config.reads, config.cache_hits), (1, 3))
+        status = collector.register(0x18, 0x36)
+        self.assertEqual((status.reads, status.cache_hits), (4, 0))
+        self.assertEqual(collector.total.bytes, 10)
+        self.assertEqual(collector.devices(), [0x18])
+        self.assertEqual(collector.slowest()[0][0], 0x18)
+
+        summary = collector.summary()
+        self.assertEqual(summary['devices']['0x18']['reads'], 5)
+        self.assertIn('0x18/0x36', summary['registers'])
+        collector.reset()
+        self.assertEqual(collector.total.reads, 0)
+
+    def test_counts_errors(self):
+        collector = MetricsCollector()
+        b = I2CBuilder(0x18, FailingI2C())
+        b.add_observer(collector)
+        with self.assertRaises(OSError):
+            b.poll(0x00)
+        self.assertEqual(collector.device(0x18).errors, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import threading
+import unittest
+from ips2200 import I2CBuilder, Constants
+from ips2200.monitor import InterruptEvent, InterruptMonitor
+from ips2200.simulator import IPS2200Simulator, IRQNLine, SimulatedI2C
+
+
+class PinLine():
+    # A plain digitalio-style pin without wait()
+    def __init__(self):
+        self.value = True
+
+
+class TestInterruptMonitor(unittest.TestCase):
+    def setUp(self):
+        self.line = IRQNLine()
+        self.devices = [IPS2200Simulator(addr, irqn=self.line)
+                        for addr in (0x18, 0x19, 0x1a)]
+        self.bus = SimulatedI2C(self.devices)
+        self.builders = [I2CBuilder(dev.address, self.bus)
+                         for dev in self.devices]
+        self.events = []
+        self.monitor = InterruptMonitor(self.line, self.builders,
+                                        enable_1=0x00f, enable_2=0x001,
+                                        watchdog_1=0x123)
+        self.monitor.on(self.events.append)
+
+    def test_configure(self):
+        self.monitor.configure()
+        for dev in self.devices:
+            self.assertEqual(dev.peek(0x21), 0x181)
+            self.assertEqual(dev.peek(0x2b), 0x00f)
+            self.assertEqual(dev.peek(0x2c), 0x001)
+            self.assertEqual(dev.peek(0x2d), 0x123)
+            # The NVM copy is left alone
+            self.assertEqual(dev.peek(0x0b), 0)
+
+    def test_no_bus_traffic_while_idle(self):
+        self.monitor.configure()
+        self.bus.reset_counters()
+        for i in range(10):
+            self.assertEqual(self.monitor.run_once(timeout=0), [])
+        self.assertEqual(self.bus.transactions, 0)
+
+    def test_disabled_interrupts_do_not_assert(self):
+        self.devices[0].raise_interrupt(state_1=0x100)
+        self.assertTrue(self.line.value)
+        self.monitor.configure()
+        self.devices[0].raise_interrupt(state_2=0x002)
+        self.assertTrue(self.line.value)
+
+    def test_services_interrupts(self):
+        self.monitor.configure()
+        self.devices[1].raise_interrupt(state_1=0x005, state_2=0x001)
+        self.assertFalse(self.line.value)
+        self.bus.reset_counters()
+
+        events = self.monitor.run_once(timeout=0)
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertIsInstance(event, InterruptEvent)
+        self.assertEqual(event.device_address, 0x19)
+        self.assertEqual(event.bits(), [(1, 0), (1, 2), (2, 0)])
+        self.assertEqual(self.events, events)
+        # One state read per device and the two clears
+        self.assertEqual(self.bus.reads, 3)
+        self.assertEqual(self.bus.writes, 2)
+        self.assertEqual(self.devices[1].peek(0x36), 0)
+        self.assertTrue(self.line.value)
+
+    def test_callback_masks(self):
+        faults = []
+        self.monitor.on(faults.append, state_1=0x008, state_2=0)
+        self.monitor.configure()
+        self.devices[0].raise_interrupt(state_1=0x001)
+        self.devices[2].raise_interrupt(state_1=0x008)
+        self.monitor.service()
+        self.assertEqual(len(self.events), 2)
+        self.assertEqual([e.device_address for e in faults], [0x1a])
+
+    def test_device_errors_do_not_stop_the_others(self):
+        errors = []
+        builders = [self.builders[0], I2CBuilder(0x1b, self.bus),
+                    self.builders[2]]
+        monitor = InterruptMonitor(self.line, builders)
+        monitor.on(self.events.append).on_error(errors.append)
+        self.devices[0].raise_interrupt(state_1=0x001)
+        self.devices[2].raise_interrupt(state_2=0x004)
+        events = monitor.service()
+        self.assertEqual([e.device_address for e in events],
+                         [0x18, 0x1b, 0x1a])
+        self.assertEqual([e.device_address for e in self.events],
+                         [0x18, 0x1a])
+        self.assertEqual(len(errors), 1)
+        # 0x1b does not acknowledge
+        self.assertIsInstance(errors[0].error, OSError)
+        self.assertEqual(errors[0].bits(), [])
+        self.assertEqual(self.devices[2].peek(0x37), 0)
+
+    def test_waits_in_a_thread(self):
+        self.monitor.configure()
+        stop = threading.Event()
+        thread = threading.Thread(target=self.monitor.run,
+                                  args=(stop, 0.01))
+        thread.start()
+        try:
+            self.devices[2].raise_interrupt(state_1=0x002)
+            for i in range(200):
+                if (self.events):
+                    break
+                threading.Event().wait(0.005)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(self.events[0].device_address, 0x1a)
+
+    def test_samples_lines_without_wait(self):
+        line = PinLine()
+        monitor = InterruptMonitor(line, self.builders[0], poll_interval=0)
+        self.assertFalse(monitor.wait(timeout=0))
+        line.value = False
+        self.assertTrue(monitor.wait(timeout=0))
+        self.devices[0].raise_interrupt(state_1=0x001)
+        self.assertEqual(monitor.run_once()[0].state_1, 0x001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+from ips2200 import I2CBuilder, Constants
+from ips2200.quadrature import QuadratureChunk, QuadratureDecoder
+from ips2200.simulator import IPS2200Simulator, SimulatedI2C
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# A/B levels for position % 4, A leading B when moving forward
+SEQUENCE = ((0, 0), (1, 0), (1, 1), (0, 1))
+
+
+def encode(counts, double_pulse=False):
+    # A and B samples for a list of positions
+    a = [SEQUENCE[p % 4][0] for p in counts]
+    b = [SEQUENCE[p % 4][1] for p in counts]
+    if (double_pulse):
+        a = [x ^ y for x, y in zip(a, b)]
+    return a, b
+
+
+class TestQuadratureDecoder(unittest.TestCase):
+    def test_counts_both_directions(self):
+        counts = list(range(0, 40)) + list(range(40, -13, -1))
+        a, b = encode(counts)
+        decoder = QuadratureDecoder(index=False, sample_rate=1000)
+        chunk = decoder.process(a, b)
+        self.assertIsInstance(chunk, QuadratureChunk)
+        self.assertEqual(list(chunk.positions), counts)
+        self.assertEqual(chunk.position, -12)
+        self.assertEqual(decoder.position, -12)
+        self.assertEqual(chunk.illegal, 0)
+        self.assertAlmostEqual(chunk.velocity, -12 / (len(counts) / 1000))
+
+    def test_double_pulse(self):
+        counts = list(range(0, 25))
+        a, b = encode(counts, double_pulse=True)
+        decoder = QuadratureDecoder(index=False, double_pulse=True)
+        self.assertEqual(list(decoder.process(a, b).positions), counts)
+        self.assertIsNone(decoder.process(a[:1], b[:1]).velocity)
+
+    def test_chunks_match_one_pass(self):
+        counts = [i * i // 900 for i in range(300)]
+        a, b = encode(counts)
+        decoder = QuadratureDecoder(index=False)
+        positions = []
+        for chunk in decoder.stream((a[i:i + 7], b[i:i + 7])
+                                    for i in range(0, 300, 7)):
+            positions.extend(chunk.positions)
+        self.assertEqual(positions, counts)
+
+    def test_index_resets(self):
+        counts = list(range(30))
+        a, b = encode(counts)
+        n = [1 if p in (10, 11, 25) else 0 for p in counts]
+        decoder = QuadratureDecoder(index_position=100, sample_rate=30)
+        first = decoder.process(a[:20], b[:20], n[:20])
+        second = decoder.process(a[20:], b[20:], n[20:])
+        self.assertEqual(first.index, 1)
+        self.assertEqual(second.index, 1)
+        self.assertEqual(decoder.index_count, 2)
+        self.assertEqual(list(first.positions),
+                         list(range(10)) + list(range(100, 110)))
+        self.assertEqual(list(second.positions),
+                         list(range(110, 115)) + list(range(100, 105)))
+        # Index resets do not count as movement
+        self.assertAlmostEqual(second.velocity, 30.0)
+
+    def test_illegal_transitions_and_glitches(self):
+        a = [0, 1, 1, 0, 1, 1]
+        b = [0, 0, 1, 0, 1, 0]
+        decoder = QuadratureDecoder(index=False)
+        chunk = decoder.process(a, b)
+        # 00 -> 10 -> 11 (+2), 11 -> 00 illegal, 00 -> 11 illegal,
+        # 11 -> 10 (-1)
+        self.assertEqual(list(chunk.positions), [0, 1, 2, 2, 2, 1])
+        self.assertEqual(chunk.illegal, 2)
+        # Back and forth: each step undoes the one before
+        chunk = decoder.process([1, 1], [1, 0])
+        self.assertEqual(list(chunk.positions), [2, 1])
+        self.assertEqual(chunk.glitches, 2)
+        self.assertEqual(decoder.glitches, 2)
+        self.assertEqual(decoder.illegal, 2)
+
+    def test_timestamps(self):
+        a, b = encode(range(5))
+        decoder = QuadratureDecoder(index=False)
+        chunk = decoder.process(a, b, times=[0.0, 0.1, 0.2, 0.3, 0.4])
+        self.assertAlmostEqual(chunk.velocity, 10.0)
+        a, b = encode(range(5, 7))
+        chunk = decoder.process(a, b, times=[0.5, 0.6])
+        self.assertAlmostEqual(chunk.velocity, 10.0)
+
+    def test_from_builder(self):
+        device = IPS2200Simulator()
+        builder = I2CBuilder(0x18, SimulatedI2C(device))
+        with self.assertRaises(ValueError):
+            QuadratureDecoder.from_builder(builder)
+        builder.set_output_mode(Constants.OutputModeQuadAB)
+        builder.set_quad_mode_xor(Constants.QuadModeDoublePulse).execute()
+        decoder = QuadratureDecoder.from_builder(builder, sample_rate=10)
+        self.assertFalse(decoder.index)
+        self.assertTrue(decoder.double_pulse)
+        self.assertEqual(decoder.sample_rate, 10)
+        with self.assertRaises(ValueError):
+            decoder.process([0], [0], [0])
+        builder.set_quad_mode(1).execute()
+        with self.assertRaises(ValueError):
+            QuadratureDecoder.from_builder(builder)
+
+    def test_from_config(self):
+        config = {'output_mode': Constants.OutputModeQuadABN, 'quad_mode': 0,
+                  'quad_mode_xor': Constants.QuadModeOnePulse}
+        decoder = QuadratureDecoder.from_config(config)
+        self.assertTrue(decoder.index)
+        self.assertFalse(decoder.double_pulse)
+        config['quad_mode'] = 1
+        with self.assertRaises(ValueError):
+            QuadratureDecoder.from_config(config)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestQuadratureDecoderNumpy(unittest.TestCase):
+    def test_matches_python(self):
+        rng = numpy.random.default_rng(1)
+        counts = numpy.cumsum(rng.integers(-1, 2, 20000))
+        a, b = encode(counts.tolist(), double_pulse=True)
+        a[500] ^= 1
+        b[501] ^= 1
+        n = [1 if i % 5000 == 17 else 0 for i in range(20000)]
+        python = QuadratureDecoder(double_pulse=True, sample_rate=1e6)
+        vector = QuadratureDecoder(double_pulse=True, sample_rate=1e6)
+        for i in range(0, 20000, 3000):
+            part = slice(i, i + 3000)
+            expected = python.process(a[part], b[part], n[part])
+            actual = vector.process(numpy.array(a[part]),
+                                    numpy.array(b[part]),
+                                    numpy.array(n[part]))
+            self.assertEqual(actual.positions.tolist(),
+                             list(expected.positions))
+            self.assertEqual((actual.index, actual.illegal, actual.glitches),
+                             (expected.index, expected.illegal,
+                              expected.glitches))
+            self.assertAlmostEqual(actual.velocity, expected.velocity)
+
+
+if __name__ == '__main__':
+    unittest.main()
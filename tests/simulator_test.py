@@ -0,0 +1,163 @@
+import unittest
+from ips2200 import I2CBuilder, Constants
+from ips2200.simulator import (IPS2200Simulator, SimulatedI2C, TimingModel,
+                               BUS_100KHZ, BUS_400KHZ, BUS_1MHZ)
+
+
+class TestIPS2200Simulator(unittest.TestCase):
+    def setUp(self):
+        self.device = IPS2200Simulator()
+        self.bus = SimulatedI2C(self.device)
+        self.builder = I2CBuilder(0x18, self.bus)
+
+    def test_reset_values(self):
+        b = self.builder
+        b.read_block(0x00, 8)
+        self.assertEqual(b.execute(), [0x323, 0x101, 0x56, 0, 0, 0, 0, 0xbe])
+        b.use_nvm()
+        b.read_register(0x00)
+        self.assertEqual(b.execute(), 0x323)
+
+    def test_nvm_and_srb_are_separate_copies(self):
+        b = self.builder
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.execute()
+        self.assertEqual(self.device.peek(0x20), 0x32b)
+        self.assertEqual(self.device.peek(0x00), 0x323)
+        b.use_nvm()
+        b.set_spi_data_order(Constants.SpiDataOrderLsb)
+        b.execute()
+        self.assertEqual(self.device.peek(0x00), 0x723)
+        self.device.reset()
+        self.assertEqual(self.device.peek(0x20), 0x723)
+
+    def test_write_only_registers_read_as_zero(self):
+        self.device.poke(Constants.RegAddrInterruptClear1, 0x7ff)
+        self.assertEqual(self.builder.poll(Constants.RegAddrInterruptClear1),
+                         0)
+
+    def test_read_only_registers_ignore_writes(self):
+        self.bus.write(0xf8, [0xff, 0xff])
+        self.assertEqual(self.device.peek(Constants.RegAddrTXCounterState), 0)
+        self.assertEqual(self.device.ignored_writes, 1)
+
+    def test_interrupt_clear(self):
+        self.device.poke(Constants.RegAddrInterruptState1, 0b1011)
+        b = self.builder
+        b.write_register(Constants.RegAddrInterruptClear1, 0b0011)
+        b.read_register(Constants.RegAddrInterruptState1)
+        self.assertEqual(b.execute(), 0b1000)
+
+    def test_i2c_address_change(self):
+        self.builder.set_i2c_address(0xb).execute()
+        self.assertEqual(self.device.address, 0x1b)
+        with self.assertRaises(OSError):
+            self.builder.poll(Constants.RegAddrInterruptState1)
+        moved = I2CBuilder(0x1b, self.bus)
+        self.assertEqual(moved.poll(0x00), 0b1110110011)
+
+    def test_missing_device_nacks(self):
+        with self.assertRaises(OSError):
+            I2CBuilder(0x30, self.bus).poll(0x00)
+
+    def test_counts_transactions_and_bytes(self):
+        b = self.builder
+        b.read_block(0x00, 4)
+        b.set_output_mode(Constants.OutputModeQuadABN)
+        b.execute()
+        self.assertEqual(self.bus.transactions, 2)
+        self.assertEqual(self.bus.reads, 1)
+        self.assertEqual(self.bus.writes, 1)
+        self.assertEqual(self.bus.bytes_read, 8)
+        self.assertEqual(self.bus.bytes_written, 2)
+        self.bus.reset_counters()
+        self.assertEqual(self.bus.transactions, 0)
+
+    def test_falls_back_without_auto_increment(self):
+        bus = SimulatedI2C(auto_increment=False)
+        b = I2CBuilder(0x18, bus)
+        self.assertEqual(b.read_block(0x00, 3).execute(), [0x323, 0x101, 0x56])
+        self.assertEqual(bus.reads, 3)
+
+    def test_block_writes(self):
+        self.bus.write(0xe7, [0x00, 0x00, 0xff, 0xff])
+        self.assertEqual(self.device.peek(0x27), 0)
+        self.assertEqual(self.device.peek(0x28), 0x7ff)
+
+    def test_routes_by_device_address(self):
+        a = IPS2200Simulator(0x18)
+        b = IPS2200Simulator(0x19)
+        bus = SimulatedI2C([a, b])
+        with self.assertRaises(OSError):
+            bus.write(0xe0, [0, 0])
+        I2CBuilder(0x19, bus).set_output_mode(
+            Constants.OutputModeQuadABN).execute()
+        self.assertEqual(a.peek(0x20), 0x323)
+        self.assertEqual(b.peek(0x20), 0x32b)
+        bus.select(0x18)
+        bus.write(0xe1, [0, 0])
+        self.assertEqual(a.peek(0x21), 0)
+
+
+class TestTimingModel(unittest.TestCase):
+    def test_transaction_times(self):
+        timing = TimingModel(BUS_100KHZ)
+        self.assertAlmostEqual(timing.read_time(2), 48 / 100000.0)
+        self.assertAlmostEqual(timing.write_time(2), 38 / 100000.0)
+        self.assertAlmostEqual(TimingModel(BUS_400KHZ).read_time(2),
+                               48 / 400000.0)
+        self.assertAlmostEqual(TimingModel(BUS_1MHZ).read_time(4),
+                               66 / 1000000.0)
+
+    def test_bus_time_follows_frequency(self):
+        bus = SimulatedI2C(timing=TimingModel(BUS_400KHZ))
+        I2CBuilder(0x18, bus).poll(0x00)
+        self.assertAlmostEqual(bus.bus_time, 48 / 400000.0)
+        self.assertAlmostEqual(bus.now, bus.bus_time)
+
+    def test_waits_for_nvm_program(self):
+        bus = SimulatedI2C(timing=TimingModel(nvm_program_time=0.01))
+        b = I2CBuilder(0x18, bus)
+        b.use_nvm()
+        b.write_register(0x07, 0x10)
+        b.write_register(0x08, 0x10)
+        b.execute()
+        # The second write waits out the whole program cycle of the first
+        self.assertAlmostEqual(bus.wait_time, 0.01)
+        self.assertGreater(bus.device(0x18).busy_until, bus.now)
+
+    def test_srb_writes_do_not_program(self):
+        bus = SimulatedI2C(timing=TimingModel(nvm_program_time=0.01))
+        b = I2CBuilder(0x18, bus)
+        b.write_register(0x07, 0x10)
+        b.write_register(0x08, 0x10)
+        b.execute()
+        self.assertEqual(bus.wait_time, 0.0)
+
+    def test_nack_while_busy(self):
+        bus = SimulatedI2C(timing=TimingModel(nvm_program_time=0.01),
+                           nack_while_busy=True)
+        b = I2CBuilder(0x18, bus)
+        b.use_nvm().write_register(0x07, 0x10).execute()
+        with self.assertRaises(OSError):
+            b.use_srb().poll(Constants.RegAddrInterruptState1)
+        bus.tick(0.01)
+        self.assertEqual(b.poll(Constants.RegAddrInterruptState1), 0)
+
+    def test_builder_waits_out_program_cycle(self):
+        # With nvm_program_time the builder holds its next transaction
+        # instead of running into a busy device
+        bus = SimulatedI2C(timing=TimingModel(nvm_program_time=0.01),
+                           nack_while_busy=True)
+        b = I2CBuilder(0x18, bus, nvm_program_time=0.01)
+        b.use_nvm().write_register(0x07, 0x10).execute()
+        self.assertAlmostEqual(b.busy_until, bus.now + 0.01)
+        self.assertEqual(b.use_srb().poll(Constants.RegAddrInterruptState1),
+                         0)
+        self.assertEqual(b.busy_until, 0.0)
+        self.assertGreater(bus.wait_time, 0.0)
+        self.assertEqual(bus.monotonic(), bus.now)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import mmap
+import tempfile
+import unittest
+from ips2200 import I2CBuilder, Constants
+from ips2200.simulator import IPS2200Simulator, SimulatedI2C
+from ips2200.snapshot import (Snapshot, SNAPSHOT_SIZE, pack, restore,
+                              snapshot)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.device = IPS2200Simulator(0x18)
+        self.bus = SimulatedI2C(self.device)
+        self.builder = I2CBuilder(0x18, self.bus)
+
+    def test_capture(self):
+        self.device.poke(0x07, 0x12)
+        self.device.poke(Constants.RegAddrInterruptState1, 0x3)
+        snap = snapshot(self.builder)
+        self.assertEqual(len(bytes(snap)), SNAPSHOT_SIZE)
+        self.assertEqual(snap.device_address, 0x18)
+        self.assertEqual(snap.value(0x00), 0x323)
+        self.assertEqual(snap.value(0x07), 0x12)
+        self.assertEqual(snap.value(0x27), 0xbe)
+        self.assertEqual(snap.value(Constants.RegAddrInterruptState1), 0x3)
+        # Write-only and unmapped registers are not captured
+        self.assertIsNone(snap.value(Constants.RegAddrInterruptClear1))
+        self.assertIsNone(snap.value(0x3f))
+        # One block read per space
+        self.assertEqual(self.bus.reads, 2)
+
+    def test_round_trip(self):
+        snap = snapshot(self.builder)
+        copy = Snapshot(bytes(snap))
+        self.assertEqual(copy, snap)
+        self.assertEqual(copy.registers(), snap.registers())
+        self.assertEqual(pack(0x18, {0x00: 0x323}),
+                         bytes(Snapshot(pack(0x18, {0x00: 0x323}))))
+
+    def test_rejects_bad_blobs(self):
+        blob = bytearray(bytes(snapshot(self.builder)))
+        with self.assertRaises(ValueError):
+            Snapshot(blob[:-1])
+        blob[10] ^= 0xff
+        with self.assertRaises(ValueError):
+            Snapshot(blob)
+        with self.assertRaises(ValueError):
+            Snapshot(b'XXXX' + bytes(blob[4:]))
+        with self.assertRaises(ValueError):
+            pack(0x18, {0x40: 1})
+
+    def test_diff(self):
+        before = snapshot(self.builder)
+        self.builder.set_output_mode(Constants.OutputModeQuadABN).execute()
+        after = snapshot(self.builder)
+        self.assertEqual(after.diff(before), {0x20: (0x323, 0x32b)})
+        self.assertEqual(after.diff(after), {})
+
+    def test_memory_mapped(self):
+        snaps = [bytes(snapshot(I2CBuilder(0x18, SimulatedI2C(
+            IPS2200Simulator(0x18, {0x07: value})))))
+            for value in (0x10, 0x20, 0x30)]
+        with tempfile.TemporaryFile() as f:
+            f.write(b''.join(snaps))
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                data = memoryview(view)
+                snap = Snapshot(data[SNAPSHOT_SIZE:2 * SNAPSHOT_SIZE])
+                self.assertEqual(snap.value(0x07), 0x20)
+                del snap
+                data.release()
+
+    def test_restore_writes_only_differences(self):
+        snap = snapshot(self.builder)
+        self.builder.use_nvm().set_tx_current_calib(0x12).execute()
+        self.builder.use_srb().set_quad_mode(Constants.On).execute()
+        self.bus.reset_counters()
+        self.device.busy_until = 0.0
+
+        changes = restore(self.builder, bytes(snap))
+        self.assertEqual(changes, [(0x07, 0x12, 0xbe), (0x21, 0x121, 0x101)])
+        self.assertEqual(self.bus.writes, 2)
+        self.assertEqual(snapshot(self.builder), snap)
+
+        self.bus.reset_counters()
+        self.device.busy_until = 0.0
+        self.assertEqual(restore(self.builder, snap), [])
+        self.assertEqual(self.bus.writes, 0)
+
+    def test_clone_keeps_address(self):
+        source = IPS2200Simulator(0x18, {0x00: 0x32b, 0x07: 0x12})
+        snap = snapshot(I2CBuilder(0x18, SimulatedI2C(source)))
+
+        target = IPS2200Simulator(0x19, {0x00: 0x333, 0x07: 0xbe})
+        bus = SimulatedI2C(target)
+        restore(I2CBuilder(0x19, bus), snap)
+        self.assertEqual(target.address, 0x19)
+        self.assertEqual(target.peek(0x00), 0x33b)
+        self.assertEqual(target.peek(0x20), 0x33b)
+        self.assertEqual(target.peek(0x07), 0x12)
+
+
+if __name__ == '__main__':
+    unittest.main()
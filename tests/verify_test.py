@@ -0,0 +1,132 @@
+import unittest
+from ips2200 import (I2CBuilder, Constants, CACHE_WRITE_BACK,
+                     CACHE_WRITE_THROUGH)
+from ips2200.simulator import SimulatedI2C
+from ips2200.verify import VerifyReport, execute_verified
+
+
+class NoisyI2C(SimulatedI2C):
+    # Simulated bus that fails chosen transactions (counted from 1) and can
+    # corrupt the next writes to a wire address
+    def __init__(self, failing=(), corrupt=None):
+        super().__init__()
+        self.failing = set(failing)
+        # {wire: number of writes to corrupt}
+        self.corrupt = dict(corrupt or {})
+        self.count = 0
+        self.slept = []
+
+    def _fail(self):
+        self.count += 1
+        if (self.count in self.failing):
+            raise OSError('Arbitration lost')
+
+    def write_readinto(self, out_buffer, in_buffer):
+        self._fail()
+        super().write_readinto(out_buffer, in_buffer)
+
+    def write(self, addr, value):
+        self._fail()
+        if (self.corrupt.get(addr)):
+            self.corrupt[addr] -= 1
+            value = [value[0] ^ 0x20, value[1]]
+        super().write(addr, value)
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        super().sleep(seconds)
+
+
+class TestVerify(unittest.TestCase):
+    def queue(self, builder):
+        builder.set_output_mode(Constants.OutputModeQuadABN)
+        builder.set_quad_mode(Constants.On)
+        builder.write_register(Constants.RegAddrTXCurrentCalib, 0x12)
+        builder.read_register(Constants.RegAddrR1R2Gain)
+        return builder
+
+    def test_clean_bus(self):
+        bus = NoisyI2C()
+        b = self.queue(I2CBuilder(0x18, bus))
+        report = execute_verified(b)
+        self.assertIsInstance(report, VerifyReport)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.results, 0x56)
+        self.assertEqual(report.replays, 0)
+        self.assertEqual(b.operations, [])
+        # 2 RMW, 1 write, 1 read and the readback of 0x20 - 0x21 and 0x27
+        self.assertEqual(bus.transactions, 8)
+        self.assertEqual(bus.device(0x18).peek(0x20), 0x32b)
+        self.assertEqual(bus.device(0x18).peek(0x21), 0x121)
+        self.assertEqual(bus.device(0x18).peek(0x27), 0x12)
+
+    def test_replays_failed_operations(self):
+        # The first RMW read fails, then the write of 0x27 fails
+        bus = NoisyI2C(failing=(1, 5))
+        b = self.queue(I2CBuilder(0x18, bus))
+        report = execute_verified(b)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.replays, 1)
+        self.assertEqual(report.results, 0x56)
+        self.assertEqual(bus.device(0x18).peek(0x20), 0x32b)
+        self.assertEqual(bus.device(0x18).peek(0x27), 0x12)
+
+    def test_rewrites_registers_that_read_back_wrong(self):
+        bus = NoisyI2C(corrupt={0xe7: 2})
+        b = self.queue(I2CBuilder(0x18, bus))
+        report = execute_verified(b, backoff=0.001)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.replays, 2)
+        self.assertEqual(bus.slept, [0.001, 0.002])
+        self.assertEqual(bus.device(0x18).peek(0x27), 0x12)
+        self.assertEqual(b.shadow.get(0xe7), 0x12)
+
+    def test_reports_and_keeps_persistent_failures(self):
+        bus = NoisyI2C(corrupt={0xe7: 100})
+        b = self.queue(I2CBuilder(0x18, bus))
+        report = execute_verified(b, retries=2)
+        self.assertFalse(report.ok)
+        self.assertEqual(report.replays, 2)
+        self.assertEqual(len(report.failures), 1)
+        failure = report.failures[0]
+        self.assertEqual((failure.addr, failure.expected, failure.actual),
+                         (0x27, 0x12, 0x13))
+        # The rest of the batch went through
+        self.assertEqual(report.results, 0x56)
+        self.assertEqual(bus.device(0x18).peek(0x20), 0x32b)
+        # Only the failed operation stays queued
+        self.assertEqual(b.operations, [(1, 0xe7, 0x12)])
+        self.assertIsNone(b.shadow.get(0xe7))
+
+    def test_shadow_keeps_only_confirmed_values(self):
+        bus = NoisyI2C()
+        b = I2CBuilder(0x18, bus, cache_policy=CACHE_WRITE_BACK)
+        b.write_register(Constants.RegAddrTXCurrentCalib, 0x12)
+        self.assertTrue(b.execute_verified().ok)
+        # Written at once, not left dirty for a flush
+        self.assertEqual(bus.device(0x18).peek(0x27), 0x12)
+        self.assertEqual(b.shadow.get(0xe7), 0x12)
+        self.assertFalse(b.shadow.is_dirty(0xe7))
+
+        # A write that raised may have reached the device
+        b.set_cache_policy(CACHE_WRITE_THROUGH)
+        bus.failing = set(range(bus.count + 1, bus.count + 100))
+        b.write_register(Constants.RegAddrTXCurrentCalib, 0x34)
+        report = b.execute_verified(retries=0)
+        self.assertEqual(report.failures[0].addr, 0x27)
+        self.assertIsNone(b.shadow.get(0xe7))
+
+    def test_failed_reads(self):
+        bus = NoisyI2C(failing=range(1, 100))
+        b = I2CBuilder(0x18, bus)
+        b.read_block(0x00, 2)
+        b.read_register(0x07)
+        report = execute_verified(b, retries=1, backoff=0.0)
+        self.assertEqual(report.results, [None, None, None])
+        self.assertEqual([f.addr for f in report.failures], [0x20, 0x21, 0x27])
+        self.assertIsInstance(report.failures[0].error, OSError)
+        self.assertEqual(len(b.operations), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()